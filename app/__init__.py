@@ -46,7 +46,11 @@ def seed_data(app):
             db.session.commit()
             print("Filières ajoutées.")
 
-def create_app():
+def create_app(socketio_write_only=False):
+    """
+    Crée l'application. `socketio_write_only` : le processus publie ses événements Socket.IO sur le bus
+    sans servir de clients (worker des tâches de fond).
+    """
     app = Flask(__name__)
     app.config.from_object(Config) # Charge les configurations depuis config.py
 
@@ -54,18 +58,31 @@ def create_app():
     db.init_app(app)
     mail.init_app(app)
     login_manager.init_app(app)
-    socketio.init_app(app)
+    # Avec un bus de messages, chaque emit atteint les clients connectés à tous les processus
+    message_queue = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    if message_queue:
+        from app.backplane import client_manager
+        socketio.init_app(app, client_manager=client_manager(message_queue, app.config['SOCKETIO_CHANNEL'], socketio_write_only))
+    else:
+        if socketio_write_only:
+            # Sans bus, les événements et invalidations de cache publiés par ce processus ne sortent pas de lui
+            app.logger.warning(
+                "SOCKETIO_MESSAGE_QUEUE n'est pas défini : les notifications en temps réel et les invalidations "
+                "de cache émises par ce processus n'atteindront pas le serveur web."
+            )
+        socketio.init_app(app)
 
     @app.before_request
     def before_request_callback():
         """
-        Met à jour le champ 'last_seen' de l'utilisateur avant chaque requête.
+        Enregistre un signe de vie de l'utilisateur (en mémoire) ; last_seen est reporté en base par lots,
+        au plus une fois par intervalle (voir app/presence.py).
         """
         from flask_login import current_user
-        from datetime import datetime
+        from app.presence import heartbeat, flush_last_seen
         if current_user.is_authenticated:
-            current_user.last_seen = datetime.utcnow()
-            db.session.commit()
+            heartbeat(current_user.id)
+            flush_last_seen()
 
     # Importation et enregistrement des Blueprints (si vous en utilisez, sinon les routes directes)
     from app.routes import main_bp
@@ -76,5 +93,7 @@ def create_app():
     with app.app_context():
         db.create_all() # Crée toutes les tables définies dans models.py
         seed_data(app) # Appelle la fonction pour remplir les données
+        from app.availability import compile_missing_masks
+        compile_missing_masks() # Masques de disponibilité des enseignants pas encore compilés
 
     return app, socketio
@@ -0,0 +1,182 @@
+# app/availability.py
+# Disponibilités des enseignants compilées en masques hebdomadaires (un bit par quart d'heure)
+# pour vérifier en temps constant qu'un créneau respecte les disponibilités déclarées.
+from datetime import datetime
+from app import db
+from app.models import Cours, DisponibiliteEnseignant, MasqueDisponibilite
+from app.conflicts import to_minutes
+
+JOURS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi']
+PAS_MINUTES = 15
+CRENEAUX_PAR_JOUR = 24 * 60 // PAS_MINUTES
+TAILLE_MASQUE = (len(JOURS) * CRENEAUX_PAR_JOUR + 7) // 8 # en octets
+
+
+def _bits(jour, debut, fin, complet):
+    """Bits de l'intervalle [debut, fin[ (en minutes depuis minuit) le jour donné, arrondi selon `complet`."""
+    if complet:
+        premier, dernier = -(-debut // PAS_MINUTES), fin // PAS_MINUTES
+    else:
+        premier, dernier = debut // PAS_MINUTES, -(-fin // PAS_MINUTES)
+    if dernier <= premier:
+        return 0
+    return ((1 << (dernier - premier)) - 1) << (jour * CRENEAUX_PAR_JOUR + premier)
+
+
+def week_mask(jour, heure_debut, heure_fin, complet):
+    """
+    Bits du créneau [heure_debut, heure_fin[ le jour donné (0 = lundi) dans le masque hebdomadaire.
+    complet=True : seuls les quarts d'heure entièrement couverts ;
+    complet=False : tous les quarts d'heure touchés.
+    """
+    return _bits(jour, to_minutes(heure_debut), to_minutes(heure_fin), complet)
+
+
+def merge_intervals(disponibilites):
+    """
+    Regroupe des disponibilités (jour_semaine, heure_debut, heure_fin) par jour (0 = lundi) en intervalles
+    en minutes, triés, ceux qui se chevauchent ou se touchent étant fusionnés : {jour: [(debut, fin), ...]}.
+    """
+    par_jour = {}
+    for jour_semaine, heure_debut, heure_fin in disponibilites:
+        par_jour.setdefault(JOURS.index(jour_semaine), []).append((to_minutes(heure_debut), to_minutes(heure_fin)))
+    fusionnes = {}
+    for jour, intervalles in par_jour.items():
+        resultat = []
+        for debut, fin in sorted(intervalles):
+            if resultat and debut <= resultat[-1][1]:
+                resultat[-1] = (resultat[-1][0], max(resultat[-1][1], fin))
+            else:
+                resultat.append((debut, fin))
+        fusionnes[jour] = resultat
+    return fusionnes
+
+
+def compile_mask(disponibilites):
+    """
+    Compile des disponibilités (jour_semaine, heure_debut, heure_fin) en un masque hebdomadaire :
+    les quarts d'heure entièrement couverts par une disponibilité (après fusion des disponibilités contiguës).
+    """
+    masque = 0
+    for jour, intervalles in merge_intervals(disponibilites).items():
+        for debut, fin in intervalles:
+            masque |= _bits(jour, debut, fin, complet=True)
+    return masque
+
+
+def refresh_teacher_mask(enseignant_id):
+    """
+    Recalcule le masque d'un enseignant à partir de ses disponibilités (à appeler avant le commit).
+    Sans aucune disponibilité déclarée, le masque est supprimé : l'enseignant n'est alors pas contraint.
+    """
+    lignes = db.session.query(
+        DisponibiliteEnseignant.jour_semaine, DisponibiliteEnseignant.heure_debut, DisponibiliteEnseignant.heure_fin
+    ).filter(DisponibiliteEnseignant.enseignant_id == enseignant_id).all()
+    existant = db.session.get(MasqueDisponibilite, enseignant_id)
+    if not lignes:
+        if existant:
+            db.session.delete(existant)
+        return None
+
+    masque = compile_mask(lignes)
+    if existant is None:
+        existant = MasqueDisponibilite(enseignant_id=enseignant_id)
+        db.session.add(existant)
+    existant.masque = masque.to_bytes(TAILLE_MASQUE, 'big')
+    return masque
+
+
+def compile_missing_masks():
+    """Compile les masques des enseignants qui ont des disponibilités mais pas encore de masque."""
+    manquants = db.session.query(DisponibiliteEnseignant.enseignant_id).outerjoin(
+        MasqueDisponibilite, MasqueDisponibilite.enseignant_id == DisponibiliteEnseignant.enseignant_id
+    ).filter(MasqueDisponibilite.enseignant_id == None).distinct().all()
+    for (enseignant_id,) in manquants:
+        refresh_teacher_mask(enseignant_id)
+    if manquants:
+        db.session.commit()
+
+
+def load_masks(enseignant_ids=None):
+    """Retourne {enseignant_id: masque} en une requête (tous les enseignants si enseignant_ids est None)."""
+    query = db.session.query(MasqueDisponibilite.enseignant_id, MasqueDisponibilite.masque)
+    if enseignant_ids is not None:
+        query = query.filter(MasqueDisponibilite.enseignant_id.in_(set(enseignant_ids)))
+    return {enseignant_id: int.from_bytes(masque, 'big') for enseignant_id, masque in query}
+
+
+def _load_rows(enseignant_ids):
+    """{enseignant_id: [(jour_semaine, heure_debut, heure_fin), ...]} en une requête."""
+    lignes = {}
+    for enseignant_id, jour_semaine, heure_debut, heure_fin in db.session.query(
+        DisponibiliteEnseignant.enseignant_id, DisponibiliteEnseignant.jour_semaine,
+        DisponibiliteEnseignant.heure_debut, DisponibiliteEnseignant.heure_fin
+    ).filter(DisponibiliteEnseignant.enseignant_id.in_(set(enseignant_ids))):
+        lignes.setdefault(enseignant_id, []).append((jour_semaine, heure_debut, heure_fin))
+    return lignes
+
+
+def fits_mask(masque, date_cours, heure_debut, heure_fin):
+    """
+    Vérifie un créneau avec le masque. Le masque ne contient que des quarts d'heure entièrement disponibles :
+    - True si tous les quarts d'heure touchés par le cours y sont (None : enseignant sans contrainte) ;
+    - False s'il manque un quart d'heure entièrement couvert par le cours ;
+    - None si seuls les quarts d'heure partiellement couverts aux bords du cours manquent :
+      il faut alors comparer à la minute près avec les disponibilités (fits_intervals).
+    """
+    if masque is None:
+        return True
+    jour = date_cours.weekday()
+    if jour >= len(JOURS):
+        return False
+    touches = week_mask(jour, heure_debut, heure_fin, complet=False)
+    if masque & touches == touches:
+        return True
+    couverts = week_mask(jour, heure_debut, heure_fin, complet=True)
+    if masque & couverts != couverts:
+        return False
+    return None
+
+
+def fits_intervals(disponibilites, date_cours, heure_debut, heure_fin):
+    """Vérification à la minute près : le créneau est-il inclus dans une disponibilité (fusionnée) du jour ?"""
+    debut, fin = to_minutes(heure_debut), to_minutes(heure_fin)
+    intervalles = merge_intervals(disponibilites).get(date_cours.weekday(), [])
+    return any(d <= debut and fin <= f for d, f in intervalles)
+
+
+def is_available(enseignant_id, date_cours, heure_debut, heure_fin):
+    """
+    Vérifie un créneau pour un enseignant : une lecture par clé primaire, puis un test de bits ;
+    les disponibilités ne sont relues que si un bord du cours tombe au milieu d'un quart d'heure non couvert.
+    """
+    ligne = db.session.get(MasqueDisponibilite, int(enseignant_id))
+    masque = int.from_bytes(ligne.masque, 'big') if ligne else None
+    verdict = fits_mask(masque, date_cours, heure_debut, heure_fin)
+    if verdict is None:
+        lignes = _load_rows([int(enseignant_id)]).get(int(enseignant_id), [])
+        return fits_intervals(lignes, date_cours, heure_debut, heure_fin)
+    return verdict
+
+
+def find_availability_violations(depuis=None):
+    """
+    Cours (à partir de `depuis`, aujourd'hui par défaut) placés hors des disponibilités déclarées
+    de leur enseignant, pour tous les enseignants : une requête pour les masques, une pour les cours,
+    et une pour les disponibilités des enseignants dont un cours n'a pu être tranché qu'à la minute près.
+    """
+    depuis = depuis or datetime.utcnow().date()
+    masques = load_masks()
+    if not masques:
+        return []
+    cours = Cours.query.options(
+        db.joinedload(Cours.matiere_obj), db.joinedload(Cours.enseignant_obj), db.joinedload(Cours.salle_obj)
+    ).filter(Cours.enseignant_id.in_(masques), Cours.date_cours >= depuis)\
+        .order_by(Cours.date_cours, Cours.heure_debut).all()
+    verdicts = [(c, fits_mask(masques[c.enseignant_id], c.date_cours, c.heure_debut, c.heure_fin)) for c in cours]
+    a_preciser = {c.enseignant_id for c, verdict in verdicts if verdict is None}
+    lignes = _load_rows(a_preciser) if a_preciser else {}
+    return [
+        c for c, verdict in verdicts
+        if verdict is False or (verdict is None and not fits_intervals(lignes.get(c.enseignant_id, []), c.date_cours, c.heure_debut, c.heure_fin))
+    ]
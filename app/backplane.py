@@ -0,0 +1,179 @@
+# app/backplane.py
+# Bus de messages Socket.IO entre les processus qui servent l'application (workers gunicorn, machines,
+# worker des tâches de fond) : chaque emit est publié sur le bus et relayé par chaque processus à ses
+# propres clients, si bien qu'un emit fait dans une route atteint un client connecté à n'importe quel worker.
+# Le bus est choisi par l'URL SOCKETIO_MESSAGE_QUEUE :
+#   redis://, rediss://   Redis (paquet redis)
+#   kafka://              Kafka (paquet kafka-python)
+#   zmq+tcp://            ZeroMQ, avec son broker (paquet pyzmq)
+#   local://hôte:port     relais TCP fourni ici, pour le développement et les essais sur une seule machine,
+#                         lancé à part :  python -m app.backplane [port]
+#   autres (amqp://...)   Kombu (paquet kombu)
+# Le même bus transporte les messages de l'application entre processus (publish / subscribe),
+# par exemple l'invalidation des caches tenus en mémoire par chaque processus.
+import json
+import pickle
+import socket
+import socketserver
+import sys
+import threading
+import time
+import socketio
+
+PORT_RELAIS = 6500
+DELAI_RECONNEXION = 1 # secondes entre deux tentatives de connexion au relais
+# Méthode des messages de l'application : inconnue de python-socketio, ils sont interceptés à la réception
+METHODE_APPLICATION = 'application'
+
+_abonnements = {} # sujet -> fonctions appelées à la réception d'un message
+_gestionnaire = None # gestionnaire du bus de ce processus (None : pas de bus, un seul processus)
+
+
+class LocalRelay(socketserver.ThreadingTCPServer):
+    """Relais de développement : chaque ligne reçue d'un processus est renvoyée à tous les processus connectés."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, adresse):
+        super().__init__(adresse, _RelayHandler)
+        self.sorties = set()
+        self.verrou = threading.Lock()
+
+
+class _RelayHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        with self.server.verrou:
+            self.server.sorties.add(self.wfile)
+        try:
+            for ligne in self.rfile:
+                with self.server.verrou:
+                    for sortie in list(self.server.sorties):
+                        try:
+                            sortie.write(ligne)
+                            sortie.flush()
+                        except OSError:
+                            self.server.sorties.discard(sortie)
+        finally:
+            with self.server.verrou:
+                self.server.sorties.discard(self.wfile)
+
+
+class LocalManager(socketio.PubSubManager):
+    """Gestionnaire Socket.IO relié au relais local (URL local://hôte:port) : messages JSON, une ligne chacun."""
+    name = 'local'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        hote, _, port = url.split('://', 1)[1].rstrip('/').partition(':')
+        self.adresse = (hote or '127.0.0.1', int(port or PORT_RELAIS))
+        self._connexion = None
+        self._verrou = threading.Lock()
+
+    def _publish(self, data):
+        ligne = (json.dumps({'canal': self.channel, 'message': data}) + '\n').encode()
+        with self._verrou:
+            try:
+                if self._connexion is None:
+                    self._connexion = socket.create_connection(self.adresse)
+                self._connexion.sendall(ligne)
+            except OSError:
+                # Relais redémarré : une reconnexion, puis l'erreur remonte à l'appelant
+                self._connexion = socket.create_connection(self.adresse)
+                self._connexion.sendall(ligne)
+
+    def _listen(self):
+        # Connexion dédiée à la réception, rétablie indéfiniment si le relais s'arrête
+        while True:
+            try:
+                with socket.create_connection(self.adresse) as connexion, connexion.makefile('rb') as lignes:
+                    for ligne in lignes:
+                        paquet = json.loads(ligne)
+                        if paquet.get('canal') == self.channel:
+                            yield paquet['message']
+            except OSError:
+                self._get_logger().warning(f"Relais Socket.IO {self.adresse} injoignable, nouvelle tentative.")
+            time.sleep(DELAI_RECONNEXION)
+
+
+def _decode(message):
+    """Message reçu du bus sous forme de dictionnaire, quel que soit son encodage (comme python-socketio)."""
+    if isinstance(message, dict):
+        return message
+    if isinstance(message, bytes):
+        try:
+            return pickle.loads(message)
+        except Exception:
+            pass
+    try:
+        return json.loads(message)
+    except Exception:
+        return None
+
+
+class ApplicationMessages:
+    """
+    Ajouté à chaque gestionnaire : les messages de l'application publiés par les autres processus
+    sont passés aux fonctions abonnées, les autres poursuivent vers le traitement Socket.IO.
+    """
+
+    def _listen(self):
+        for message in super()._listen():
+            data = _decode(message)
+            if not isinstance(data, dict) or data.get('method') != METHODE_APPLICATION:
+                yield message
+                continue
+            if data.get('host_id') == self.host_id:
+                continue
+            for fonction in _abonnements.get(data.get('sujet'), ()):
+                try:
+                    fonction(data['contenu'])
+                except Exception:
+                    self._get_logger().exception(f"Échec du traitement d'un message « {data.get('sujet')} » du bus.")
+
+
+def subscribe(sujet):
+    """Décorateur : la fonction reçoit le contenu de chaque message `sujet` publié par un autre processus."""
+    def enregistrer(fonction):
+        _abonnements.setdefault(sujet, []).append(fonction)
+        return fonction
+    return enregistrer
+
+
+def publish(sujet, contenu):
+    """
+    Diffuse un message aux autres processus ; sans effet sans bus. `contenu` doit être sérialisable en JSON.
+    Un bus injoignable est signalé dans le journal sans faire échouer l'appelant.
+    """
+    if _gestionnaire is None:
+        return
+    try:
+        _gestionnaire._publish({'method': METHODE_APPLICATION, 'host_id': _gestionnaire.host_id, 'sujet': sujet, 'contenu': contenu})
+    except Exception:
+        _gestionnaire._get_logger().exception(f"Message « {sujet} » non diffusé sur le bus.")
+
+
+def client_manager(url, channel, write_only=False):
+    """
+    Gestionnaire Socket.IO correspondant à l'URL du bus. `write_only` : le processus publie sans écouter
+    (worker des tâches de fond, qui n'a pas de clients).
+    """
+    global _gestionnaire
+    if url.startswith(('redis://', 'rediss://')):
+        classe = socketio.RedisManager
+    elif url.startswith('kafka://'):
+        classe = socketio.KafkaManager
+    elif url.startswith('zmq'):
+        classe = socketio.ZmqManager
+    elif url.startswith('local://'):
+        classe = LocalManager
+    else:
+        classe = socketio.KombuManager
+    _gestionnaire = type(classe.__name__, (ApplicationMessages, classe), {})(url, channel=channel, write_only=write_only)
+    return _gestionnaire
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT_RELAIS
+    with LocalRelay(('127.0.0.1', port)) as relais:
+        print(f"Relais Socket.IO sur local://127.0.0.1:{port}")
+        relais.serve_forever()
@@ -0,0 +1,115 @@
+# app/calendar_feed.py
+# Flux iCalendar (.ics) d'abonnement : emploi du temps d'un étudiant (sa cohorte), d'un enseignant ou d'une salle.
+# Le flux est produit ligne à ligne par un générateur ; les validateurs HTTP viennent de schedule.feed_validators.
+from datetime import datetime, timedelta
+from flask import current_app
+from itsdangerous.url_safe import URLSafeSerializer
+from itsdangerous.exc import BadSignature
+from app import db
+from app.models import Cours, Salle, Utilisateur
+from app.schedule import projected_courses, cohort_filter
+
+# Période couverte par un flux, autour de la date du jour
+JOURS_PASSES = 30
+JOURS_FUTURS = 365
+FUSEAU_HORAIRE = 'Africa/Porto-Novo'
+LIGNES_PAR_LOT = 500
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='calendrier')
+
+
+def feed_token(type_flux, objet_id):
+    """Jeton signé (sans expiration) identifiant un flux : type_flux vaut 'utilisateur' ou 'salle'."""
+    return _serializer().dumps([type_flux, objet_id])
+
+
+def read_feed_token(jeton):
+    """Retourne (type_flux, objet_id), ou None si le jeton est invalide."""
+    try:
+        type_flux, objet_id = _serializer().loads(jeton)
+    except (BadSignature, ValueError, TypeError):
+        return None
+    return type_flux, objet_id
+
+
+def feed_scope(type_flux, objet_id):
+    """
+    Périmètre d'un flux : (clé de validation, condition SQL sur Cours, nom du calendrier), ou None.
+    Les étudiants d'une même cohorte partagent la même clé, donc le même ETag.
+    """
+    if type_flux == 'salle':
+        salle = db.session.get(Salle, objet_id)
+        if salle is None:
+            return None
+        return ('salle', salle.id), Cours.salle_id == salle.id, f"Salle {salle.nom_salle}"
+
+    utilisateur = db.session.get(Utilisateur, objet_id)
+    if utilisateur is None:
+        return None
+    if utilisateur.role == 'enseignant':
+        return ('enseignant', utilisateur.id), Cours.enseignant_id == utilisateur.id, f"Cours de {utilisateur.prenom} {utilisateur.nom}"
+    if utilisateur.role == 'etudiant' and utilisateur.filiere_id and utilisateur.niveau_id:
+        cle = ('cohorte', utilisateur.filiere_id, utilisateur.niveau_id, utilisateur.groupe_id)
+        return cle, cohort_filter(*cle[1:]), "Emploi du temps UniplanBJ"
+    return None
+
+
+def ics_escape(texte):
+    """Échappe un texte selon la RFC 5545 (antislash, point-virgule, virgule, retours à la ligne)."""
+    return (texte or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold(ligne):
+    """Replie une ligne de contenu à 75 octets (les lignes suivantes commencent par une espace)."""
+    morceaux, courant, taille = [], '', 0
+    for caractere in ligne:
+        octets = len(caractere.encode('utf-8'))
+        if taille + octets > 75:
+            morceaux.append(courant)
+            courant, taille = ' ', 1
+        courant += caractere
+        taille += octets
+    morceaux.append(courant)
+    return '\r\n'.join(morceaux) + '\r\n'
+
+
+def _horodatage(jour, heure):
+    return datetime.combine(jour, heure).strftime('%Y%m%dT%H%M%S')
+
+
+def generate_ics(filtre, nom_calendrier, genere_le):
+    """
+    Générateur du flux : l'en-tête, puis un VEVENT par cours lu par lots (yield_per),
+    sans construire le calendrier complet en mémoire.
+    """
+    yield fold('BEGIN:VCALENDAR')
+    yield fold('VERSION:2.0')
+    yield fold('PRODID:-//UniplanBJ//Emploi du temps//FR')
+    yield fold('CALSCALE:GREGORIAN')
+    yield fold(f'X-WR-CALNAME:{ics_escape(nom_calendrier)}')
+    yield fold(f'X-WR-TIMEZONE:{FUSEAU_HORAIRE}')
+
+    aujourd_hui = datetime.now().date()
+    cours = projected_courses().add_columns(Cours.description).filter(
+        filtre, Cours.date_cours.between(aujourd_hui - timedelta(days=JOURS_PASSES), aujourd_hui + timedelta(days=JOURS_FUTURS))
+    ).order_by(Cours.date_cours, Cours.heure_debut, Cours.id).yield_per(LIGNES_PAR_LOT)
+
+    dtstamp = genere_le.strftime('%Y%m%dT%H%M%SZ')
+    for c in cours:
+        description = f"Enseignant : {c.enseignant_prenom} {c.enseignant_nom}"
+        if c.description:
+            description += f"\n{c.description}"
+        yield ''.join((
+            fold('BEGIN:VEVENT'),
+            fold(f'UID:cours-{c.id}@uniplanbj'),
+            fold(f'DTSTAMP:{dtstamp}'),
+            fold(f'DTSTART:{_horodatage(c.date_cours, c.heure_debut)}'),
+            fold(f'DTEND:{_horodatage(c.date_cours, c.heure_fin)}'),
+            fold(f'SUMMARY:{ics_escape(c.nom_matiere)}'),
+            fold(f'LOCATION:{ics_escape(c.nom_salle)}'),
+            fold(f'DESCRIPTION:{ics_escape(description)}'),
+            fold('END:VEVENT'),
+        ))
+    yield fold('END:VCALENDAR')
@@ -14,4 +14,34 @@ class Config:
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')  # Votre adresse e-mail
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')  # Le mot de passe d'application de votre e-mail
-    MAIL_DEFAULT_SENDER = MAIL_USERNAME
\ No newline at end of file
+    MAIL_DEFAULT_SENDER = MAIL_USERNAME
+
+    # Solveur d'emploi du temps : nombre de résolutions lancées en parallèle (une par processus)
+    SOLVER_ESSAIS = int(os.environ.get('SOLVER_ESSAIS', 2))
+    SOLVER_BUDGET_MAX = 60 # secondes
+
+    # Bus de messages Socket.IO partagé (ex. redis://localhost:6379/0, ou local://127.0.0.1:6500 en développement,
+    # voir app/backplane.py) : indispensable dès que le serveur web tourne sur plusieurs workers ou machines,
+    # et pour que le worker des tâches de fond puisse pousser des événements aux clients
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'uniplanbj')
+
+    # Archivage des notifications : âge à partir duquel elles quittent la table notifications,
+    # et nombre de lignes déplacées par transaction
+    NOTIFICATIONS_ARCHIVE_JOURS = int(os.environ.get('NOTIFICATIONS_ARCHIVE_JOURS', 180))
+    NOTIFICATIONS_ARCHIVE_LOT = 1000
+
+    # Tâches de fond terminées : supprimées de la table taches au-delà de cet âge, par lots
+    # (les tâches échouées restent, pour être relancées depuis l'administration)
+    TACHES_CONSERVATION_JOURS = int(os.environ.get('TACHES_CONSERVATION_JOURS', 7))
+    TACHES_PURGE_LOT = 1000
+
+    # Modifications successives d'un même cours (ou d'une série) dans cet intervalle : une seule notification,
+    # envoyée à la fin avec l'état final
+    NOTIFICATIONS_REGROUPEMENT_SECONDES = int(os.environ.get('NOTIFICATIONS_REGROUPEMENT_SECONDES', 120))
+
+    # Import en masse des étudiants : comptes créés par tâche de fond, par lots de cette taille ;
+    # processus de hachage des mots de passe (0 : un par cœur) ; e-mails envoyés par connexion SMTP
+    IMPORT_ETUDIANTS_LOT = int(os.environ.get('IMPORT_ETUDIANTS_LOT', 500))
+    IMPORT_PROCESSUS_HACHAGE = int(os.environ.get('IMPORT_PROCESSUS_HACHAGE', 0)) or None
+    EMAILS_PAR_CONNEXION = 50
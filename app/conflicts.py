@@ -0,0 +1,217 @@
+# app/conflicts.py
+# Moteur de détection des conflits d'horaire (enseignant, salle, groupe).
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from sqlalchemy import or_, tuple_
+from app import db
+from app.models import Cours, CoursAffectation, Groupe
+
+# Un conflit détecté : le type de ressource, son ID et le cours déjà planifié qui la bloque.
+Conflit = namedtuple('Conflit', ['ressource', 'ressource_id', 'cours_id', 'date_cours', 'heure_debut', 'heure_fin'])
+
+# Public d'un cours : un groupe de TD/TP, ou toute une promotion (cours magistral) si groupe_id est None.
+Affectation = namedtuple('Affectation', ['groupe_id', 'filiere_id', 'niveau_id'])
+
+MESSAGES_CONFLIT = {
+    'enseignant': "L'enseignant est déjà occupé à ce créneau",
+    'salle': "La salle est déjà occupée à ce créneau",
+    'groupe': "Un des groupes sélectionnés a déjà cours à ce créneau",
+    'promo': "La promotion (filière et niveau) a déjà un cours commun à ce créneau",
+    'promo_groupes': "Un groupe de la promotion a déjà cours à ce créneau",
+}
+
+
+def to_minutes(heure):
+    """Convertit un objet time en nombre de minutes depuis minuit."""
+    return heure.hour * 60 + heure.minute
+
+
+def format_conflict(conflit):
+    """Retourne un message lisible pour un conflit, utilisable dans un flash."""
+    return f"Conflit d'horaire le {conflit.date_cours.strftime('%d/%m/%Y')} : {MESSAGES_CONFLIT[conflit.ressource]} ({conflit.heure_debut.strftime('%Hh%M')} - {conflit.heure_fin.strftime('%Hh%M')})."
+
+
+class IntervalList:
+    """
+    Liste d'intervalles [debut, fin[ triée par début pour une ressource et une date.
+    Le maximum cumulé des fins permet d'arrêter le parcours dès qu'aucun intervalle
+    antérieur ne peut plus chevaucher le créneau recherché.
+    """
+
+    def __init__(self):
+        self._intervalles = []  # (debut, fin, cours_id) triés
+        self._fin_max = []  # fin maximale sur intervalles[0..i]
+
+    def __len__(self):
+        return len(self._intervalles)
+
+    def add(self, debut, fin, cours_id):
+        intervalle = (debut, fin, cours_id)
+        insort(self._intervalles, intervalle)
+        position = bisect_left(self._intervalles, intervalle)
+        self._rebuild_from(position)
+
+    def remove(self, cours_id):
+        avant = len(self._intervalles)
+        self._intervalles = [iv for iv in self._intervalles if iv[2] != cours_id]
+        if len(self._intervalles) != avant:
+            self._rebuild_from(0)
+
+    def _rebuild_from(self, position):
+        del self._fin_max[position:]
+        courant = self._fin_max[-1] if self._fin_max else -1
+        for _, fin, _ in self._intervalles[position:]:
+            courant = max(courant, fin)
+            self._fin_max.append(courant)
+
+    def overlapping(self, debut, fin, exclude=None):
+        """Retourne les IDs de cours dont l'intervalle chevauche [debut, fin[."""
+        # Seuls les intervalles qui commencent avant `fin` peuvent chevaucher
+        i = bisect_left(self._intervalles, (fin,)) - 1
+        resultats = []
+        while i >= 0 and self._fin_max[i] > debut:
+            iv_debut, iv_fin, cours_id = self._intervalles[i]
+            if iv_fin > debut and cours_id != exclude:
+                resultats.append((cours_id, iv_debut, iv_fin))
+            i -= 1
+        return resultats
+
+
+class ConflictIndex:
+    """
+    Index des créneaux occupés, par ressource et par jour.
+    Les clés de ressource sont des tuples : ('enseignant', id), ('salle', id), ('groupe', id),
+    ('promo', filiere_id, niveau_id) pour un cours commun à toute une promotion et
+    ('promo_groupes', filiere_id, niveau_id) pour un cours d'un de ses groupes (voir occupied_keys).
+    """
+
+    def __init__(self):
+        self._index = defaultdict(IntervalList)
+        self._cours = {}  # cours_id -> (date, debut, fin, clés)
+
+    def __len__(self):
+        return len(self._cours)
+
+    def add(self, cours_id, date_cours, heure_debut, heure_fin, cles):
+        debut, fin = to_minutes(heure_debut), to_minutes(heure_fin)
+        deja = self._cours.get(cours_id)
+        nouvelles = [cle for cle in cles if not deja or cle not in deja[3]]
+        for cle in nouvelles:
+            self._index[(cle, date_cours)].add(debut, fin, cours_id)
+        cles_totales = (deja[3] if deja else ()) + tuple(nouvelles)
+        self._cours[cours_id] = (date_cours, heure_debut, heure_fin, cles_totales)
+
+    def remove(self, cours_id):
+        deja = self._cours.pop(cours_id, None)
+        if deja:
+            for cle in deja[3]:
+                self._index[(cle, deja[0])].remove(cours_id)
+
+    def find(self, date_cours, heure_debut, heure_fin, cles, exclude=None):
+        """Retourne la liste de tous les conflits pour un créneau et un ensemble de ressources."""
+        debut, fin = to_minutes(heure_debut), to_minutes(heure_fin)
+        conflits = []
+        for cle in cles:
+            intervalles = self._index.get((cle, date_cours))
+            if not intervalles:
+                continue
+            for cours_id, _, _ in intervalles.overlapping(debut, fin, exclude=exclude):
+                _, cours_debut, cours_fin, _ = self._cours[cours_id]
+                ressource_id = cle[1] if len(cle) == 2 else cle[1:]
+                conflits.append(Conflit(cle[0], ressource_id, cours_id, date_cours, cours_debut, cours_fin))
+        return conflits
+
+    @classmethod
+    def load(cls, date_debut, date_fin, enseignant_ids=(), salle_ids=(), affectations=()):
+        """
+        Construit un index à partir des cours existants entre deux dates, en une seule requête.
+        Seuls les cours qui touchent l'une des ressources fournies sont chargés ; pour les groupes,
+        ce sont tous les cours de leurs promotions (cours communs et cours des autres groupes).
+        """
+        index = cls()
+        promotions = {(a.filiere_id, a.niveau_id) for a in affectations}
+        for row in load_occupied_slots(date_debut, date_fin, enseignant_ids, salle_ids, promotions):
+            affectation = Affectation(row.groupe_id, row.filiere_id, row.niveau_id)
+            index.add(row.id, row.date_cours, row.heure_debut, row.heure_fin, occupied_keys(row.enseignant_id, row.salle_id, [affectation]))
+        return index
+
+
+def resolve_groups(groupes_ids):
+    """Retourne les affectations (groupe, filière, niveau) des groupes donnés, en une requête."""
+    groupes_ids = {int(g) for g in groupes_ids}
+    if not groupes_ids:
+        return []
+    lignes = db.session.query(Groupe.id, Groupe.filiere_id, Groupe.niveau_id).filter(Groupe.id.in_(groupes_ids)).order_by(Groupe.id)
+    return [Affectation(*ligne) for ligne in lignes]
+
+
+def load_occupied_slots(date_debut, date_fin, enseignant_ids=(), salle_ids=(), promotions=()):
+    """
+    Charge en une requête les créneaux occupés (une ligne par affectation) entre deux dates
+    pour les enseignants, les salles et les promotions (filiere_id, niveau_id) fournis.
+    Un filtre par promotion couvre à la fois ses cours communs et les cours de chacun de ses groupes.
+    """
+    filtres_ressources = []
+    if enseignant_ids:
+        filtres_ressources.append(Cours.enseignant_id.in_(set(enseignant_ids)))
+    if salle_ids:
+        filtres_ressources.append(Cours.salle_id.in_(set(salle_ids)))
+    if promotions:
+        filtres_ressources.append(tuple_(CoursAffectation.filiere_id, CoursAffectation.niveau_id).in_(set(promotions)))
+    if not filtres_ressources:
+        return []
+
+    return db.session.query(
+        Cours.id, Cours.enseignant_id, Cours.salle_id,
+        Cours.date_cours, Cours.heure_debut, Cours.heure_fin,
+        CoursAffectation.groupe_id, CoursAffectation.filiere_id, CoursAffectation.niveau_id
+    ).outerjoin(CoursAffectation, CoursAffectation.cours_id == Cours.id)\
+    .filter(Cours.date_cours.between(date_debut, date_fin), or_(*filtres_ressources))\
+    .all()
+
+
+def occupied_keys(enseignant_id, salle_id, affectations=()):
+    """
+    Clés de ressource bloquées par un cours existant.
+    Un cours de groupe bloque le groupe et signale la promotion comme partiellement occupée ;
+    un cours commun (groupe_id NULL) bloque la promotion entière.
+    """
+    cles = [('enseignant', int(enseignant_id)), ('salle', int(salle_id))]
+    for a in affectations:
+        if a.groupe_id:
+            cles.append(('groupe', int(a.groupe_id)))
+            if a.filiere_id and a.niveau_id:
+                cles.append(('promo_groupes', int(a.filiere_id), int(a.niveau_id)))
+        elif a.filiere_id and a.niveau_id:
+            cles.append(('promo', int(a.filiere_id), int(a.niveau_id)))
+    return cles
+
+
+def resource_keys(enseignant_id, salle_id, affectations=()):
+    """
+    Clés à rechercher dans l'index pour un nouveau créneau.
+    Un groupe est en conflit avec ses propres cours et avec les cours communs de sa promotion ;
+    un cours commun est en conflit avec tout cours de la promotion, commun ou de groupe.
+    """
+    cles = [('enseignant', int(enseignant_id)), ('salle', int(salle_id))]
+    for a in affectations:
+        promo = (int(a.filiere_id), int(a.niveau_id))
+        if a.groupe_id:
+            cles.extend([('groupe', int(a.groupe_id)), ('promo',) + promo])
+        else:
+            cles.extend([('promo',) + promo, ('promo_groupes',) + promo])
+    return list(dict.fromkeys(cles))
+
+
+def find_conflicts(date_cours, heure_debut, heure_fin, enseignant_id, salle_id, affectations=(), exclude_cours_id=None):
+    """
+    Vérifie en une passe les conflits enseignant, salle et groupes/promotions pour un créneau.
+    `affectations` : liste d'Affectation (voir resolve_groups).
+    Retourne tous les conflits trouvés (liste vide si le créneau est libre).
+    """
+    index = ConflictIndex.load(
+        date_cours, date_cours,
+        enseignant_ids=[int(enseignant_id)], salle_ids=[int(salle_id)], affectations=affectations
+    )
+    cles = resource_keys(enseignant_id, salle_id, affectations)
+    return index.find(date_cours, heure_debut, heure_fin, cles, exclude=exclude_cours_id)
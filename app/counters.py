@@ -0,0 +1,92 @@
+# app/counters.py
+# Compteurs de non-lus par utilisateur (table compteurs_non_lus) : incrémentés à l'envoi d'un message
+# ou d'une notification, décrémentés à la lecture. Une ligne absente (nouvel utilisateur, compteur invalidé
+# après une modification difficile à reporter) est recalculée à la première lecture.
+# Les fonctions de mise à jour ne valident pas la transaction : elles suivent celle de la modification.
+from sqlalchemy import select, insert, update, delete, literal, or_, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Utilisateur, CompteurNonLus, Notification, Message, Conversation
+
+
+def unread_counters(user):
+    """
+    (notifications non lues, messages non lus) : une lecture par clé primaire, un recalcul si la ligne manque.
+    La ligne manquante est recalculée et enregistrée par un seul INSERT ... SELECT, dans une transaction courte
+    validée à part (hors de celle de l'appelant, qui peut être en lecture seule ou déjà validée) :
+    une mise à jour concurrente (add_*) attend cette ligne au lieu de se perdre entre le calcul et l'insertion.
+    """
+    compteur = db.session.get(CompteurNonLus, user.id)
+    if compteur is not None:
+        return compteur.notifications, compteur.messages
+    from app.notifications import unread_condition # app.notifications met à jour les compteurs : import différé
+    notifications = select(func.count(Notification.id)).where(unread_condition(user)).scalar_subquery()
+    messages = select(func.count(Message.id)).join(Conversation, Conversation.id == Message.conversation_id).where(
+        or_(Conversation.participant1_id == user.id, Conversation.participant2_id == user.id),
+        Message.sender_id != user.id, Message.is_read == False
+    ).scalar_subquery()
+    table = CompteurNonLus.__table__
+    with db.engine.begin() as connexion:
+        try:
+            with connexion.begin_nested():
+                connexion.execute(insert(table).from_select(
+                    ['utilisateur_id', 'notifications', 'messages'], select(literal(user.id), notifications, messages)
+                ))
+        except IntegrityError:
+            # Une autre requête vient d'enregistrer la ligne : elle est relue
+            pass
+        ligne = connexion.execute(select(table.c.notifications, table.c.messages).where(table.c.utilisateur_id == user.id)).first()
+    if ligne is None:
+        # Ligne supprimée entre-temps (invalidate_counters) : valeurs exactes, recalculées à la lecture suivante
+        from app.notifications import unread_count
+        return unread_count(user), user.new_messages_count()
+    return tuple(ligne)
+
+
+def _add(colonne, user_ids, nombre):
+    if isinstance(user_ids, int):
+        condition = CompteurNonLus.utilisateur_id == user_ids
+    else:
+        condition = CompteurNonLus.utilisateur_id.in_(user_ids)
+    db.session.execute(update(CompteurNonLus).where(condition).values({colonne: getattr(CompteurNonLus, colonne) + nombre})
+                       .execution_options(synchronize_session=False))
+
+
+def add_notifications(user_ids, nombre=1):
+    """Ajoute `nombre` aux notifications non lues d'un utilisateur (id) ou d'un ensemble (liste ou requête SELECT d'ids)."""
+    _add('notifications', user_ids, nombre)
+
+
+def add_role_notifications(role, nombre=1):
+    """Une annonce de rôle (ou générale pour 'all') : une non-lue de plus pour chaque utilisateur concerné."""
+    if role == 'all':
+        db.session.execute(update(CompteurNonLus).values(notifications=CompteurNonLus.notifications + nombre)
+                           .execution_options(synchronize_session=False))
+    else:
+        add_notifications(select(Utilisateur.id).where(Utilisateur.role == role), nombre)
+
+
+def add_messages(user_ids, nombre=1):
+    """Ajoute `nombre` (négatif à la lecture) aux messages non lus d'un utilisateur ou d'un ensemble."""
+    _add('messages', user_ids, nombre)
+
+
+def clear_notifications(user_id):
+    """Toutes les notifications de l'utilisateur viennent d'être lues."""
+    db.session.execute(update(CompteurNonLus).where(CompteurNonLus.utilisateur_id == user_id).values(notifications=0)
+                       .execution_options(synchronize_session=False))
+
+
+def invalidate_counters(user_ids=None, roles=None):
+    """
+    Supprime les compteurs d'utilisateurs (ids ou requête SELECT), des utilisateurs de certains rôles,
+    ou de tous sans argument : ils seront recalculés à leur prochaine lecture.
+    Pour les modifications dont l'effet par utilisateur serait coûteux à reporter (annonce supprimée ou modifiée, archivage).
+    """
+    requete = delete(CompteurNonLus)
+    if user_ids is not None:
+        requete = requete.where(CompteurNonLus.utilisateur_id.in_(user_ids))
+    elif roles is not None:
+        if 'all' not in roles:
+            requete = requete.where(CompteurNonLus.utilisateur_id.in_(select(Utilisateur.id).where(Utilisateur.role.in_(roles))))
+    db.session.execute(requete.execution_options(synchronize_session=False))
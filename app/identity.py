@@ -0,0 +1,105 @@
+# app/identity.py
+# Cache des identités pour Flask-Login : le user_loader est appelé à chaque requête et à chaque événement
+# Socket.IO authentifié. Il reçoit ici une copie légère de l'utilisateur (champs utiles à l'authentification,
+# aux contrôles de rôle et à la barre de navigation) gardée en mémoire, sans requête SQL tant qu'elle est valide.
+# Tout autre attribut (relations, méthodes du modèle) charge l'utilisateur complet, une fois par requête.
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import g
+from flask_login import UserMixin
+from app import db
+from app.models import Utilisateur
+from app.backplane import publish, subscribe
+
+# Durée de vie d'une identité en cache : filet de sécurité si plusieurs processus servent l'application
+DUREE_IDENTITE = 60 # secondes
+# Nombre maximal d'identités gardées en mémoire
+MAX_IDENTITES = 4096
+
+CHAMPS_IDENTITE = ('id', 'nom', 'prenom', 'email', 'role', 'picture', 'groupe_id', 'filiere_id', 'niveau_id')
+
+
+class UserIdentity(UserMixin):
+    """
+    Copie en lecture seule d'un Utilisateur pour current_user. Les modifications passent par le modèle
+    (db.session.get(Utilisateur, current_user.id)), suivies de invalidate_identity.
+    """
+
+    def __init__(self, ligne):
+        for champ in CHAMPS_IDENTITE:
+            object.__setattr__(self, champ, getattr(ligne, champ))
+
+    def __setattr__(self, nom, valeur):
+        raise AttributeError(f"L'identité en cache est en lecture seule ({nom}) : modifier l'Utilisateur.")
+
+    initial = Utilisateur.initial
+    get_avatar_color = Utilisateur.get_avatar_color
+
+    def __getattr__(self, nom):
+        # Appelé seulement pour les attributs absents de la copie
+        if nom.startswith('_'):
+            raise AttributeError(nom)
+        cles = g.setdefault('utilisateurs_complets', {})
+        if self.id not in cles:
+            cles[self.id] = db.session.get(Utilisateur, self.id)
+        utilisateur = cles[self.id]
+        if utilisateur is None:
+            raise AttributeError(nom)
+        return getattr(utilisateur, nom)
+
+
+class IdentityCache:
+    """Cache LRU borné des identités, indexé par id, chaque entrée expirant après DUREE_IDENTITE. Cache propre au processus."""
+
+    def __init__(self, max_entrees=MAX_IDENTITES, duree=DUREE_IDENTITE):
+        self.max_entrees = max_entrees
+        self.duree = duree
+        self._entrees = OrderedDict() # id -> (identité, expiration)
+        self._lock = Lock()
+
+    def get(self, user_id):
+        """Identité de l'utilisateur, ou None s'il n'existe pas (rien n'est mis en cache dans ce cas)."""
+        with self._lock:
+            entree = self._entrees.get(user_id)
+            if entree is not None and time.monotonic() < entree[1]:
+                self._entrees.move_to_end(user_id)
+                return entree[0]
+        ligne = db.session.query(*(getattr(Utilisateur, champ) for champ in CHAMPS_IDENTITE))\
+            .filter(Utilisateur.id == user_id).first()
+        if ligne is None:
+            self.invalidate(user_id)
+            return None
+        identite = UserIdentity(ligne)
+        with self._lock:
+            self._entrees[user_id] = (identite, time.monotonic() + self.duree)
+            self._entrees.move_to_end(user_id)
+            while len(self._entrees) > self.max_entrees:
+                self._entrees.popitem(last=False)
+        return identite
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entrees.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entrees.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def invalidate_identity(*user_ids):
+    """
+    À appeler après le commit d'une modification d'utilisateur (profil, rôle, groupe, suppression) :
+    les autres processus en sont informés par le bus (app/backplane.py).
+    """
+    identity_cache.invalidate(*user_ids)
+    publish('identites', [int(user_id) for user_id in user_ids])
+
+
+@subscribe('identites')
+def _identities_changed(user_ids):
+    identity_cache.invalidate(*user_ids)
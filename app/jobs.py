@@ -0,0 +1,366 @@
+# app/jobs.py
+# File de tâches de fond stockée en base (table taches) : une route enregistre la tâche dans sa propre
+# transaction, le worker (worker.py) l'exécute ensuite et la reprend plus tard en cas d'échec.
+# Les traitements lents (envoi des notifications d'un cours, SMTP, images) sortent ainsi des requêtes.
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app, render_template
+from flask_mail import Message as MailMessage
+from PIL import Image
+from sqlalchemy import update, func
+from sqlalchemy.exc import IntegrityError
+from app import db, mail
+from app.models import Tache, TacheRegroupee, Utilisateur
+from app.notifications import notify_course, archive_notifications
+from app.counters import invalidate_counters
+from app.realtime import push_course_notification
+from app.student_import import create_students
+from app.solver import run_generation, purge_generations
+
+# Délai avant une nouvelle tentative : doublé à chaque échec, borné
+DELAI_REPRISE = 30 # secondes
+DELAI_REPRISE_MAX = 3600
+# Une tâche « en cours » depuis plus longtemps est considérée comme abandonnée (worker arrêté)
+DUREE_VERROU = timedelta(minutes=10)
+INTERVALLE_SCRUTATION = 2 # secondes entre deux passages quand la file est vide
+
+_executeurs = {}
+_periodiques = {} # type de tâche -> intervalle entre deux exécutions planifiées
+
+
+def job(type_tache, periode=None):
+    """
+    Décorateur : enregistre la fonction qui exécute les tâches d'un type.
+    La fonction peut retourner une fonction sans argument, appelée une fois son travail validé
+    (envoi en temps réel de ce qui vient d'être écrit, par exemple).
+    Avec `periode` (timedelta), le worker planifie lui-même une tâche sans paramètre à cet intervalle.
+    """
+    def enregistrer(fonction):
+        _executeurs[type_tache] = fonction
+        if periode is not None:
+            _periodiques[type_tache] = periode
+        return fonction
+    return enregistrer
+
+
+def enqueue(type_tache, max_tentatives=5, **charge):
+    """
+    Ajoute une tâche à la session courante : elle n'est visible du worker qu'au commit de l'appelant,
+    et disparaît avec un rollback. Les paramètres doivent être sérialisables en JSON.
+    """
+    if type_tache not in _executeurs:
+        raise ValueError(f"Type de tâche inconnu : {type_tache}")
+    tache = Tache(type_tache=type_tache, charge=json.dumps(charge), max_tentatives=max_tentatives, executer_apres=datetime.utcnow())
+    db.session.add(tache)
+    return tache
+
+
+def enqueue_coalesced(type_tache, cle, delai, fusion=None, max_tentatives=5, **charge):
+    """
+    Comme enqueue, mais différée de `delai` (timedelta) et regroupée sous `cle` : si une tâche de la même clé
+    attend encore, elle reçoit les nouveaux paramètres (combinés aux anciens par `fusion(ancienne, nouvelle)`
+    si elle est fournie) et son exécution est repoussée. Des demandes rapprochées n'en font ainsi qu'une.
+    """
+    executer_apres = datetime.utcnow() + delai
+    for _ in range(2):
+        regroupement = db.session.get(TacheRegroupee, cle, with_for_update=True)
+        if regroupement is not None:
+            # Verrou sur la tâche : le worker ne peut pas la réserver pendant qu'elle est remplacée
+            tache = db.session.get(Tache, regroupement.tache_id, with_for_update=True)
+            if tache.statut == 'en_attente' and tache.type_tache == type_tache:
+                if fusion is not None:
+                    charge = fusion(json.loads(tache.charge), charge)
+                tache.charge = json.dumps(charge)
+                tache.executer_apres = executer_apres
+                return tache
+            tache = enqueue(type_tache, max_tentatives, **charge)
+            tache.executer_apres = executer_apres
+            regroupement.tache = tache
+            return tache
+        # Clé absente : SELECT ... FOR UPDATE ne verrouille rien et une requête concurrente peut créer la même clé.
+        # L'insertion est faite dans un point de sauvegarde : en cas de doublon, elle seule est annulée
+        # et la recherche reprend (la ligne de l'autre requête existe désormais).
+        try:
+            with db.session.begin_nested():
+                tache = enqueue(type_tache, max_tentatives, **charge)
+                tache.executer_apres = executer_apres
+                db.session.add(TacheRegroupee(cle=cle, tache=tache))
+            return tache
+        except IntegrityError:
+            continue
+    # Regroupement disputé à chaque essai (clé supprimée puis recréée entre-temps) : tâche non regroupée
+    tache = enqueue(type_tache, max_tentatives, **charge)
+    tache.executer_apres = executer_apres
+    return tache
+
+
+def claim_next(worker_id):
+    """
+    Réserve la prochaine tâche prête pour ce worker et la retourne (None si la file est vide).
+    L'UPDATE conditionnel sur le statut garantit qu'une tâche n'est prise que par un seul worker.
+    """
+    while True:
+        maintenant = datetime.utcnow()
+        tache_id = db.session.query(Tache.id).filter(Tache.statut == 'en_attente', Tache.executer_apres <= maintenant)\
+            .order_by(Tache.executer_apres, Tache.id).limit(1).scalar()
+        if tache_id is None:
+            db.session.commit()
+            return None
+        prise = db.session.execute(update(Tache).where(Tache.id == tache_id, Tache.statut == 'en_attente').values(
+            statut='en_cours', verrouillee_par=worker_id, verrouillee_le=maintenant, tentatives=Tache.tentatives + 1
+        ).execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if prise:
+            return db.session.get(Tache, tache_id)
+
+
+def run_job(tache):
+    """
+    Exécute une tâche réservée. Le travail de la tâche et son passage à « terminee » sont validés ensemble ;
+    en cas d'erreur, la tâche est replanifiée avec un délai croissant, ou marquée « echouee » après la dernière tentative.
+    """
+    tache_id = tache.id
+    try:
+        suite = _executeurs[tache.type_tache](**json.loads(tache.charge))
+        tache.statut = 'terminee'
+        tache.date_fin = datetime.utcnow()
+        tache.verrouillee_par = None
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        erreur = traceback.format_exc()
+        current_app.logger.warning(f"Échec de la tâche {tache_id} : {erreur}")
+        tache = db.session.get(Tache, tache_id)
+        tache.derniere_erreur = erreur[-4000:]
+        tache.verrouillee_par = None
+        if tache.tentatives >= tache.max_tentatives:
+            tache.statut = 'echouee'
+            tache.date_fin = datetime.utcnow()
+        else:
+            tache.statut = 'en_attente'
+            tache.executer_apres = datetime.utcnow() + timedelta(seconds=min(DELAI_REPRISE_MAX, DELAI_REPRISE * 2 ** (tache.tentatives - 1)))
+        db.session.commit()
+        return False
+
+    if suite is not None:
+        try:
+            suite()
+        except Exception:
+            # Le travail est validé : un échec de la suite ne relance pas la tâche
+            current_app.logger.warning(f"Tâche {tache_id} : échec après validation : {traceback.format_exc()}")
+    return True
+
+
+def schedule_periodic_jobs():
+    """
+    Met en file les tâches périodiques dont la dernière occurrence date de plus que leur période
+    (et dont aucune occurrence n'attend déjà) : l'état est lu dans la table taches, sans horloge propre au worker.
+    """
+    maintenant = datetime.utcnow()
+    planifiees = 0
+    for type_tache, periode in _periodiques.items():
+        derniere = db.session.query(func.max(Tache.date_creation)).filter(Tache.type_tache == type_tache).scalar()
+        en_file = db.session.query(Tache.id).filter(Tache.type_tache == type_tache, Tache.statut.in_(('en_attente', 'en_cours'))).first()
+        if en_file is None and (derniere is None or derniere <= maintenant - periode):
+            enqueue(type_tache)
+            planifiees += 1
+    db.session.commit()
+    return planifiees
+
+
+def release_stale_jobs():
+    """Remet en file les tâches restées « en cours » au-delà de DUREE_VERROU (worker interrompu)."""
+    limite = datetime.utcnow() - DUREE_VERROU
+    reprises = db.session.execute(update(Tache).where(Tache.statut == 'en_cours', Tache.verrouillee_le < limite).values(
+        statut='en_attente', verrouillee_par=None
+    ).execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    return reprises
+
+
+def run_pending(worker_id=None, limite=None):
+    """Exécute les tâches prêtes jusqu'à vider la file (ou jusqu'à `limite`). Retourne le nombre de tâches traitées."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    traitees = 0
+    while limite is None or traitees < limite:
+        tache = claim_next(worker_id)
+        if tache is None:
+            break
+        run_job(tache)
+        traitees += 1
+    return traitees
+
+
+def retry_job(tache):
+    """Remet immédiatement en file une tâche échouée, avec un nouveau jeu de tentatives (page d'administration)."""
+    tache.statut = 'en_attente'
+    tache.tentatives = 0
+    tache.executer_apres = datetime.utcnow()
+    tache.date_fin = None
+
+
+def work(app):
+    """Boucle du worker : scrute la file et exécute les tâches prêtes, indéfiniment."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    with app.app_context():
+        app.logger.info(f"Worker {worker_id} démarré.")
+        while True:
+            release_stale_jobs()
+            schedule_periodic_jobs()
+            traitees = run_pending(worker_id)
+            db.session.remove()
+            if not traitees:
+                time.sleep(INTERVALLE_SCRUTATION)
+
+
+# ===================================================================
+# ==                       TYPES DE TÂCHES                         ==
+# ===================================================================
+@job('notification_cours')
+def _course_notification(enseignant_id, affectations, titre, message, anciens_enseignants=()):
+    affectations = [tuple(a) for a in affectations]
+    date_creation = datetime.utcnow()
+    notify_course(enseignant_id, affectations, titre, message, date_creation, anciens_enseignants)
+    return lambda: push_course_notification(enseignant_id, affectations, titre, message, date_creation, anciens_enseignants)
+
+
+def merge_course_notification(ancienne, nouvelle):
+    """
+    Fusion de deux notifications de cours regroupées : le texte de la dernière (état final du cours),
+    adressé à l'union des affectations et des enseignants, pour prévenir aussi les groupes retirés
+    et l'enseignant remplacé entre-temps.
+    """
+    affectations = [list(a) for a in ancienne['affectations']]
+    affectations += [list(a) for a in nouvelle['affectations'] if list(a) not in affectations]
+    anciens = set(ancienne.get('anciens_enseignants', ())) | {ancienne['enseignant_id']}
+    anciens.discard(nouvelle['enseignant_id'])
+    return dict(nouvelle, affectations=affectations, anciens_enseignants=sorted(anciens))
+
+
+@job('email')
+def _send_email(sujet, destinataires, html):
+    msg = MailMessage(sujet, recipients=destinataires)
+    msg.html = html
+    mail.send(msg)
+
+
+@job('email_reinitialisation')
+def _send_reset_email(utilisateur_id, url_racine):
+    """
+    E-mail de réinitialisation du mot de passe. Le jeton est généré à l'envoi : il n'est jamais écrit dans la file,
+    et sa durée de validité part de là. Sans effet si le compte a été supprimé entre-temps.
+    """
+    utilisateur = db.session.get(Utilisateur, utilisateur_id)
+    if utilisateur is None:
+        return
+    msg = MailMessage('Demande de réinitialisation de mot de passe - UniPlanBJ', recipients=[utilisateur.email])
+    with current_app.test_request_context(base_url=url_racine):
+        msg.html = render_template('email/reset_password.html', user=utilisateur, token=utilisateur.get_reset_token())
+    mail.send(msg)
+
+
+@job('emails_comptes')
+def _send_account_emails(utilisateur_ids, url_racine):
+    """
+    E-mails de création de compte d'un lot d'utilisateurs importés, envoyés sur une seule connexion SMTP.
+    Les liens de réinitialisation sont générés au moment de l'envoi (leur durée de validité part de là),
+    avec `url_racine`, l'adresse du site vue par l'administrateur qui a lancé l'import.
+    Un échec avant tout envoi relance le lot ; après des envois, seuls les destinataires restants
+    sont remis en file, une tâche chacun : une reprise ne renvoie jamais un e-mail déjà parti.
+    """
+    utilisateurs = Utilisateur.query.filter(Utilisateur.id.in_(utilisateur_ids)).all()
+    envoyes = set()
+    try:
+        with current_app.test_request_context(base_url=url_racine), mail.connect() as connexion:
+            for utilisateur in utilisateurs:
+                msg = MailMessage('Votre compte UniPlanBJ a été créé', recipients=[utilisateur.email])
+                msg.html = render_template('email/new_account.html', user=utilisateur, token=utilisateur.get_reset_token())
+                connexion.send(msg)
+                envoyes.add(utilisateur.id)
+    except Exception:
+        if not envoyes:
+            raise
+        restants = [utilisateur.id for utilisateur in utilisateurs if utilisateur.id not in envoyes]
+        current_app.logger.warning(f"E-mails de création de compte : échec après {len(envoyes)} envoi(s), "
+                                   f"{len(restants)} remis en file : {traceback.format_exc()}")
+        for utilisateur_id in restants:
+            enqueue('emails_comptes', utilisateur_ids=[utilisateur_id], url_racine=url_racine)
+
+
+@job('import_etudiants')
+def _import_students(lignes, envoyer_emails=False, url_racine=None):
+    """
+    Crée un lot de comptes étudiants (hachage en parallèle, INSERT multi-lignes), puis met en file
+    leurs e-mails de création de compte par paquets de EMAILS_PAR_CONNEXION. Tout est validé ensemble.
+    """
+    ids = create_students(lignes, current_app.config['IMPORT_PROCESSUS_HACHAGE'])
+    if envoyer_emails:
+        taille = current_app.config['EMAILS_PAR_CONNEXION']
+        for i in range(0, len(ids), taille):
+            enqueue('emails_comptes', utilisateur_ids=ids[i:i + taille], url_racine=url_racine)
+
+
+@job('generation_edt')
+def _solve_timetable(generation_id, budget_secondes, essais):
+    """Génération automatique d'une semaine (app/solver.py) : résolutions parallèles, meilleure solution enregistrée."""
+    run_generation(generation_id, budget_secondes, essais)
+
+
+@job('purge_generations', periode=timedelta(days=1))
+def _purge_generations():
+    """Supprime les générations d'emploi du temps jamais appliquées."""
+    purge_generations()
+
+
+@job('purge_taches', periode=timedelta(days=1))
+def _purge_jobs(date_limite=None):
+    """
+    Supprime un lot de tâches terminées depuis plus de TACHES_CONSERVATION_JOURS, avec leurs clés de regroupement ;
+    si le lot est plein, la suite est remise en file (même date limite).
+    """
+    if date_limite is None:
+        date_limite = (datetime.utcnow() - timedelta(days=current_app.config['TACHES_CONSERVATION_JOURS'])).isoformat()
+    taille_lot = current_app.config['TACHES_PURGE_LOT']
+    ids = [tache_id for tache_id, in db.session.query(Tache.id).filter(
+        Tache.statut == 'terminee', Tache.date_fin < datetime.fromisoformat(date_limite)
+    ).order_by(Tache.id).limit(taille_lot)]
+    if ids:
+        db.session.query(TacheRegroupee).filter(TacheRegroupee.tache_id.in_(ids)).delete(synchronize_session=False)
+        db.session.query(Tache).filter(Tache.id.in_(ids)).delete(synchronize_session=False)
+    if len(ids) == taille_lot:
+        enqueue('purge_taches', date_limite=date_limite)
+
+
+@job('miniature')
+def _thumbnail(fichier, largeur, hauteur):
+    """Redimensionne sur place une image de static/ (sans effet si elle a été supprimée entre-temps)."""
+    chemin = os.path.join(current_app.root_path, 'static', fichier)
+    if not os.path.exists(chemin):
+        return
+    with Image.open(chemin) as image:
+        image.thumbnail((largeur, hauteur))
+        miniature = image.copy()
+    miniature.save(chemin)
+
+
+@job('archivage_notifications', periode=timedelta(days=1))
+def _archive_notifications(date_limite=None):
+    """
+    Archive un lot de notifications plus anciennes que NOTIFICATIONS_ARCHIVE_JOURS ; si le lot est plein,
+    la suite est remise en file (même date limite) : chaque lot est une transaction courte.
+    """
+    if date_limite is None:
+        date_limite = (datetime.utcnow() - timedelta(days=current_app.config['NOTIFICATIONS_ARCHIVE_JOURS'])).isoformat()
+    taille_lot = current_app.config['NOTIFICATIONS_ARCHIVE_LOT']
+    if archive_notifications(datetime.fromisoformat(date_limite), taille_lot) == taille_lot:
+        enqueue('archivage_notifications', date_limite=date_limite)
+
+
+@job('recalcul_compteurs', periode=timedelta(days=1))
+def _reset_counters():
+    """Filet de sécurité des compteurs de non-lus : tous recalculés à leur prochaine lecture, une fois par jour."""
+    invalidate_counters()
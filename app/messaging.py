@@ -0,0 +1,147 @@
+# app/messaging.py
+# Requêtes de la messagerie : la liste des conversations (interlocuteur, aperçu du dernier message,
+# nombre de non-lus) est construite par la base en une requête, sans requête par conversation ;
+# l'historique d'une conversation est lu par pages, de la plus récente à la plus ancienne.
+from datetime import datetime
+from sqlalchemy import func, case, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import Utilisateur, Conversation, Message, CleMessage
+from app.counters import add_messages
+
+# Messages par page de l'historique d'une conversation
+MESSAGES_PAR_PAGE = 30
+
+
+def user_conversations(user_id):
+    """Requête des identifiants des conversations d'un utilisateur."""
+    return db.select(Conversation.id).where(or_(Conversation.participant1_id == user_id, Conversation.participant2_id == user_id))
+
+
+def inbox_conversations(user_id):
+    """
+    Conversations d'un utilisateur, de la plus récente à la plus ancienne, en tuples légers :
+    id, last_message_time, autre_id, autre_prenom, autre_nom, dernier_corps, dernier_image,
+    dernier_expediteur_id (None si la conversation est vide) et non_lus.
+    Le dernier message est choisi par ROW_NUMBER() sur chaque conversation, les non-lus par un COUNT groupé.
+    """
+    conversations = user_conversations(user_id)
+    rang = func.row_number().over(
+        partition_by=Message.conversation_id, order_by=(Message.timestamp.desc(), Message.id.desc())
+    ).label('rang')
+    messages_classes = db.select(
+        Message.conversation_id, Message.body, Message.image_url, Message.sender_id, rang
+    ).where(Message.conversation_id.in_(conversations)).subquery()
+    non_lus = db.select(Message.conversation_id, func.count(Message.id).label('nombre')).where(
+        Message.conversation_id.in_(conversations), Message.sender_id != user_id, Message.is_read == False
+    ).group_by(Message.conversation_id).subquery()
+
+    autre = aliased(Utilisateur)
+    autre_id = case((Conversation.participant1_id == user_id, Conversation.participant2_id), else_=Conversation.participant1_id)
+    return db.session.query(
+        Conversation.id, Conversation.last_message_time,
+        autre.id.label('autre_id'), autre.prenom.label('autre_prenom'), autre.nom.label('autre_nom'),
+        messages_classes.c.body.label('dernier_corps'), messages_classes.c.image_url.label('dernier_image'),
+        messages_classes.c.sender_id.label('dernier_expediteur_id'),
+        func.coalesce(non_lus.c.nombre, 0).label('non_lus')
+    ).join(autre, autre.id == autre_id)\
+    .outerjoin(messages_classes, and_(messages_classes.c.conversation_id == Conversation.id, messages_classes.c.rang == 1))\
+    .outerjoin(non_lus, non_lus.c.conversation_id == Conversation.id)\
+    .filter(or_(Conversation.participant1_id == user_id, Conversation.participant2_id == user_id))\
+    .order_by(Conversation.last_message_time.desc()).all()
+
+
+def encode_message_cursor(message):
+    """Curseur de l'historique : position (timestamp, id) du plus ancien message déjà affiché."""
+    return f"{message.timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')}_{message.id}"
+
+
+def decode_message_cursor(curseur):
+    """Inverse de encode_message_cursor ; lève ValueError si le curseur est invalide."""
+    date_texte, message_id = curseur.split('_')
+    return datetime.strptime(date_texte, '%Y-%m-%dT%H:%M:%S.%f'), int(message_id)
+
+
+def message_page(conversation_id, avant=None, limite=MESSAGES_PAR_PAGE):
+    """
+    Les `limite` messages d'une conversation qui précèdent le curseur `avant` (les plus récents sans curseur),
+    dans l'ordre chronologique, lus sur l'index (conversation_id, timestamp, id) sans OFFSET.
+    Retourne (messages, curseur de la page précédente ou None s'il n'y a pas de message plus ancien).
+    """
+    query = Message.query.filter(Message.conversation_id == conversation_id)
+    if avant:
+        timestamp, message_id = avant
+        query = query.filter(
+            Message.timestamp <= timestamp,
+            or_(Message.timestamp < timestamp, Message.id < message_id)
+        )
+    lignes = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limite + 1).all()
+    precedent = encode_message_cursor(lignes[limite - 1]) if len(lignes) > limite else None
+    return lignes[:limite][::-1], precedent
+
+
+def message_json(message):
+    """Sérialise un message pour l'API de l'historique."""
+    return {
+        'id': message.id,
+        'body': message.body,
+        'image_url': message.image_url,
+        'timestamp': message.timestamp.isoformat() + 'Z',
+        'sender_id': message.sender_id,
+        'is_read': message.is_read,
+    }
+
+
+def other_participant_id(conversation, user_id):
+    return conversation.participant2_id if conversation.participant1_id == user_id else conversation.participant1_id
+
+
+def _message_for_key(sender_id, cle):
+    return db.session.query(Message).join(CleMessage, CleMessage.message_id == Message.id)\
+        .filter(CleMessage.utilisateur_id == sender_id, CleMessage.cle == cle).first()
+
+
+def post_message(conversation, sender, body=None, image_url=None, cle=None):
+    """
+    Ajoute un message à la conversation (date de la conversation et compteur du destinataire mis à jour).
+    Avec une clé d'idempotence déjà utilisée par l'expéditeur, le message existant est retourné sans rien créer.
+    La transaction n'est pas validée ici. Retourne (message, créé ou non).
+    """
+    if cle:
+        existant = _message_for_key(sender.id, cle)
+        if existant is not None:
+            return existant, False
+    try:
+        # Point de sauvegarde : si un envoi concurrent vient d'enregistrer la même clé, seul ce message est annulé
+        with db.session.begin_nested():
+            message = Message(conversation_id=conversation.id, sender_id=sender.id, body=body, image_url=image_url,
+                              timestamp=datetime.utcnow())
+            db.session.add(message)
+            if cle:
+                db.session.flush()
+                db.session.add(CleMessage(utilisateur_id=sender.id, cle=cle, message_id=message.id))
+    except IntegrityError:
+        existant = _message_for_key(sender.id, cle) if cle else None
+        if existant is None:
+            raise
+        return existant, False
+    conversation.last_message_time = message.timestamp
+    add_messages(other_participant_id(conversation, sender.id), 1)
+    return message, True
+
+
+def new_message_event(message, sender, cle=None):
+    """Contenu de l'événement 'new_message' diffusé à la room de la conversation."""
+    return {
+        'id': message.id,
+        'body': message.body,
+        'image_url': message.image_url,
+        'timestamp': message.timestamp.isoformat() + 'Z', # Format ISO 8601 pour JS
+        'sender': {
+            'id': sender.id,
+            'prenom': sender.prenom
+        },
+        'conversation_id': message.conversation_id,
+        'cle': cle,
+    }
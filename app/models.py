@@ -126,19 +126,14 @@ class Utilisateur(db.Model, UserMixin):
         return colors[hash_code % len(colors)]
 
     def new_messages_count(self):
-        """Compte les messages non lus où l'utilisateur est participant mais pas l'expéditeur."""
-        conversations = Conversation.query.filter(
+        """Compte les messages non lus où l'utilisateur est participant mais pas l'expéditeur (une requête)."""
+        return Message.query.join(Conversation, Conversation.id == Message.conversation_id).filter(
             or_(
                 Conversation.participant1_id == self.id,
                 Conversation.participant2_id == self.id
-            )
-        ).all()
-        if not conversations:
-            return 0
-        conversation_ids = [c.id for c in conversations]
-        
-        count = Message.query.filter(Message.conversation_id.in_(conversation_ids), Message.sender_id != self.id, Message.is_read == False).count()
-        return count
+            ),
+            Message.sender_id != self.id, Message.is_read == False
+        ).count()
 
     def set_password(self, password):
         self.mot_de_passe_hash = generate_password_hash(password)
@@ -218,13 +213,23 @@ class Message(db.Model):
     is_read = db.Column(db.Boolean, default=False, nullable=False)
 
     # S'assurer qu'un message a soit du texte, soit une image pour ne pas être vide
+    # Index de l'historique d'une conversation, parcouru par pages (curseur timestamp, id)
     __table_args__ = (
         db.CheckConstraint('body IS NOT NULL OR image_url IS NOT NULL', name='_message_content_check'),
+        db.Index('ix_messages_conversation_timestamp_id', 'conversation_id', 'timestamp', 'id'),
     )
 
     def __repr__(self):
         return f'<Message {self.id}>'
 
+# Clé d'idempotence fournie par le client à l'envoi d'un message : un envoi répété (nouvelle tentative
+# après une coupure, double clic) retrouve le message déjà créé au lieu d'en créer un second.
+class CleMessage(db.Model):
+    __tablename__ = 'cles_messages'
+    utilisateur_id = db.Column(db.Integer, db.ForeignKey('utilisateurs.id', ondelete='CASCADE'), primary_key=True)
+    cle = db.Column(db.String(64), primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='CASCADE'), nullable=False)
+
 # Modèle pour les Salles de Cours (ex: Amphi A, Salle B101)
 class Salle(db.Model):
     __tablename__ = 'salles' # Nom de la table dans la BDD
@@ -267,13 +272,69 @@ class Cours(db.Model):
     heure_fin = db.Column(db.Time, nullable=False) # Type Time pour l'heure seule
     description = db.Column(db.Text)
 
+    # Index composites pour les vérifications de conflits par enseignant et par salle
+    # (le premier sert aussi à paginer l'emploi du temps d'un enseignant)
+    __table_args__ = (
+        db.Index('ix_cours_enseignant_date_debut', 'enseignant_id', 'date_cours', 'heure_debut'),
+        db.Index('ix_cours_salle_date_debut', 'salle_id', 'date_cours', 'heure_debut'),
+        db.Index('ix_cours_date_salle', 'date_cours', 'salle_id'),
+        # Pagination par curseur des emplois du temps : ORDER BY date_cours, heure_debut, id
+        db.Index('ix_cours_date_debut_id', 'date_cours', 'heure_debut', 'id'),
+    )
+
     # Relation inverse: une affectation de cours est associée à un cours
     cours_affectations = db.relationship('CoursAffectation', backref='cours_obj', lazy='dynamic', cascade="all, delete-orphan")
+    # Appartenance à une série récurrente (aucune ligne pour un cours ponctuel)
+    occurrence_serie = db.relationship('SerieOccurrence', uselist=False, cascade="all, delete-orphan")
 
     def __repr__(self):
         return f'<Cours {self.matiere_obj.code_matiere} - {self.date_cours} {self.heure_debut}>'
 
 
+# Table d'association entre une série de cours et les groupes qu'elle concerne
+series_groupes = db.Table('series_groupes',
+    db.Column('serie_id', db.Integer, db.ForeignKey('series_cours.id'), primary_key=True),
+    db.Column('groupe_id', db.Integer, db.ForeignKey('groupes.id'), primary_key=True)
+)
+
+# Modèle pour les Séries de cours (un cours qui se répète chaque semaine ou toutes les deux semaines)
+class SerieCours(db.Model):
+    __tablename__ = 'series_cours'
+    id = db.Column(db.Integer, primary_key=True)
+    matiere_id = db.Column(db.Integer, db.ForeignKey('matieres.id'), nullable=False)
+    enseignant_id = db.Column(db.Integer, db.ForeignKey('utilisateurs.id'), nullable=False)
+    salle_id = db.Column(db.Integer, db.ForeignKey('salles.id'), nullable=False)
+    heure_debut = db.Column(db.Time, nullable=False)
+    heure_fin = db.Column(db.Time, nullable=False)
+    date_debut = db.Column(db.Date, nullable=False) # Date de la première occurrence (fixe le jour de la semaine)
+    date_fin = db.Column(db.Date, nullable=False)
+    frequence = db.Column(db.Enum('hebdomadaire', 'bihebdomadaire'), default='hebdomadaire', nullable=False)
+    dates_exclues = db.Column(db.Text) # Dates ISO (AAAA-MM-JJ) séparées par des virgules
+    description = db.Column(db.Text)
+
+    matiere = db.relationship('Matiere')
+    enseignant = db.relationship('Utilisateur')
+    salle = db.relationship('Salle')
+    groupes = db.relationship('Groupe', secondary=series_groupes, lazy='subquery', backref=db.backref('series', lazy='dynamic'))
+    # Occurrences générées pour cette série
+    cours = db.relationship('Cours', secondary='series_occurrences', lazy='dynamic', viewonly=True)
+
+    @property
+    def intervalle_semaines(self):
+        return 2 if self.frequence == 'bihebdomadaire' else 1
+
+    def __repr__(self):
+        return f'<SerieCours {self.matiere_id} - {self.frequence} du {self.date_debut} au {self.date_fin}>'
+
+
+# Occurrences des séries : une ligne par cours généré par une série. Table de liaison plutôt qu'une colonne
+# de cours : db.create_all crée les nouvelles tables mais ne modifie jamais une table existante.
+class SerieOccurrence(db.Model):
+    __tablename__ = 'series_occurrences'
+    cours_id = db.Column(db.Integer, db.ForeignKey('cours.id', ondelete='CASCADE'), primary_key=True)
+    serie_id = db.Column(db.Integer, db.ForeignKey('series_cours.id', ondelete='CASCADE'), nullable=False, index=True)
+
+
 # Modèle pour la table de liaison Cours_Affectations
 class CoursAffectation(db.Model):
     __tablename__ = 'cours_affectations' # Nom de la table dans la BDD
@@ -286,6 +347,12 @@ class CoursAffectation(db.Model):
 
     # Vous pouvez ajouter une contrainte unique pour éviter les doublons d'affectation
     # __table_args__ = (db.UniqueConstraint('cours_id', 'filiere_id', 'niveau_id', 'groupe_id', name='_cours_affectation_uc'),)
+    # Index de la détection des conflits de groupes (toutes les affectations d'une promotion)
+    # et de l'emploi du temps d'une cohorte (EXISTS corrélé sur cours_id)
+    __table_args__ = (
+        db.Index('ix_affectation_promo_groupe', 'filiere_id', 'niveau_id', 'groupe_id', 'cours_id'),
+        db.Index('ix_affectation_cours_groupe', 'cours_id', 'groupe_id', 'filiere_id', 'niveau_id'),
+    )
 
     def __repr__(self):
         return f'<Affectation Cours {self.cours_id} - Fil: {self.filiere_id} Niv: {self.niveau_id} Grp: {self.groupe_id}>'
@@ -303,9 +370,61 @@ class Notification(db.Model):
     destinataire_id = db.Column(db.Integer, db.ForeignKey('utilisateurs.id'), nullable=True) # Nullable si 'all' ou un rôle générique
     est_lue = db.Column(db.Boolean, default=False)
 
+    # Index des non-lues et de l'historique personnel, et de l'historique des annonces par rôle
+    __table_args__ = (
+        db.Index('ix_notifications_destinataire_lue_date', 'destinataire_id', 'est_lue', 'date_creation'),
+        db.Index('ix_notifications_role_date', 'destinataire_role', 'date_creation'),
+    )
+
     def __repr__(self):
         return f'<Notification "{self.titre[:20]}..." pour {self.destinataire_role}>'
 
+
+# Nombres de non-lus par utilisateur, tenus à jour à chaque envoi et lecture : la barre de navigation
+# les lit par clé primaire au lieu de recompter. Sans ligne, ils sont recalculés puis enregistrés.
+class CompteurNonLus(db.Model):
+    __tablename__ = 'compteurs_non_lus'
+    utilisateur_id = db.Column(db.Integer, db.ForeignKey('utilisateurs.id', ondelete='CASCADE'), primary_key=True)
+    notifications = db.Column(db.Integer, default=0, nullable=False)
+    messages = db.Column(db.Integer, default=0, nullable=False)
+
+
+# Notifications anciennes déplacées par la tâche d'archivage : table sans index secondaire ni état de lecture,
+# qui garde la table notifications à la taille de l'historique récent.
+class NotificationArchivee(db.Model):
+    __tablename__ = 'notifications_archivees'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False) # Identifiant d'origine
+    titre = db.Column(db.String(255), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    date_creation = db.Column(db.DateTime, nullable=False)
+    destinataire_role = db.Column(db.Enum('etudiant', 'enseignant', 'administrateur', 'all'), nullable=False)
+    destinataire_id = db.Column(db.Integer, nullable=True)
+    date_archivage = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<NotificationArchivee {self.id}>'
+
+
+# État de lecture des annonces (notifications de rôle ou générales, destinataire_id NULL) sans une ligne par destinataire :
+# un curseur par utilisateur (toutes les annonces jusqu'à cette date sont lues) et, après le curseur,
+# les seules annonces lues une à une. Sans curseur, aucune annonce n'a encore été lue.
+class LectureAnnonces(db.Model):
+    __tablename__ = 'lectures_annonces'
+    utilisateur_id = db.Column(db.Integer, db.ForeignKey('utilisateurs.id', ondelete='CASCADE'), primary_key=True)
+    lues_jusqu_au = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<LectureAnnonces {self.utilisateur_id} jusqu\'au {self.lues_jusqu_au}>'
+
+
+class AnnonceLue(db.Model):
+    __tablename__ = 'annonces_lues'
+    utilisateur_id = db.Column(db.Integer, db.ForeignKey('utilisateurs.id', ondelete='CASCADE'), primary_key=True)
+    notification_id = db.Column(db.Integer, db.ForeignKey('notifications.id', ondelete='CASCADE'), primary_key=True)
+
+    def __repr__(self):
+        return f'<AnnonceLue {self.notification_id} par {self.utilisateur_id}>'
+
 # Modèle pour la table de liaison Enseigne
 # Indique quelle matière un enseignant enseigne, pour quelle filière et quel niveau.
 class Enseigne(db.Model):
@@ -342,3 +461,80 @@ class DisponibiliteEnseignant(db.Model):
 
     def __repr__(self):
         return f'<Disponibilite {self.enseignant_obj.nom} - {self.jour_semaine} {self.heure_debut}>'
+
+
+# Disponibilités d'un enseignant compilées en un masque hebdomadaire (voir app/availability.py),
+# recalculé à chaque ajout ou suppression de disponibilité.
+class MasqueDisponibilite(db.Model):
+    __tablename__ = 'masques_disponibilite'
+    enseignant_id = db.Column(db.Integer, db.ForeignKey('utilisateurs.id', ondelete='CASCADE'), primary_key=True)
+    # Un bit par créneau de 15 minutes, du lundi 00h00 au samedi 24h00 (6 x 96 bits)
+    masque = db.Column(db.LargeBinary(72), nullable=False)
+    date_maj = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MasqueDisponibilite {self.enseignant_id}>'
+
+
+# File de tâches de fond (voir app/jobs.py) : notifications, e-mails, traitement d'images.
+# Une tâche est enregistrée dans la même transaction que la modification qui la déclenche,
+# puis exécutée par le worker (worker.py) avec reprise en cas d'échec.
+class Tache(db.Model):
+    __tablename__ = 'taches'
+    id = db.Column(db.Integer, primary_key=True)
+    type_tache = db.Column(db.String(50), nullable=False)
+    charge = db.Column(db.Text, nullable=False) # Paramètres de la tâche, en JSON
+    statut = db.Column(db.Enum('en_attente', 'en_cours', 'terminee', 'echouee'), default='en_attente', nullable=False)
+    tentatives = db.Column(db.Integer, default=0, nullable=False)
+    max_tentatives = db.Column(db.Integer, default=5, nullable=False)
+    executer_apres = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    date_fin = db.Column(db.DateTime, nullable=True)
+    verrouillee_par = db.Column(db.String(64), nullable=True) # Worker qui exécute la tâche
+    verrouillee_le = db.Column(db.DateTime, nullable=True)
+    derniere_erreur = db.Column(db.Text, nullable=True)
+
+    # Index de la boucle du worker : prochaines tâches prêtes, par statut et date d'exécution
+    __table_args__ = (db.Index('ix_taches_statut_executer_apres', 'statut', 'executer_apres'),)
+
+    def __repr__(self):
+        return f'<Tache {self.id} {self.type_tache} ({self.statut})>'
+
+
+# Dernière tâche enregistrée sous une clé de regroupement (ex. 'cours:12') : tant qu'elle attend,
+# une nouvelle demande sous la même clé la remplace au lieu d'ajouter une tâche.
+class TacheRegroupee(db.Model):
+    __tablename__ = 'taches_regroupees'
+    cle = db.Column(db.String(100), primary_key=True)
+    tache_id = db.Column(db.Integer, db.ForeignKey('taches.id', ondelete='CASCADE'), nullable=False)
+
+    tache = db.relationship('Tache')
+
+
+# Version des flux iCalendar par périmètre ('tout', 'promotion:<filiere>:<niveau>', 'groupe:<id>',
+# 'enseignant:<id>', 'salle:<id>'), incrémentée après chaque modification de cours : tous les processus
+# web en dérivent les mêmes ETag et Last-Modified.
+class VersionFlux(db.Model):
+    __tablename__ = 'versions_flux'
+    perimetre = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, default=1, nullable=False)
+    date_modification = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<VersionFlux {self.perimetre} v{self.version}>'
+
+
+# Génération automatique d'une semaine d'emploi du temps (voir app/solver.py) : le problème est construit
+# par la route, résolu par le worker des tâches de fond, puis la solution attend ici d'être appliquée.
+# Tout processus web peut ainsi afficher ou appliquer une génération lancée depuis un autre.
+class GenerationEdt(db.Model):
+    __tablename__ = 'generations_edt'
+    id = db.Column(db.String(32), primary_key=True) # Identifiant aléatoire, visible dans l'URL
+    statut = db.Column(db.Enum('en_cours', 'termine', 'echec'), default='en_cours', nullable=False)
+    probleme = db.Column(db.Text(16777215), nullable=False) # JSON (MEDIUMTEXT sous MySQL)
+    resultat = db.Column(db.Text(16777215), nullable=True) # JSON, une fois la résolution terminée
+    erreur = db.Column(db.Text, nullable=True)
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<GenerationEdt {self.id} ({self.statut})>'
@@ -0,0 +1,217 @@
+# app/notifications.py
+# Envoi des notifications liées aux cours (destinataires calculés par la base, une requête INSERT ... SELECT)
+# et état de lecture : drapeau est_lue pour les notifications personnelles, curseur de lecture
+# et exceptions (LectureAnnonces, AnnonceLue) pour les annonces de rôle ou générales.
+from datetime import datetime
+from sqlalchemy import insert, select, update, delete, literal, and_, or_, true, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Utilisateur, CoursAffectation, Notification, LectureAnnonces, AnnonceLue, NotificationArchivee
+from app.counters import add_notifications, clear_notifications, invalidate_counters
+
+
+def course_audience(cours_id):
+    """Affectations d'un cours sous forme de tuples (groupe_id, filiere_id, niveau_id), en une requête."""
+    return [tuple(a) for a in db.session.query(
+        CoursAffectation.groupe_id, CoursAffectation.filiere_id, CoursAffectation.niveau_id
+    ).filter(CoursAffectation.cours_id == cours_id)]
+
+
+def course_recipients(enseignant_id, affectations, autres_enseignants=()):
+    """
+    Requête (id, rôle) des destinataires d'un cours : son enseignant (et `autres_enseignants`, ceux qu'il a
+    remplacés) et les étudiants de ses affectations (tuples groupe_id, filiere_id, niveau_id ; un champ None
+    ne filtre pas, comme le groupe d'un cours commun).
+    Chaque utilisateur n'est lu qu'une fois, même s'il correspond à plusieurs affectations.
+    """
+    publics = []
+    for groupe_id, filiere_id, niveau_id in set(affectations):
+        conditions = [Utilisateur.filiere_id == filiere_id] if filiere_id else []
+        if niveau_id:
+            conditions.append(Utilisateur.niveau_id == niveau_id)
+        if groupe_id:
+            conditions.append(Utilisateur.groupe_id == groupe_id)
+        publics.append(and_(*conditions) if conditions else true())
+    destinataires = [Utilisateur.id.in_([enseignant_id, *autres_enseignants])]
+    if publics:
+        destinataires.append(and_(Utilisateur.role == 'etudiant', or_(*publics)))
+    return select(Utilisateur.id, Utilisateur.role).where(or_(*destinataires))
+
+
+def notify_course(enseignant_id, affectations, titre, message, date_creation=None, autres_enseignants=()):
+    """
+    Crée une notification personnelle pour chaque destinataire d'un cours, en une requête exécutée
+    par la base (aucun objet Utilisateur ni Notification chargé en mémoire).
+    Les affectations sont passées explicitement : un cours supprimé depuis peut encore être annoncé.
+    La transaction n'est pas validée ici. Retourne le nombre de notifications créées.
+    """
+    destinataires = course_recipients(enseignant_id, affectations, autres_enseignants).subquery()
+    lignes = select(
+        literal(titre), literal(message), literal(date_creation or datetime.utcnow()),
+        destinataires.c.role, destinataires.c.id, literal(False)
+    )
+    resultat = db.session.execute(insert(Notification).from_select(
+        ['titre', 'message', 'date_creation', 'destinataire_role', 'destinataire_id', 'est_lue'], lignes
+    ))
+    add_notifications(select(destinataires.c.id))
+    return resultat.rowcount
+
+
+# ===================================================================
+# ==                      ÉTAT DE LECTURE                          ==
+# ===================================================================
+def announcements_for(role):
+    """Condition « annonce visible par ce rôle » : générale ou adressée au rôle, sans destinataire personnel."""
+    return and_(Notification.destinataire_id == None, Notification.destinataire_role.in_(('all', role)))
+
+
+def visible_to(user):
+    """Condition « notification visible par l'utilisateur » : les siennes et les annonces de son rôle."""
+    return or_(Notification.destinataire_id == user.id, announcements_for(user.role))
+
+
+def unread_condition(user):
+    """
+    Condition « non lue par l'utilisateur » : notification personnelle non lue, ou annonce postérieure
+    à son curseur de lecture (toutes, s'il n'en a pas) qui n'a pas été lue à part.
+    """
+    curseur = select(LectureAnnonces.lues_jusqu_au).where(LectureAnnonces.utilisateur_id == user.id).scalar_subquery()
+    lue_a_part = select(AnnonceLue.notification_id).where(
+        AnnonceLue.utilisateur_id == user.id, AnnonceLue.notification_id == Notification.id
+    ).exists()
+    return or_(
+        and_(Notification.destinataire_id == user.id, Notification.est_lue == False),
+        and_(announcements_for(user.role), or_(curseur == None, Notification.date_creation > curseur), ~lue_a_part),
+    )
+
+
+def unread_count(user):
+    """Nombre exact de notifications non lues (personnelles et annonces), en une requête."""
+    return db.session.query(func.count(Notification.id)).filter(unread_condition(user)).scalar()
+
+
+def unread_ids(user, notification_ids):
+    """Parmi les notifications données, celles que l'utilisateur n'a pas lues."""
+    if not notification_ids:
+        return set()
+    return {i for (i,) in db.session.query(Notification.id).filter(Notification.id.in_(notification_ids), unread_condition(user))}
+
+
+def unread_counts(user_ids):
+    """
+    Nombre de non-lues par utilisateur pour un ensemble d'utilisateurs (liste ou requête SELECT d'ids) :
+    une requête groupée pour les notifications personnelles, une pour les annonces.
+    """
+    personnelles = db.session.query(Notification.destinataire_id, func.count(Notification.id)).filter(
+        Notification.destinataire_id.in_(user_ids), Notification.est_lue == False
+    ).group_by(Notification.destinataire_id)
+    lue_a_part = select(AnnonceLue.notification_id).where(
+        AnnonceLue.utilisateur_id == Utilisateur.id, AnnonceLue.notification_id == Notification.id
+    ).exists()
+    annonces = db.session.query(Utilisateur.id, func.count(Notification.id)).select_from(Utilisateur)\
+        .outerjoin(LectureAnnonces, LectureAnnonces.utilisateur_id == Utilisateur.id)\
+        .join(Notification, and_(
+            Notification.destinataire_id == None,
+            or_(Notification.destinataire_role == 'all', Notification.destinataire_role == Utilisateur.role),
+            or_(LectureAnnonces.lues_jusqu_au == None, Notification.date_creation > LectureAnnonces.lues_jusqu_au),
+        )).filter(Utilisateur.id.in_(user_ids), ~lue_a_part).group_by(Utilisateur.id)
+
+    compteurs = dict(personnelles.all())
+    for user_id, nombre in annonces:
+        compteurs[user_id] = compteurs.get(user_id, 0) + nombre
+    return compteurs
+
+
+def mark_all_read(user):
+    """
+    Marque tout comme lu : un UPDATE pour les notifications personnelles, le curseur des annonces avancé
+    à maintenant (les exceptions devenues inutiles sont supprimées). La transaction n'est pas validée ici.
+    """
+    maintenant = datetime.utcnow()
+    db.session.execute(update(Notification).where(Notification.destinataire_id == user.id, Notification.est_lue == False)
+                       .values(est_lue=True).execution_options(synchronize_session=False))
+    avancer = update(LectureAnnonces).where(LectureAnnonces.utilisateur_id == user.id)\
+        .values(lues_jusqu_au=maintenant).execution_options(synchronize_session=False)
+    if not db.session.execute(avancer).rowcount:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(LectureAnnonces).values(utilisateur_id=user.id, lues_jusqu_au=maintenant))
+        except IntegrityError:
+            # Curseur créé entre-temps par une requête concurrente : il est avancé
+            db.session.execute(avancer)
+    db.session.execute(delete(AnnonceLue).where(AnnonceLue.utilisateur_id == user.id))
+    clear_notifications(user.id)
+
+
+def mark_read(user, notification):
+    """Marque une seule notification comme lue (une annonce devient une exception au curseur). Transaction non validée."""
+    if notification.destinataire_id == user.id:
+        # UPDATE conditionnel : deux lectures concurrentes ne décrémentent le compteur qu'une fois
+        lue = db.session.execute(update(Notification).where(Notification.id == notification.id, Notification.est_lue == False)
+                                 .values(est_lue=True).execution_options(synchronize_session=False)).rowcount
+        if lue:
+            add_notifications(user.id, -1)
+    elif notification.id in unread_ids(user, [notification.id]):
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(AnnonceLue).values(utilisateur_id=user.id, notification_id=notification.id))
+        except IntegrityError:
+            # Déjà marquée lue par une requête concurrente, qui a aussi décrémenté le compteur
+            return
+        add_notifications(user.id, -1)
+
+
+# ===================================================================
+# ==                  HISTORIQUE ET ARCHIVAGE                      ==
+# ===================================================================
+def encode_history_cursor(notification):
+    """Curseur de l'historique : position (date de création, id) de la dernière notification affichée."""
+    return f"{notification.date_creation.strftime('%Y-%m-%dT%H:%M:%S.%f')}_{notification.id}"
+
+
+def decode_history_cursor(curseur):
+    """Inverse de encode_history_cursor ; lève ValueError si le curseur est invalide."""
+    date_texte, notification_id = curseur.split('_')
+    return datetime.strptime(date_texte, '%Y-%m-%dT%H:%M:%S.%f'), int(notification_id)
+
+
+def history_page(user, avant=None, limite=30):
+    """
+    Une page de l'historique des notifications visibles par l'utilisateur, de la plus récente à la plus ancienne,
+    paginée par curseur sur (date_creation, id) : pas d'OFFSET ni de chargement de tout l'historique.
+    Retourne (notifications, curseur de la page suivante ou None).
+    """
+    query = Notification.query.filter(visible_to(user))
+    if avant:
+        date_creation, notification_id = avant
+        query = query.filter(
+            Notification.date_creation <= date_creation,
+            or_(Notification.date_creation < date_creation, Notification.id < notification_id)
+        )
+    lignes = query.order_by(Notification.date_creation.desc(), Notification.id.desc()).limit(limite + 1).all()
+    suivant = encode_history_cursor(lignes[limite - 1]) if len(lignes) > limite else None
+    return lignes[:limite], suivant
+
+
+def archive_notifications(avant, taille_lot):
+    """
+    Déplace vers notifications_archivees un lot d'au plus `taille_lot` notifications créées avant `avant`
+    (copie INSERT ... SELECT puis suppression, sans charger les lignes), avec leurs lectures individuelles.
+    Les compteurs des utilisateurs qui en avaient des non lues sont invalidés. La transaction n'est pas validée ici. Retourne le nombre de notifications archivées.
+    """
+    ids = [i for (i,) in db.session.query(Notification.id).filter(Notification.date_creation < avant)
+           .order_by(Notification.id).limit(taille_lot)]
+    if not ids:
+        return 0
+    db.session.execute(insert(NotificationArchivee).from_select(
+        ['id', 'titre', 'message', 'date_creation', 'destinataire_role', 'destinataire_id', 'date_archivage'], select(
+        Notification.id, Notification.titre, Notification.message, Notification.date_creation,
+        Notification.destinataire_role, Notification.destinataire_id, literal(datetime.utcnow())
+    ).where(Notification.id.in_(ids))))
+    db.session.execute(delete(AnnonceLue).where(AnnonceLue.notification_id.in_(ids)))
+    invalidate_counters(user_ids=select(Notification.destinataire_id).where(Notification.id.in_(ids), Notification.est_lue == False))
+    roles = {r for (r,) in db.session.query(Notification.destinataire_role).filter(Notification.id.in_(ids), Notification.destinataire_id == None).distinct()}
+    if roles:
+        invalidate_counters(roles=roles)
+    db.session.execute(delete(Notification).where(Notification.id.in_(ids)).execution_options(synchronize_session=False))
+    return len(ids)
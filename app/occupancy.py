@@ -0,0 +1,189 @@
+# app/occupancy.py
+# Bitmaps d'occupation des salles (une par salle et par jour, créneaux de 15 minutes)
+# pour répondre à « quelles salles sont libres ? » sans requête de chevauchement par salle.
+import time
+from collections import OrderedDict
+from datetime import date
+from threading import Lock
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Cours, Salle
+from app.conflicts import to_minutes
+from app.backplane import publish, subscribe
+
+PAS_MINUTES = 15
+NB_CRENEAUX = 24 * 60 // PAS_MINUTES
+# Nombre de journées gardées en mémoire ; les plus anciennement consultées sont oubliées au-delà
+MAX_JOURS = 400
+# Durée de vie d'une journée chargée : filet de sécurité si un message d'invalidation entre processus est perdu
+DUREE_JOUR = 600 # secondes
+
+
+def interval_mask(heure_debut, heure_fin):
+    """Bitmap des créneaux de 15 minutes touchés, même partiellement, par l'intervalle [début, fin[."""
+    debut = to_minutes(heure_debut) // PAS_MINUTES
+    fin = -(-to_minutes(heure_fin) // PAS_MINUTES)
+    if fin <= debut:
+        return 0
+    return ((1 << (fin - debut)) - 1) << debut
+
+
+class RoomOccupancy:
+    """
+    Occupation des salles par jour : {date: {salle_id: bitmap}}.
+    Une journée est chargée en une requête à la première consultation, puis tenue à jour
+    par les routes qui créent, modifient ou suppriment des cours (après le commit).
+    Chaque processus a son propre cache : les journées modifiées sont signalées aux autres processus
+    par le bus (app/backplane.py) au commit, qui les rechargent, et une journée chargée expire après DUREE_JOUR.
+    """
+
+    def __init__(self, max_jours=MAX_JOURS, duree=DUREE_JOUR):
+        self.max_jours = max_jours
+        self.duree = duree
+        self._jours = OrderedDict() # date -> bitmaps
+        self._expirations = {} # date -> expiration
+        # Incrémenté à chaque modification : une journée lue par une transaction commencée avant
+        # une modification (instantané antérieur au cours ajouté) n'est pas mise en cache
+        self.generation = 0
+        self._lock = Lock()
+
+    def _day(self, jour):
+        """
+        Copie des bitmaps de la journée, chargée si nécessaire. La requête est faite hors verrou ;
+        son résultat n'est gardé que si aucune modification n'a eu lieu depuis le début de la transaction.
+        """
+        with self._lock:
+            bitmaps = self._jours.get(jour)
+            if bitmaps is not None and time.monotonic() < self._expirations[jour]:
+                self._jours.move_to_end(jour)
+                return dict(bitmaps)
+            generation = self.generation
+        session = db.session()
+        if session.in_transaction():
+            generation = min(generation, session.info.get('generation_occupation', generation))
+        bitmaps = {}
+        lignes = session.query(Cours.salle_id, Cours.heure_debut, Cours.heure_fin).filter(Cours.date_cours == jour)
+        for salle_id, heure_debut, heure_fin in lignes:
+            bitmaps[salle_id] = bitmaps.get(salle_id, 0) | interval_mask(heure_debut, heure_fin)
+        with self._lock:
+            if generation == self.generation:
+                self._jours[jour] = bitmaps
+                self._expirations[jour] = time.monotonic() + self.duree
+                self._jours.move_to_end(jour)
+                while len(self._jours) > self.max_jours:
+                    ancien, _ = self._jours.popitem(last=False)
+                    del self._expirations[ancien]
+        return dict(bitmaps)
+
+    def add(self, salle_id, jour, heure_debut, heure_fin):
+        """Marque un créneau comme occupé (sans effet si la journée n'est pas encore chargée)."""
+        with self._lock:
+            self.generation += 1
+            bitmaps = self._jours.get(jour)
+            if bitmaps is not None:
+                bitmaps[int(salle_id)] = bitmaps.get(int(salle_id), 0) | interval_mask(heure_debut, heure_fin)
+
+    def remove(self, salle_id, jour, heure_debut, heure_fin):
+        """
+        Libère un créneau. Une salle n'accueillant qu'un cours à la fois, les créneaux entiers
+        du cours lui appartiennent ; un créneau de 15 minutes partagé avec un cours voisin
+        (horaires non alignés) oblige à recharger la journée.
+        """
+        with self._lock:
+            self.generation += 1
+            bitmaps = self._jours.get(jour)
+            if bitmaps is not None:
+                masque = interval_mask(heure_debut, heure_fin)
+                if to_minutes(heure_debut) % PAS_MINUTES or to_minutes(heure_fin) % PAS_MINUTES:
+                    self._forget([jour])
+                else:
+                    bitmaps[int(salle_id)] = bitmaps.get(int(salle_id), 0) & ~masque
+
+    def add_course(self, cours):
+        self.add(cours.salle_id, cours.date_cours, cours.heure_debut, cours.heure_fin)
+
+    def remove_course(self, cours):
+        self.remove(cours.salle_id, cours.date_cours, cours.heure_debut, cours.heure_fin)
+
+    def _forget(self, jours):
+        """Oublie les journées données (toutes si None). Appelé verrou tenu."""
+        if jours is None:
+            self._jours.clear()
+            self._expirations.clear()
+        else:
+            for jour in set(jours):
+                self._jours.pop(jour, None)
+                self._expirations.pop(jour, None)
+
+    def invalidate(self, jours=None, diffuser=True):
+        """
+        Oublie les journées données (toutes si None) ; elles seront rechargées à la demande.
+        Les autres processus en sont informés, sauf avec diffuser=False (message reçu du bus).
+        """
+        jours = None if jours is None else set(jours)
+        with self._lock:
+            self.generation += 1
+            self._forget(jours)
+        if diffuser:
+            publish('occupation_salles', None if jours is None else sorted(j.isoformat() for j in jours))
+
+    def free_rooms(self, jour, heure_debut, heure_fin, capacite_min=0, exclude_cours=None):
+        """
+        Salles libres sur [heure_debut, heure_fin[ le jour donné, d'une capacité d'au moins `capacite_min`,
+        triées par capacité croissante (la plus petite salle suffisante d'abord).
+        `exclude_cours` : cours en cours de modification, dont le propre créneau compte comme libre.
+        """
+        masque = interval_mask(heure_debut, heure_fin)
+        bitmaps = self._day(jour)
+        if exclude_cours is not None and exclude_cours.date_cours == jour:
+            bitmaps[exclude_cours.salle_id] = bitmaps.get(exclude_cours.salle_id, 0) & ~interval_mask(exclude_cours.heure_debut, exclude_cours.heure_fin)
+
+        salles = Salle.query
+        if capacite_min:
+            salles = salles.filter(Salle.capacite >= capacite_min)
+        return [
+            salle for salle in salles.order_by(Salle.capacite, Salle.nom_salle)
+            if not bitmaps.get(salle.id, 0) & masque
+        ]
+
+
+room_occupancy = RoomOccupancy()
+
+
+@subscribe('occupation_salles')
+def _days_changed(jours):
+    """Des cours ont changé dans un autre processus : les journées concernées (toutes si None) seront rechargées."""
+    room_occupancy.invalidate(None if jours is None else [date.fromisoformat(j) for j in jours], diffuser=False)
+
+
+# Les cours modifiés par l'ORM sont relevés au flush ; leurs journées sont signalées aux autres processus
+# en un seul message au commit (ce processus est tenu à jour par les routes, avec add et remove).
+@event.listens_for(Session, 'after_begin')
+def _remember_generation(session, transaction, connexion):
+    if not transaction.nested:
+        session.info['generation_occupation'] = room_occupancy.generation
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_days(session, contexte):
+    jours = session.info.setdefault('jours_occupation', set())
+    for objet in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(objet, Cours):
+            historique = inspect(objet).attrs['date_cours'].history
+            jours.update(j for j in (objet.date_cours, *historique.deleted) if j)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_changed_days(session):
+    if session.in_nested_transaction():
+        return # Savepoint : les journées sont signalées au commit de la transaction
+    jours = session.info.pop('jours_occupation', None)
+    if jours:
+        publish('occupation_salles', sorted(j.isoformat() for j in jours))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_days(session):
+    if not session.in_nested_transaction():
+        session.info.pop('jours_occupation', None)
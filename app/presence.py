@@ -0,0 +1,100 @@
+# app/presence.py
+# Présence des utilisateurs, tenue en mémoire : un signe de vie à chaque requête authentifiée et pour chaque
+# connexion Socket.IO ouverte. Le champ last_seen n'est plus écrit à chaque requête : les signes de vie
+# sont reportés en base par lots (un UPDATE groupé), au plus une fois par INTERVALLE_ECRITURE.
+# Chaque processus ne connaît que ses propres clients : la liste des utilisateurs en ligne complète
+# la présence en mémoire par last_seen, qui reflète les autres processus avec au plus un intervalle de retard.
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+from sqlalchemy import update
+from app import db
+from app.models import Utilisateur
+
+# Délai minimal entre deux reports de last_seen en base
+INTERVALLE_ECRITURE = 60 # secondes
+# Un utilisateur est en ligne s'il a une connexion Socket.IO ouverte ou une activité dans cette fenêtre
+FENETRE_EN_LIGNE = timedelta(minutes=5)
+
+_vus = {} # id utilisateur -> dernier signe de vie (UTC)
+_connexions = {} # id utilisateur -> nombre de connexions Socket.IO ouvertes
+_ecrits = {} # id utilisateur -> dernière valeur de last_seen écrite par ce processus
+_prochaine_ecriture = 0
+_lock = Lock()
+
+
+def heartbeat(user_id):
+    """Signe de vie d'un utilisateur (requête authentifiée) : aucune écriture en base."""
+    with _lock:
+        _vus[user_id] = datetime.utcnow()
+
+
+def socket_connected(user_id):
+    with _lock:
+        _connexions[user_id] = _connexions.get(user_id, 0) + 1
+        _vus[user_id] = datetime.utcnow()
+
+
+def socket_disconnected(user_id):
+    with _lock:
+        restantes = _connexions.get(user_id, 0) - 1
+        if restantes > 0:
+            _connexions[user_id] = restantes
+        else:
+            _connexions.pop(user_id, None)
+        _vus[user_id] = datetime.utcnow()
+
+
+def _activity(maintenant):
+    """{id: dernière activité} des utilisateurs en ligne dans ce processus ; une connexion ouverte compte comme présente."""
+    limite = maintenant - FENETRE_EN_LIGNE
+    activite = {user_id: vu for user_id, vu in _vus.items() if vu > limite}
+    activite.update((user_id, maintenant) for user_id in _connexions)
+    return activite
+
+
+def flush_last_seen(force=False):
+    """
+    Reporte en base, en un UPDATE groupé par clé primaire, le last_seen des utilisateurs actifs depuis
+    la dernière écriture. Sans `force`, ne fait rien si le dernier report date de moins de INTERVALLE_ECRITURE.
+    Valide la transaction : à appeler hors d'une modification en cours. Retourne le nombre d'utilisateurs mis à jour.
+    """
+    global _prochaine_ecriture
+    with _lock:
+        if not force and time.monotonic() < _prochaine_ecriture:
+            return 0
+        _prochaine_ecriture = time.monotonic() + INTERVALLE_ECRITURE
+        maintenant = datetime.utcnow()
+        lignes = [{'id': user_id, 'last_seen': vu} for user_id, vu in _activity(maintenant).items()
+                  if _ecrits.get(user_id) != vu]
+        # Les signes de vie sortis de la fenêtre sont déjà en base : la mémoire reste bornée aux utilisateurs récents
+        for user_id in [user_id for user_id, vu in _vus.items() if vu <= maintenant - FENETRE_EN_LIGNE and user_id not in _connexions]:
+            del _vus[user_id]
+            _ecrits.pop(user_id, None)
+    if not lignes:
+        return 0
+    try:
+        db.session.execute(update(Utilisateur), lignes)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        with _lock:
+            _prochaine_ecriture = 0 # nouvel essai à la prochaine requête
+        raise
+    with _lock:
+        _ecrits.update((ligne['id'], ligne['last_seen']) for ligne in lignes)
+    return len(lignes)
+
+
+def online_users():
+    """
+    Utilisateurs en ligne, du plus récemment actif au moins récent : présence en mémoire de ce processus,
+    complétée par last_seen pour les utilisateurs servis par d'autres processus.
+    """
+    maintenant = datetime.utcnow()
+    with _lock:
+        activite = _activity(maintenant)
+    utilisateurs = Utilisateur.query.filter(db.or_(
+        Utilisateur.id.in_(list(activite)), Utilisateur.last_seen > maintenant - FENETRE_EN_LIGNE
+    )).all()
+    return sorted(utilisateurs, key=lambda u: max(activite.get(u.id, u.last_seen), u.last_seen or datetime.min), reverse=True)
@@ -0,0 +1,61 @@
+# app/realtime.py
+# Envoi en temps réel par Socket.IO : chaque utilisateur connecté rejoint sa room personnelle,
+# la room de son rôle et la room commune ; les nouvelles notifications et les compteurs de non-lus
+# y sont poussés au moment où ils changent, au lieu d'être redemandés par les pages.
+from app import db, socketio
+from app.models import Utilisateur
+from app.notifications import course_recipients, unread_counts
+from app.counters import unread_counters
+
+
+def user_room(user_id):
+    return f"utilisateur_{user_id}"
+
+
+def role_room(role):
+    """Room d'un rôle ('etudiant', 'enseignant', 'administrateur'), ou de tout le monde pour 'all'."""
+    return f"role_{role}"
+
+
+def notification_event(titre, message, date_creation, non_lues=None):
+    """Contenu de l'événement 'notification' ; `non_lues` : nouveau nombre de notifications non lues du destinataire."""
+    evenement = {'titre': titre, 'message': message, 'date_creation': date_creation.isoformat() + 'Z'}
+    if non_lues is not None:
+        evenement['non_lues'] = non_lues
+    return evenement
+
+
+def push_broadcast(notification):
+    """Pousse une annonce de rôle (ou générale) à la room correspondante."""
+    socketio.emit('notification', notification_event(notification.titre, notification.message, notification.date_creation),
+                  to=role_room(notification.destinataire_role))
+
+
+def push_course_notification(enseignant_id, affectations, titre, message, date_creation, autres_enseignants=()):
+    """
+    Pousse une notification de cours à chacun de ses destinataires, avec son nombre de non-lues :
+    une seule requête groupée pour tous les compteurs, puis un événement par room personnelle.
+    À appeler après le commit des notifications.
+    """
+    destinataires = course_recipients(enseignant_id, affectations, autres_enseignants).subquery()
+    compteurs = unread_counts(db.select(destinataires.c.id))
+    for destinataire_id, non_lues in compteurs.items():
+        socketio.emit('notification', notification_event(titre, message, date_creation, non_lues), to=user_room(destinataire_id))
+
+
+def push_unread_counts(user_id, notifications=None, messages=None):
+    """Pousse les compteurs de non-lus qui ont changé (notifications et/ou messages) à un utilisateur."""
+    compteurs = {}
+    if notifications is not None:
+        compteurs['notifications'] = notifications
+    if messages is not None:
+        compteurs['messages'] = messages
+    if compteurs:
+        socketio.emit('compteurs_non_lus', compteurs, to=user_room(user_id))
+
+
+def push_message_count(user_id):
+    """Pousse à un utilisateur son nombre de messages non lus (après un envoi qui lui est destiné)."""
+    utilisateur = db.session.get(Utilisateur, user_id)
+    if utilisateur is not None:
+        push_unread_counts(user_id, messages=unread_counters(utilisateur)[1])
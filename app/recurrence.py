@@ -0,0 +1,150 @@
+# app/recurrence.py
+# Génération et mise à jour en masse des occurrences d'une série de cours récurrente.
+from datetime import datetime, timedelta
+from sqlalchemy import insert, delete, update
+from app import db
+from app.models import Cours, CoursAffectation, Groupe, SerieOccurrence
+from app.conflicts import ConflictIndex, resource_keys, resolve_groups
+from app.timetable_import import insert_returning_ids
+
+
+def parse_exclusions(texte):
+    """
+    Convertit une liste de dates (AAAA-MM-JJ, séparées par des virgules, espaces ou retours à la ligne)
+    en un ensemble de dates. Lève ValueError si une date est invalide.
+    """
+    dates = set()
+    for morceau in (texte or '').replace('\n', ',').replace(' ', ',').split(','):
+        morceau = morceau.strip()
+        if morceau:
+            try:
+                dates.add(datetime.strptime(morceau, '%Y-%m-%d').date())
+            except ValueError:
+                raise ValueError(f"Date d'exclusion invalide : « {morceau} » (format attendu AAAA-MM-JJ).")
+    return dates
+
+
+def format_exclusions(dates):
+    """Sérialise un ensemble de dates pour la colonne SerieCours.dates_exclues."""
+    return ','.join(d.isoformat() for d in sorted(dates))
+
+
+def expand_occurrences(date_debut, date_fin, intervalle_semaines=1, exclusions=()):
+    """Retourne toutes les dates d'occurrence entre date_debut et date_fin (incluses), hors exclusions."""
+    pas = timedelta(weeks=intervalle_semaines)
+    dates = []
+    courante = date_debut
+    while courante <= date_fin:
+        if courante not in exclusions:
+            dates.append(courante)
+        courante += pas
+    return dates
+
+
+def in_series(serie_id):
+    """Condition sur Cours : occurrences de la série (table de liaison series_occurrences)."""
+    return Cours.id.in_(db.select(SerieOccurrence.cours_id).where(SerieOccurrence.serie_id == serie_id))
+
+
+def series_dates(serie):
+    """Dates d'occurrence attendues pour une série, d'après sa règle de récurrence."""
+    return expand_occurrences(serie.date_debut, serie.date_fin, serie.intervalle_semaines, parse_exclusions(serie.dates_exclues))
+
+
+def check_series_conflicts(dates, heure_debut, heure_fin, enseignant_id, salle_id, groupes_ids, exclude_serie_id=None):
+    """
+    Vérifie toutes les occurrences d'une série en un seul lot :
+    un chargement des cours existants sur la période, puis une recherche par occurrence dans l'index.
+    """
+    if not dates:
+        return []
+    affectations = resolve_groups(groupes_ids)
+    index = ConflictIndex.load(
+        min(dates), max(dates),
+        enseignant_ids=[int(enseignant_id)], salle_ids=[int(salle_id)], affectations=affectations
+    )
+    if exclude_serie_id is not None:
+        # Les occurrences de la série modifiée ne doivent pas entrer en conflit avec elles-mêmes
+        propres = db.session.query(Cours.id).filter(in_series(exclude_serie_id), Cours.date_cours.between(min(dates), max(dates)))
+        for (cours_id,) in propres:
+            index.remove(cours_id)
+
+    cles = resource_keys(enseignant_id, salle_id, affectations)
+    conflits = []
+    for date_cours in dates:
+        conflits.extend(index.find(date_cours, heure_debut, heure_fin, cles))
+    return conflits
+
+
+def _insert_affectations(serie, depuis, dates=None):
+    """Crée les affectations des occurrences de la série par un unique INSERT ... SELECT."""
+    groupes_ids = [g.id for g in serie.groupes]
+    if not groupes_ids:
+        return
+    selection = db.select(Cours.id, Groupe.id, Groupe.filiere_id, Groupe.niveau_id)\
+        .select_from(Cours).join(Groupe, Groupe.id.in_(groupes_ids))\
+        .where(in_series(serie.id), Cours.date_cours >= depuis)
+    if dates is not None:
+        selection = selection.where(Cours.date_cours.in_(dates))
+    db.session.execute(
+        insert(CoursAffectation).from_select(['cours_id', 'groupe_id', 'filiere_id', 'niveau_id'], selection)
+    )
+
+
+def insert_occurrences(serie, dates):
+    """
+    Insère les occurrences données d'une série, leurs liens avec la série (un INSERT multi-lignes)
+    puis leurs affectations. La transaction n'est pas validée ici.
+    """
+    if not dates:
+        return 0
+    ids = insert_returning_ids(Cours, [
+        {
+            'matiere_id': serie.matiere_id, 'enseignant_id': serie.enseignant_id, 'salle_id': serie.salle_id,
+            'date_cours': date_cours, 'heure_debut': serie.heure_debut, 'heure_fin': serie.heure_fin,
+            'description': serie.description,
+        }
+        for date_cours in dates
+    ])
+    db.session.execute(insert(SerieOccurrence), [{'cours_id': cours_id, 'serie_id': serie.id} for cours_id in ids])
+    _insert_affectations(serie, min(dates), dates)
+    return len(dates)
+
+
+def delete_courses(cours_ids):
+    """Supprime des cours par lot avec leurs affectations et leurs liens de série. La transaction n'est pas validée ici."""
+    if not cours_ids:
+        return
+    db.session.execute(delete(CoursAffectation).where(CoursAffectation.cours_id.in_(cours_ids)))
+    db.session.execute(delete(SerieOccurrence).where(SerieOccurrence.cours_id.in_(cours_ids)))
+    db.session.execute(delete(Cours).where(Cours.id.in_(cours_ids)).execution_options(synchronize_session=False))
+
+
+def update_future_occurrences(serie, depuis):
+    """
+    Aligne les occurrences à partir de `depuis` sur l'état actuel de la série, sans boucle d'éditions :
+    - un UPDATE pour les champs communs (matière, enseignant, salle, horaires, description) ;
+    - un DELETE + INSERT ... SELECT pour les affectations ;
+    - un DELETE pour les dates qui ne font plus partie de la série, un INSERT pour les nouvelles.
+    Retourne le nombre d'occurrences futures après mise à jour.
+    """
+    futures = in_series(serie.id), Cours.date_cours >= depuis
+    attendues = {d for d in series_dates(serie) if d >= depuis}
+    existantes = {d for (d,) in db.session.query(Cours.date_cours).filter(*futures)}
+
+    # Occurrences supprimées (date de fin avancée, nouvelle exclusion, changement de fréquence...)
+    obsoletes = existantes - attendues
+    if obsoletes:
+        delete_courses([i for (i,) in db.session.query(Cours.id).filter(*futures, Cours.date_cours.in_(obsoletes))])
+
+    db.session.execute(update(Cours).where(*futures).values(
+        matiere_id=serie.matiere_id, enseignant_id=serie.enseignant_id, salle_id=serie.salle_id,
+        heure_debut=serie.heure_debut, heure_fin=serie.heure_fin, description=serie.description
+    ).execution_options(synchronize_session=False))
+
+    ids_futurs = db.select(Cours.id).where(*futures)
+    db.session.execute(delete(CoursAffectation).where(CoursAffectation.cours_id.in_(ids_futurs)))
+    _insert_affectations(serie, depuis, sorted(existantes & attendues))
+
+    insert_occurrences(serie, sorted(attendues - existantes))
+    return len(attendues)
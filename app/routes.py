@@ -1,11 +1,26 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app, jsonify, Response, stream_with_context, abort
 from flask_login import login_required, current_user, login_user, logout_user
-from app import db, mail, socketio
+from app import db, socketio
 from app import login_manager
-from flask_mail import Message
-from app.models import Utilisateur, Filiere, Niveau, Groupe, Cours, CoursAffectation, Notification, DisponibiliteEnseignant, Matiere, Salle, Conversation, Message, Enseigne
+from app.models import Utilisateur, Filiere, Niveau, Groupe, Cours, CoursAffectation, Notification, DisponibiliteEnseignant, Matiere, Salle, Conversation, Message, Enseigne, SerieCours, SerieOccurrence, Tache, AnnonceLue
 from datetime import datetime, timedelta
 from .decorators import role_required
+from .conflicts import find_conflicts, format_conflict, resolve_groups, ConflictIndex, resource_keys, occupied_keys
+from .recurrence import parse_exclusions, format_exclusions, series_dates, check_series_conflicts, insert_occurrences, update_future_occurrences, in_series, delete_courses
+from .occupancy import room_occupancy
+from .schedule import week_courses, schedule_filters, timetable_cache, cohort_filter, timetable_page, decode_cursor, timetable_row_json, SEMAINES_AFFICHEES, feed_validators, invalidate_timetables
+from .calendar_feed import feed_token, read_feed_token, feed_scope, generate_ics
+from .messaging import inbox_conversations, message_page, decode_message_cursor, message_json, post_message, new_message_event, other_participant_id
+from .counters import unread_counters, add_role_notifications, add_messages, invalidate_counters
+from .notifications import course_audience, visible_to, unread_ids, mark_all_read, mark_read, history_page, decode_history_cursor
+from .jobs import enqueue, enqueue_coalesced, merge_course_notification, retry_job
+from .realtime import user_room, role_room, push_broadcast, push_unread_counts, push_message_count
+from .presence import socket_connected, socket_disconnected, flush_last_seen, online_users as presence_online_users
+from .identity import identity_cache, invalidate_identity
+from .availability import refresh_teacher_mask, is_available, find_availability_violations
+from .student_import import read_students_file, validate_students, student_rows, COLONNES_ETUDIANTS, COLONNES_ETUDIANTS_OPTIONNELLES
+from .timetable_import import read_timetable_file, validate_timetable, insert_timetable, bulk_insert_courses, COLONNES_REQUISES, COLONNES_OPTIONNELLES
+from . import solver
 from sqlalchemy import or_, and_, func # Importation des fonctions pour les requêtes complexes
 from sqlalchemy.exc import IntegrityError # Pour gérer les erreurs de contrainte unique
 from flask_socketio import emit, join_room, leave_room
@@ -14,6 +29,7 @@ import secrets
 from PIL import Image
 import uuid
 from werkzeug.utils import secure_filename
+from werkzeug.http import is_resource_modified
 
 # Crée un Blueprint pour les routes principales
 main_bp = Blueprint('main', __name__)
@@ -26,16 +42,14 @@ def allowed_file(filename):
 def inject_global_vars():
     """Injecte des variables globales dans le contexte de tous les templates."""
     if current_user.is_authenticated:
-        # Compte les notifications personnelles non lues
-        unread_notifications = Notification.query.filter_by(destinataire_id=current_user.id, est_lue=False).count()
-        # Compte les messages privés non lus
-        unread_messages = current_user.new_messages_count()
+        # Notifications et messages non lus : compteurs tenus à jour, lus par clé primaire
+        unread_notifications, unread_messages = unread_counters(current_user)
         return dict(unread_count=unread_notifications, unread_messages_count=unread_messages)
     return dict(unread_count=0, unread_messages_count=0)
 
 def save_profile_picture(form_picture):
     """
-    Sauvegarde et redimensionne la photo de profil de l'utilisateur.
+    Sauvegarde la photo de profil de l'utilisateur ; le redimensionnement est confié à la file de tâches.
     Génère un nom de fichier aléatoire pour éviter les conflits.
     """
     random_hex = secrets.token_hex(8)
@@ -47,17 +61,20 @@ def save_profile_picture(form_picture):
     # S'assurer que le dossier de destination existe
     os.makedirs(os.path.dirname(picture_path), exist_ok=True)
 
-    # Redimensionner l'image pour économiser de l'espace et standardiser
-    output_size = (150, 150)
-    i = Image.open(form_picture)
-    i.thumbnail(output_size)
-    i.save(picture_path)
+    # Vérifier que le fichier est bien une image avant de l'enregistrer tel quel
+    Image.open(form_picture).verify()
+    form_picture.seek(0)
+    form_picture.save(picture_path)
+
+    # Redimensionner l'image pour économiser de l'espace et standardiser (en tâche de fond)
+    enqueue('miniature', fichier=f'profile_pics/{picture_fn}', largeur=150, hauteur=150)
 
     return picture_fn
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Utilisateur.query.get(int(user_id))
+    """Identité en cache (voir app/identity.py) : pas de requête SQL tant qu'elle est valide."""
+    return identity_cache.get(int(user_id))
 
 @main_bp.route('/dashboard')
 @login_required
@@ -78,58 +95,111 @@ def dashboard():
     # Si on arrive ici, l'utilisateur est un étudiant
     emploi_du_temps = []
     prochain_cours = None
+    lundi = None
     
-    # Logique améliorée pour récupérer l'emploi du temps d'un étudiant
+    # Emploi du temps de la cohorte (filière, niveau, groupe), servi depuis le cache partagé
     if current_user.filiere_id and current_user.niveau_id:
-        # Requête pour trouver toutes les affectations pertinentes pour l'étudiant :
-        # Celles pour sa filière/niveau (cours magistraux)
-        # ET celles pour son groupe spécifique (TD/TP), s'il en a un.
-        query_conditions = [
-            and_(
-                CoursAffectation.filiere_id == current_user.filiere_id,
-                CoursAffectation.niveau_id == current_user.niveau_id,
-                CoursAffectation.groupe_id == None
-            )
-        ]
-        if current_user.groupe_id:
-            query_conditions.append(CoursAffectation.groupe_id == current_user.groupe_id)
-        
-        affectations = CoursAffectation.query.filter(or_(*query_conditions)).all()
-        
-        if affectations:
-            cours_ids = {affectation.cours_id for affectation in affectations} # Utilisation d'un set pour éviter les doublons
-            
-            # Récupérer les cours correspondants et les trier
-            emploi_du_temps = Cours.query.filter(Cours.id.in_(cours_ids)).order_by(Cours.date_cours, Cours.heure_debut).all()
-
-            # Trouver le prochain cours
-            now = datetime.now()
-            prochain_cours = Cours.query.filter(
-                Cours.id.in_(cours_ids),
-                Cours.date_cours >= now.date()
-            ).order_by(Cours.date_cours, Cours.heure_debut).filter(
-                (Cours.date_cours > now.date()) | ((Cours.date_cours == now.date()) & (Cours.heure_fin > now.time()))
-            ).first()
+        now = datetime.now()
+        lundi = now.date() - timedelta(days=now.weekday())
+        emploi_du_temps = timetable_cache.get(current_user.filiere_id, current_user.niveau_id, current_user.groupe_id, lundi)
+
+        # Le prochain cours est le premier de la liste (triée) qui n'est pas encore terminé
+        prochain_cours = next((
+            c for c in emploi_du_temps
+            if c.date_cours > now.date() or (c.date_cours == now.date() and c.heure_fin > now.time())
+        ), None)
 
     # Récupérer les notifications pertinentes pour l'utilisateur connecté
-    notifications = Notification.query.filter(
-        or_(
-            Notification.destinataire_role == 'all', # Notifications pour tout le monde
-            Notification.destinataire_role == current_user.role, # Notifications pour son rôle
-            Notification.destinataire_id == current_user.id # Notifications personnelles
-        )
-    ).order_by(Notification.date_creation.desc()).limit(5).all()
+    # (annonces générales, annonces de son rôle et notifications personnelles)
+    notifications = Notification.query.filter(visible_to(current_user)).order_by(Notification.date_creation.desc()).limit(5).all()
+    non_lues = unread_ids(current_user, [n.id for n in notifications])
+
+    # Fin de la fenêtre affichée : les semaines suivantes sont chargées à la demande via /api/timetable
+    fenetre = (lundi, lundi + timedelta(weeks=SEMAINES_AFFICHEES, days=-1)) if lundi else None
+    lien_calendrier = url_for('main.calendar_feed', jeton=feed_token('utilisateur', current_user.id), _external=True) if lundi else None
+    return render_template('utilisateur/dashboard.html', emploi_du_temps=emploi_du_temps, prochain_cours=prochain_cours, notifications=notifications, non_lues=non_lues, fenetre=fenetre, lien_calendrier=lien_calendrier)
+
+def timetable_filter_for(user):
+    """Condition SQL sur Cours donnant l'emploi du temps d'un utilisateur (None s'il n'en a pas)."""
+    if user.role == 'enseignant':
+        return Cours.enseignant_id == user.id
+    if user.role == 'etudiant' and user.filiere_id and user.niveau_id:
+        return cohort_filter(user.filiere_id, user.niveau_id, user.groupe_id)
+    return None
+
+@main_bp.route('/api/timetable')
+@login_required
+def timetable_api():
+    """
+    Emploi du temps de l'utilisateur connecté, par fenêtre de dates et par page.
+    Paramètres : debut et fin (AAAA-MM-JJ, par défaut la semaine en cours et les suivantes),
+    apres (curseur renvoyé par la page précédente) et limite (50 par défaut, 200 au plus).
+    """
+    filtre = timetable_filter_for(current_user)
+    if filtre is None:
+        return jsonify({'error': "Aucun emploi du temps n'est associé à ce compte."}), 403
 
-    return render_template('utilisateur/dashboard.html', emploi_du_temps=emploi_du_temps, prochain_cours=prochain_cours, notifications=notifications)
+    aujourd_hui = datetime.now().date()
+    try:
+        debut = datetime.strptime(request.args['debut'], '%Y-%m-%d').date() if request.args.get('debut') else aujourd_hui - timedelta(days=aujourd_hui.weekday())
+        fin = datetime.strptime(request.args['fin'], '%Y-%m-%d').date() if request.args.get('fin') else debut + timedelta(weeks=SEMAINES_AFFICHEES, days=-1)
+        apres = decode_cursor(request.args['apres']) if request.args.get('apres') else None
+    except ValueError:
+        return jsonify({'error': 'Paramètres debut, fin ou apres invalides.'}), 400
+    if fin < debut or (fin - debut).days > 92:
+        return jsonify({'error': 'La fenêtre doit être comprise entre 1 et 93 jours.'}), 400
+    limite = min(max(request.args.get('limite', 50, type=int), 1), 200)
+
+    cours, suivant = timetable_page(filtre, debut, fin, apres, limite)
+    duree = fin - debut + timedelta(days=1)
+    return jsonify({
+        'cours': [timetable_row_json(c) for c in cours],
+        'suivant': suivant,
+        'debut': debut.isoformat(),
+        'fin': fin.isoformat(),
+        'fenetre_suivante': {'debut': (fin + timedelta(days=1)).isoformat(), 'fin': (fin + duree).isoformat()},
+    })
+
+@main_bp.route('/calendar/<jeton>.ics')
+def calendar_feed(jeton):
+    """
+    Flux iCalendar d'abonnement, sans connexion : le jeton signé identifie l'utilisateur ou la salle.
+    Les clients qui interrogent le flux régulièrement reçoivent un 304 tant que rien n'a changé.
+    """
+    flux = read_feed_token(jeton)
+    perimetre = feed_scope(*flux) if flux else None
+    if perimetre is None:
+        abort(404)
+    cle, filtre, nom_calendrier = perimetre
+
+    etag, derniere_modification = feed_validators.get(cle)
+    if is_resource_modified(request.environ, etag=etag, last_modified=derniere_modification):
+        reponse = Response(stream_with_context(generate_ics(filtre, nom_calendrier, derniere_modification)), mimetype='text/calendar')
+        reponse.headers['Content-Disposition'] = 'inline; filename=emploi_du_temps.ics'
+    else:
+        reponse = Response(status=304)
+    reponse.set_etag(etag)
+    reponse.last_modified = derniere_modification
+    reponse.cache_control.private = True
+    reponse.cache_control.no_cache = True
+    return reponse
 
 @socketio.on('connect')
 @login_required
-def test_connect():
-    print('Client connecté')
+def on_connect():
+    """Chaque client rejoint sa room personnelle, celle de son rôle et celle de tout le monde (notifications poussées)."""
+    join_room(user_room(current_user.id))
+    join_room(role_room(current_user.role))
+    join_room(role_room('all'))
+    socket_connected(current_user.id)
+    flush_last_seen()
 
 @socketio.on('disconnect')
-def test_disconnect():
-    print('Client déconnecté')
+def on_disconnect():
+    """Fin d'une connexion : l'utilisateur reste en ligne tant qu'il lui en reste une ou pendant la fenêtre d'activité."""
+    if current_user.is_authenticated:
+        socket_disconnected(current_user.id)
+        flush_last_seen()
 
 @socketio.on('join')
 @login_required
@@ -148,6 +218,31 @@ def on_leave(data):
     if conversation_id:
         room = str(conversation_id)
         leave_room(room)
+
+@socketio.on('send_message')
+@login_required
+def on_send_message(data):
+    """
+    Envoi d'un message texte sans rechargement de page : un INSERT et une diffusion à la room de la conversation.
+    `cle` est une clé d'idempotence générée par le client : renvoyer le même message après une coupure ne le duplique pas.
+    La valeur retournée est l'accusé de réception transmis au client.
+    """
+    conversation = db.session.get(Conversation, data.get('conversation_id'))
+    if conversation is None or current_user.id not in [conversation.participant1_id, conversation.participant2_id]:
+        return {'ok': False, 'error': "Accès non autorisé à cette conversation."}
+    body = (data.get('body') or '').strip()
+    cle = data.get('cle') or None
+    if not body:
+        return {'ok': False, 'error': "Vous ne pouvez pas envoyer un message vide."}
+    if cle is not None and (not isinstance(cle, str) or len(cle) > 64):
+        return {'ok': False, 'error': "Clé d'envoi invalide."}
+
+    message, cree = post_message(conversation, current_user, body=body, cle=cle)
+    db.session.commit()
+    if cree:
+        socketio.emit('new_message', new_message_event(message, current_user, cle), room=str(conversation.id))
+        push_message_count(other_participant_id(conversation, current_user.id))
+    return {'ok': True, 'cle': cle, 'message': message_json(message)}
         
 @main_bp.route('/')
 def loading():
@@ -231,8 +326,9 @@ def login():
 
 def send_reset_email(user):
     """
-    Fonction d'aide pour envoyer l'email de réinitialisation.
-    Retourne True si l'envoi a réussi, False sinon.
+    Fonction d'aide pour envoyer l'email de réinitialisation : seul l'ID de l'utilisateur est mis en file,
+    le lien (et son jeton) est généré par la tâche au moment de l'envoi (nouvelles tentatives si le serveur SMTP est indisponible).
+    Retourne True si l'envoi a été planifié, False sinon.
     """
     # Vérification cruciale : les identifiants mail sont-ils configurés ?
     if not current_app.config.get('MAIL_USERNAME') or not current_app.config.get('MAIL_PASSWORD'):
@@ -240,17 +336,9 @@ def send_reset_email(user):
         flash("La fonctionnalité de réinitialisation de mot de passe n'est pas configurée sur le serveur. Veuillez contacter un administrateur.", "danger")
         return False
 
-    token = user.get_reset_token()
-    msg = Message('Demande de réinitialisation de mot de passe - UniPlanBJ',
-                  recipients=[user.email])
-    msg.html = render_template('email/reset_password.html', user=user, token=token)
-    try:
-        mail.send(msg)
-        return True
-    except Exception as e:
-        current_app.logger.error(f"Échec de l'envoi de l'email de réinitialisation : {e}")
-        flash("Une erreur est survenue lors de l'envoi de l'email. Veuillez réessayer plus tard ou contacter un administrateur.", "danger")
-        return False
+    enqueue('email_reinitialisation', utilisateur_id=user.id, url_racine=request.url_root)
+    db.session.commit()
+    return True
 
 @main_bp.route('/reset_password', methods=['GET', 'POST'])
 def request_reset_token():
@@ -306,15 +394,18 @@ def profile():
                 return redirect(request.url)
             
             if file and allowed_file(file.filename):
+                # current_user est une identité en cache, en lecture seule : la modification passe par le modèle
+                utilisateur = db.session.get(Utilisateur, current_user.id)
                 # Supprimer l'ancienne photo si ce n'est pas la photo par défaut
-                if current_user.picture != 'default.jpg':
-                    old_picture_path = os.path.join(current_app.root_path, 'static/profile_pics', current_user.picture)
+                if utilisateur.picture != 'default.jpg':
+                    old_picture_path = os.path.join(current_app.root_path, 'static/profile_pics', utilisateur.picture)
                     if os.path.exists(old_picture_path):
                         os.remove(old_picture_path)
                 
                 picture_file = save_profile_picture(file)
-                current_user.picture = picture_file
+                utilisateur.picture = picture_file
                 db.session.commit()
+                invalidate_identity(utilisateur.id)
                 flash('Votre photo de profil a été mise à jour !', 'success')
                 return redirect(url_for('main.profile'))
             else:
@@ -339,8 +430,9 @@ def delete_profile_picture():
             current_app.logger.error(f"Erreur lors de la suppression du fichier image {picture_path}: {e}")
 
         # Mettre à jour la base de données
-        current_user.picture = 'default.jpg'
+        db.session.get(Utilisateur, current_user.id).picture = 'default.jpg'
         db.session.commit()
+        invalidate_identity(current_user.id)
         flash('Votre photo de profil a été supprimée avec succès.', 'success')
     
     return redirect(url_for('main.profile'))
@@ -371,6 +463,7 @@ def change_password():
         # 4. Mettre à jour le mot de passe dans la BDD en utilisant la méthode sécurisée du modèle
         current_user.set_password(new_password)
         db.session.commit()
+        invalidate_identity(current_user.id)
 
         flash('Votre mot de passe a été mis à jour avec succès.', 'success')
         return redirect(url_for('main.profile'))
@@ -406,19 +499,11 @@ def admin_dashboard():
     pagination = query.order_by(Utilisateur.role, Utilisateur.nom).paginate(page=page, per_page=10, error_out=False)
     users = pagination.items
     
-    # Récupérer les utilisateurs actifs dans les 5 dernières minutes
-    from datetime import timedelta
-    five_minutes_ago = datetime.utcnow() - timedelta(minutes=5)
-    online_users = Utilisateur.query.filter(Utilisateur.last_seen > five_minutes_ago).order_by(Utilisateur.last_seen.desc()).all()
+    # Utilisateurs actifs dans les 5 dernières minutes ou connectés par Socket.IO (présence en mémoire)
+    online_users = presence_online_users()
 
     # Récupérer les notifications pour l'admin
-    admin_notifications = Notification.query.filter(
-        or_(
-            Notification.destinataire_role == 'all',
-            Notification.destinataire_role == 'administrateur',
-            Notification.destinataire_id == current_user.id
-        )
-    ).order_by(Notification.date_creation.desc()).limit(5).all()
+    admin_notifications = Notification.query.filter(visible_to(current_user)).order_by(Notification.date_creation.desc()).limit(5).all()
 
     # Récupérer aussi la liste des cours pour l'afficher
     all_courses = Cours.query.order_by(Cours.date_cours.desc(), Cours.heure_debut.desc()).all()
@@ -451,36 +536,17 @@ def schedule_viewer():
     days_of_week = [start_of_week + timedelta(days=i) for i in range(7)]
     end_of_week = days_of_week[6]
 
-    # Base query for courses within the selected week
-    query = Cours.query.filter(Cours.date_cours.between(start_of_week, end_of_week))
-
-    # Apply filters
-    if enseignant_id:
-        query = query.filter(Cours.enseignant_id == enseignant_id)
-    if salle_id:
-        query = query.filter(Cours.salle_id == salle_id)
-    
-    if filiere_id or niveau_id:
-        query = query.join(Cours.cours_affectations)
-        if filiere_id:
-            query = query.filter(CoursAffectation.filiere_id == filiere_id)
-        if niveau_id:
-            query = query.filter(CoursAffectation.niveau_id == niveau_id)
-
-    # Fetch and organize courses by day
-    courses = query.order_by(Cours.heure_debut).all()
+    # Une seule requête projetée (noms joints, sans doublons), puis répartition par jour
+    courses = week_courses(start_of_week, end_of_week, filiere_id, niveau_id, enseignant_id, salle_id)
     schedule_by_day = [[] for _ in range(7)]
     for course in courses:
         day_index = course.date_cours.weekday()
         schedule_by_day[day_index].append(course)
 
-    # Data for filter dropdowns
-    filieres = Filiere.query.order_by(Filiere.nom_filiere).all()
-    niveaux = Niveau.query.order_by(Niveau.id).all()
-    enseignants = Utilisateur.query.filter_by(role='enseignant').order_by(Utilisateur.nom).all()
-    salles = Salle.query.order_by(Salle.nom_salle).all()
+    # Data for filter dropdowns (mises en cache)
+    filtres = schedule_filters()
 
-    return render_template('admin/schedule_viewer.html', schedule_by_day=schedule_by_day, days_of_week=days_of_week, week_offset=week_offset, filieres=filieres, niveaux=niveaux, enseignants=enseignants, salles=salles, filiere_id=filiere_id, niveau_id=niveau_id, enseignant_id=enseignant_id, salle_id=salle_id)
+    return render_template('admin/schedule_viewer.html', schedule_by_day=schedule_by_day, days_of_week=days_of_week, week_offset=week_offset, **filtres, filiere_id=filiere_id, niveau_id=niveau_id, enseignant_id=enseignant_id, salle_id=salle_id)
 
 @main_bp.route('/admin/statistics')
 @login_required
@@ -562,6 +628,14 @@ def admin_availabilities():
         
     return render_template('admin/availabilities.html', avail_by_teacher=avail_by_teacher)
 
+@main_bp.route('/admin/availabilities/violations')
+@login_required
+@role_required('administrateur')
+def availability_violations():
+    """Liste les cours à venir placés en dehors des disponibilités déclarées par leur enseignant."""
+    cours = find_availability_violations()
+    return render_template('admin/availability_violations.html', cours=cours)
+
 @main_bp.route('/admin/create_notification', methods=['POST'])
 @login_required
 @role_required('administrateur')
@@ -587,7 +661,9 @@ def create_notification():
         destinataire_id=None  # C'est une annonce de rôle/globale, pas personnelle
     )
     db.session.add(new_notification)
+    add_role_notifications(role)
     db.session.commit()
+    push_broadcast(new_notification)
     flash('Annonce créée et envoyée avec succès.', 'success')
     return redirect(url_for('main.admin_dashboard'))
 
@@ -603,6 +679,9 @@ def delete_notification(notification_id):
         flash("Action non autorisée. Vous ne pouvez supprimer que les annonces générales.", 'danger')
         return redirect(url_for('main.admin_dashboard'))
 
+    # Les lectures individuelles de l'annonce disparaissent avec elle
+    AnnonceLue.query.filter_by(notification_id=notif_to_delete.id).delete(synchronize_session=False)
+    invalidate_counters(roles=[notif_to_delete.destinataire_role])
     db.session.delete(notif_to_delete)
     db.session.commit()
     flash('Annonce supprimée avec succès.', 'success')
@@ -633,6 +712,8 @@ def edit_notification(notification_id):
             flash("Rôle de destinataire invalide.", 'danger')
             return render_template('admin/edit_notification.html', notification=notif_to_edit)
 
+        if notif_to_edit.destinataire_role != role:
+            invalidate_counters(roles=[notif_to_edit.destinataire_role, role])
         notif_to_edit.titre = title
         notif_to_edit.message = message
         notif_to_edit.destinataire_role = role
@@ -661,27 +742,15 @@ def create_course():
         heure_debut = datetime.strptime(heure_debut_str, '%H:%M').time()
         heure_fin = datetime.strptime(heure_fin_str, '%H:%M').time()
 
-        # --- Vérification des conflits ---
-        # 1. Conflit pour l'enseignant
-        conflit_enseignant = Cours.query.filter(
-            Cours.enseignant_id == enseignant_id,
-            Cours.date_cours == date_cours,
-            Cours.heure_debut < heure_fin,
-            Cours.heure_fin > heure_debut
-        ).first()
-        if conflit_enseignant:
-            flash(f"Conflit d'horaire : L'enseignant est déjà occupé à ce créneau.", 'danger')
+        # --- Vérification des conflits (enseignant, salle, groupes et leurs promotions en une passe) ---
+        affectations = resolve_groups(groupes_ids)
+        conflits = find_conflicts(date_cours, heure_debut, heure_fin, enseignant_id, salle_id, affectations)
+        if conflits:
+            for conflit in conflits:
+                flash(format_conflict(conflit), 'danger')
             return redirect(url_for('main.create_course'))
-
-        # 2. Conflit pour la salle
-        conflit_salle = Cours.query.filter(
-            Cours.salle_id == salle_id,
-            Cours.date_cours == date_cours,
-            Cours.heure_debut < heure_fin,
-            Cours.heure_fin > heure_debut
-        ).first()
-        if conflit_salle:
-            flash(f"Conflit d'horaire : La salle est déjà occupée à ce créneau.", 'danger')
+        if not is_available(enseignant_id, date_cours, heure_debut, heure_fin):
+            flash("Ce créneau est en dehors des disponibilités déclarées par l'enseignant.", 'danger')
             return redirect(url_for('main.create_course'))
 
         # Création du cours
@@ -694,12 +763,11 @@ def create_course():
         db.session.flush() # Pour obtenir l'ID du nouveau cours
 
         # Création des affectations
-        for groupe_id in groupes_ids:
-            groupe = Groupe.query.get(groupe_id)
-            affectation = CoursAffectation(cours_id=nouveau_cours.id, groupe_id=groupe.id, filiere_id=groupe.filiere_id, niveau_id=groupe.niveau_id)
-            db.session.add(affectation)
+        for a in affectations:
+            db.session.add(CoursAffectation(cours_id=nouveau_cours.id, groupe_id=a.groupe_id, filiere_id=a.filiere_id, niveau_id=a.niveau_id))
 
         db.session.commit()
+        room_occupancy.add_course(nouveau_cours)
         flash('Le cours a été créé et publié avec succès.', 'success')
         return redirect(url_for('main.admin_dashboard'))
 
@@ -710,6 +778,107 @@ def create_course():
     groupes = Groupe.query.join(Niveau).order_by(Niveau.id, Groupe.nom_groupe).all()
     return render_template('admin/create_course.html', matieres=matieres, enseignants=enseignants, salles=salles, groupes=groupes)
 
+@main_bp.route('/admin/import_courses', methods=['GET', 'POST'])
+@login_required
+@role_required('administrateur')
+def import_courses():
+    """Importe un emploi du temps complet depuis un fichier CSV ou Excel."""
+    rapport = None
+    if request.method == 'POST':
+        fichier = request.files.get('fichier')
+        if not fichier or fichier.filename == '':
+            flash('Aucun fichier sélectionné.', 'warning')
+            return redirect(url_for('main.import_courses'))
+
+        try:
+            df = read_timetable_file(fichier)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('main.import_courses'))
+
+        df, affectations, erreurs = validate_timetable(df)
+        lignes_valides = [ligne for ligne in df.index if ligne not in erreurs]
+        ignorer_erreurs = request.form.get('ignorer_erreurs') == 'on'
+
+        cours_crees = 0
+        if lignes_valides and (not erreurs or ignorer_erreurs):
+            try:
+                cours_crees = insert_timetable(df, affectations, lignes_valides)
+                db.session.commit()
+                room_occupancy.invalidate(df.loc[lignes_valides, 'jour'].dt.date)
+                invalidate_timetables(
+                    ((g, None, None) for g in affectations.loc[affectations['ligne'].isin(lignes_valides), 'groupe_id']),
+                    enseignant_ids=set(df.loc[lignes_valides, 'enseignants_id']), salle_ids=set(df.loc[lignes_valides, 'salles_id'])
+                )
+            except IntegrityError:
+                db.session.rollback()
+                flash("Une erreur d'intégrité est survenue : aucun cours n'a été importé.", 'danger')
+                cours_crees = 0
+
+        rapport = {
+            'total': len(df),
+            'cours_crees': cours_crees,
+            'erreurs': sorted(erreurs.items()),
+            'ignorer_erreurs': ignorer_erreurs,
+        }
+        if cours_crees:
+            flash(f'{cours_crees} cours ont été importés avec succès.', 'success')
+        elif erreurs and not ignorer_erreurs:
+            flash("Le fichier contient des erreurs : aucun cours n'a été importé.", 'danger')
+
+    return render_template('admin/import_courses.html', rapport=rapport, colonnes=COLONNES_REQUISES + COLONNES_OPTIONNELLES)
+
+@main_bp.route('/admin/import_students', methods=['GET', 'POST'])
+@login_required
+@role_required('administrateur')
+def import_students():
+    """
+    Importe des comptes étudiants depuis un fichier CSV ou Excel. Le fichier est validé ici ; les comptes sont créés
+    par le worker des tâches de fond, par lots (hachage des mots de passe lent), et reçoivent un lien pour choisir leur mot de passe.
+    """
+    rapport = None
+    if request.method == 'POST':
+        fichier = request.files.get('fichier')
+        if not fichier or fichier.filename == '':
+            flash('Aucun fichier sélectionné.', 'warning')
+            return redirect(url_for('main.import_students'))
+
+        try:
+            df = read_students_file(fichier)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('main.import_students'))
+
+        df, erreurs = validate_students(df)
+        lignes_valides = [ligne for ligne in df.index if ligne not in erreurs]
+        ignorer_erreurs = request.form.get('ignorer_erreurs') == 'on'
+        envoyer_emails = request.form.get('envoyer_emails') == 'on'
+        if envoyer_emails and (not current_app.config.get('MAIL_USERNAME') or not current_app.config.get('MAIL_PASSWORD')):
+            flash("L'envoi d'e-mails n'est pas configuré sur le serveur : les comptes seront créés sans e-mail.", 'warning')
+            envoyer_emails = False
+
+        comptes_planifies = 0
+        if lignes_valides and (not erreurs or ignorer_erreurs):
+            lignes = student_rows(df, lignes_valides)
+            taille = current_app.config['IMPORT_ETUDIANTS_LOT']
+            for i in range(0, len(lignes), taille):
+                enqueue('import_etudiants', lignes=lignes[i:i + taille], envoyer_emails=envoyer_emails, url_racine=request.url_root)
+            db.session.commit()
+            comptes_planifies = len(lignes)
+
+        rapport = {
+            'total': len(df),
+            'comptes_planifies': comptes_planifies,
+            'erreurs': sorted(erreurs.items()),
+            'ignorer_erreurs': ignorer_erreurs,
+        }
+        if comptes_planifies:
+            flash(f"{comptes_planifies} compte(s) étudiant(s) en cours de création : suivez l'avancement dans la file de tâches.", 'success')
+        elif erreurs and not ignorer_erreurs:
+            flash("Le fichier contient des erreurs : aucun compte n'a été créé.", 'danger')
+
+    return render_template('admin/import_students.html', rapport=rapport, colonnes=COLONNES_ETUDIANTS + COLONNES_ETUDIANTS_OPTIONNELLES)
+
 @main_bp.route('/admin/edit_course/<int:course_id>', methods=['GET', 'POST'])
 @login_required
 @role_required('administrateur')
@@ -718,58 +887,49 @@ def edit_course(course_id):
 
     if request.method == 'POST':
         # Récupération des données
-        course_to_edit.matiere_id = request.form.get('matiere_id')
-        course_to_edit.enseignant_id = request.form.get('enseignant_id')
-        course_to_edit.salle_id = request.form.get('salle_id')
+        enseignant_id = request.form.get('enseignant_id')
+        salle_id = request.form.get('salle_id')
         date_cours = datetime.strptime(request.form.get('date_cours'), '%Y-%m-%d').date()
         heure_debut = datetime.strptime(request.form.get('heure_debut'), '%H:%M').time()
         heure_fin = datetime.strptime(request.form.get('heure_fin'), '%H:%M').time()
-        course_to_edit.description = request.form.get('description')
+        groupes_ids = request.form.getlist('groupes_ids')
+
+        # Vérification des conflits (excluant le cours actuel) avant toute modification de l'objet
+        affectations = resolve_groups(groupes_ids)
+        conflits = find_conflicts(date_cours, heure_debut, heure_fin, enseignant_id, salle_id, affectations, exclude_cours_id=course_id)
+        if conflits:
+            for conflit in conflits:
+                flash(format_conflict(conflit), 'danger')
+            return redirect(url_for('main.edit_course', course_id=course_id))
+        if not is_available(enseignant_id, date_cours, heure_debut, heure_fin):
+            flash("Ce créneau est en dehors des disponibilités déclarées par l'enseignant.", 'danger')
+            return redirect(url_for('main.edit_course', course_id=course_id))
 
-        # CORRECTION : Assigner les nouvelles dates et heures à l'objet cours
+        ancien_creneau = (course_to_edit.salle_id, course_to_edit.date_cours, course_to_edit.heure_debut, course_to_edit.heure_fin)
+        course_to_edit.matiere_id = request.form.get('matiere_id')
+        course_to_edit.enseignant_id = enseignant_id
+        course_to_edit.salle_id = salle_id
+        course_to_edit.description = request.form.get('description')
         course_to_edit.date_cours = date_cours
         course_to_edit.heure_debut = heure_debut
         course_to_edit.heure_fin = heure_fin
 
-        # Logique de vérification des conflits (excluant le cours actuel)
-        conflit_enseignant = Cours.query.filter(
-            Cours.id != course_id,
-            Cours.enseignant_id == course_to_edit.enseignant_id,
-            Cours.date_cours == date_cours,
-            Cours.heure_debut < heure_fin,
-            Cours.heure_fin > heure_debut
-        ).first()
-        if conflit_enseignant:
-            flash(f"Conflit: L'enseignant est déjà occupé à ce créneau.", 'danger')
-            return redirect(url_for('main.edit_course', course_id=course_id))
-
-        conflit_salle = Cours.query.filter(
-            Cours.id != course_id,
-            Cours.salle_id == course_to_edit.salle_id,
-            Cours.date_cours == date_cours,
-            Cours.heure_debut < heure_fin,
-            Cours.heure_fin > heure_debut
-        ).first()
-        if conflit_salle:
-            flash(f"Conflit: La salle est déjà occupée à ce créneau.", 'danger')
-            return redirect(url_for('main.edit_course', course_id=course_id))
-
         # Mise à jour des affectations : simple et efficace
         # 1. Supprimer les anciennes affectations
         CoursAffectation.query.filter_by(cours_id=course_id).delete()
         # 2. Créer les nouvelles
-        groupes_ids = request.form.getlist('groupes_ids')
-        for groupe_id in groupes_ids:
-            groupe = Groupe.query.get(groupe_id)
-            affectation = CoursAffectation(cours_id=course_id, groupe_id=groupe.id, filiere_id=groupe.filiere_id, niveau_id=groupe.niveau_id)
-            db.session.add(affectation)
+        for a in affectations:
+            db.session.add(CoursAffectation(cours_id=course_id, groupe_id=a.groupe_id, filiere_id=a.filiere_id, niveau_id=a.niveau_id))
 
         # Envoyer la notification de modification
         title = f"Cours modifié : {course_to_edit.matiere_obj.nom_matiere}"
         message = f"Le cours de {course_to_edit.matiere_obj.nom_matiere} a été mis à jour. Nouveau créneau : {course_to_edit.date_cours.strftime('%d/%m/%Y')} de {course_to_edit.heure_debut.strftime('%Hh%M')} à {course_to_edit.heure_fin.strftime('%Hh%M')}."
-        send_course_notification(course_to_edit, title, message)
+        # Les corrections successives du même cours sont regroupées en une seule notification
+        send_course_notification(course_to_edit, title, message, regroupement=f"cours:{course_id}")
 
         db.session.commit()
+        room_occupancy.remove(*ancien_creneau)
+        room_occupancy.add_course(course_to_edit)
         flash('Le cours a été mis à jour avec succès.', 'success')
         return redirect(url_for('main.admin_dashboard'))
 
@@ -781,27 +941,406 @@ def edit_course(course_id):
     current_group_ids = [aff.groupe_id for aff in course_to_edit.cours_affectations]
     return render_template('admin/edit_course.html', course=course_to_edit, matieres=matieres, enseignants=enseignants, salles=salles, groupes=groupes, current_group_ids=current_group_ids)
 
+@main_bp.route('/api/free_rooms')
+@login_required
+@role_required('administrateur')
+def free_rooms_api():
+    """
+    Salles libres pour une date et une plage horaire, d'une capacité minimale donnée.
+    Paramètres : date (AAAA-MM-JJ), heure_debut et heure_fin (HH:MM), capacite (optionnel),
+    exclude_cours_id (optionnel, cours en cours de modification).
+    """
+    try:
+        date_cours = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+        heure_debut = datetime.strptime(request.args.get('heure_debut', ''), '%H:%M').time()
+        heure_fin = datetime.strptime(request.args.get('heure_fin', ''), '%H:%M').time()
+    except ValueError:
+        return jsonify({'error': 'Paramètres date, heure_debut et heure_fin invalides.'}), 400
+    if heure_fin <= heure_debut:
+        return jsonify({'error': "L'heure de fin doit être postérieure à l'heure de début."}), 400
+
+    exclude_cours = None
+    exclude_cours_id = request.args.get('exclude_cours_id', type=int)
+    if exclude_cours_id:
+        exclude_cours = Cours.query.get(exclude_cours_id)
+
+    salles = room_occupancy.free_rooms(date_cours, heure_debut, heure_fin, request.args.get('capacite', 0, type=int), exclude_cours)
+    return jsonify({'salles': [{'id': s.id, 'nom_salle': s.nom_salle, 'capacite': s.capacite} for s in salles]})
+
+# ===================================================================
+# ==                  SÉRIES DE COURS RÉCURRENTS                   ==
+# ===================================================================
+def read_series_form():
+    """
+    Lit le formulaire de création/modification d'une série.
+    Retourne un dictionnaire de valeurs ; lève ValueError si une valeur est invalide.
+    """
+    try:
+        donnees = {
+            'matiere_id': int(request.form.get('matiere_id')),
+            'enseignant_id': int(request.form.get('enseignant_id')),
+            'salle_id': int(request.form.get('salle_id')),
+            'date_debut': datetime.strptime(request.form.get('date_debut'), '%Y-%m-%d').date(),
+            'date_fin': datetime.strptime(request.form.get('date_fin'), '%Y-%m-%d').date(),
+            'heure_debut': datetime.strptime(request.form.get('heure_debut'), '%H:%M').time(),
+            'heure_fin': datetime.strptime(request.form.get('heure_fin'), '%H:%M').time(),
+        }
+    except (TypeError, ValueError):
+        raise ValueError("Veuillez remplir correctement tous les champs obligatoires.")
+
+    donnees['frequence'] = request.form.get('frequence', 'hebdomadaire')
+    if donnees['frequence'] not in ('hebdomadaire', 'bihebdomadaire'):
+        raise ValueError("Fréquence invalide.")
+    if donnees['heure_fin'] <= donnees['heure_debut']:
+        raise ValueError("L'heure de fin doit être postérieure à l'heure de début.")
+    if donnees['date_fin'] < donnees['date_debut']:
+        raise ValueError("La date de fin doit être postérieure à la date de début.")
+
+    donnees['dates_exclues'] = format_exclusions(parse_exclusions(request.form.get('dates_exclues')))
+    donnees['description'] = request.form.get('description')
+    donnees['groupes_ids'] = [int(g) for g in request.form.getlist('groupes_ids')]
+    return donnees
+
+def flash_series_conflicts(conflits, limite=10):
+    """Affiche les premiers conflits d'une série et le nombre total."""
+    for conflit in conflits[:limite]:
+        flash(format_conflict(conflit), 'danger')
+    if len(conflits) > limite:
+        flash(f"... et {len(conflits) - limite} autre(s) conflit(s).", 'danger')
+
+@main_bp.route('/admin/series')
+@login_required
+@role_required('administrateur')
+def list_series():
+    series = SerieCours.query.order_by(SerieCours.date_debut.desc()).all()
+    return render_template('admin/series.html', series=series)
+
+@main_bp.route('/admin/series/create', methods=['GET', 'POST'])
+@login_required
+@role_required('administrateur')
+def create_series():
+    if request.method == 'POST':
+        try:
+            donnees = read_series_form()
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('main.create_series'))
+
+        groupes_ids = donnees.pop('groupes_ids')
+        serie = SerieCours(**donnees)
+        dates = series_dates(serie)
+        if not dates:
+            flash("Aucune séance ne correspond à cette règle de récurrence.", 'warning')
+            return redirect(url_for('main.create_series'))
+
+        # Vérification de toutes les occurrences en un seul lot
+        conflits = check_series_conflicts(dates, serie.heure_debut, serie.heure_fin, serie.enseignant_id, serie.salle_id, groupes_ids)
+        if conflits:
+            flash_series_conflicts(conflits)
+            return redirect(url_for('main.create_series'))
+
+        serie.groupes = Groupe.query.filter(Groupe.id.in_(groupes_ids)).all()
+        db.session.add(serie)
+        db.session.flush() # Pour obtenir l'ID de la série
+        nombre = insert_occurrences(serie, dates)
+        db.session.commit()
+        room_occupancy.invalidate(dates)
+        invalidate_timetables((g, None, None) for g in groupes_ids)
+        flash(f'La série a été créée : {nombre} séances ont été publiées.', 'success')
+        return redirect(url_for('main.list_series'))
+
+    matieres = Matiere.query.order_by(Matiere.nom_matiere).all()
+    enseignants = Utilisateur.query.filter_by(role='enseignant').order_by(Utilisateur.nom).all()
+    salles = Salle.query.order_by(Salle.nom_salle).all()
+    groupes = Groupe.query.join(Niveau).order_by(Niveau.id, Groupe.nom_groupe).all()
+    return render_template('admin/edit_series.html', serie=None, matieres=matieres, enseignants=enseignants, salles=salles, groupes=groupes, current_group_ids=[])
+
+@main_bp.route('/admin/series/edit/<int:serie_id>', methods=['GET', 'POST'])
+@login_required
+@role_required('administrateur')
+def edit_series(serie_id):
+    """Modifie une série : seules les occurrences à venir sont mises à jour."""
+    serie = SerieCours.query.get_or_404(serie_id)
+
+    if request.method == 'POST':
+        try:
+            donnees = read_series_form()
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('main.edit_series', serie_id=serie_id))
+
+        groupes_ids = donnees.pop('groupes_ids')
+        anciens_groupes_ids = [g.id for g in serie.groupes]
+        for champ, valeur in donnees.items():
+            setattr(serie, champ, valeur)
+        serie.groupes = Groupe.query.filter(Groupe.id.in_(groupes_ids)).all()
+
+        aujourd_hui = datetime.utcnow().date()
+        dates_futures = [d for d in series_dates(serie) if d >= aujourd_hui]
+        conflits = check_series_conflicts(dates_futures, serie.heure_debut, serie.heure_fin, serie.enseignant_id, serie.salle_id, groupes_ids, exclude_serie_id=serie.id)
+        if conflits:
+            db.session.rollback()
+            flash_series_conflicts(conflits)
+            return redirect(url_for('main.edit_series', serie_id=serie_id))
+
+        nombre = update_future_occurrences(serie, aujourd_hui)
+
+        # Une seule notification pour la série, basée sur la prochaine séance
+        prochain_cours = Cours.query.filter(in_series(serie.id), Cours.date_cours >= aujourd_hui).order_by(Cours.date_cours).first()
+        if prochain_cours:
+            title = f"Cours modifié : {serie.matiere.nom_matiere}"
+            message = f"Les séances à venir de {serie.matiere.nom_matiere} ont été mises à jour. Nouveau créneau : le {prochain_cours.date_cours.strftime('%A')} de {serie.heure_debut.strftime('%Hh%M')} à {serie.heure_fin.strftime('%Hh%M')}, jusqu'au {serie.date_fin.strftime('%d/%m/%Y')}."
+            send_course_notification(prochain_cours, title, message, regroupement=f"serie:{serie.id}")
+
+        db.session.commit()
+        # Les anciennes et nouvelles dates de la série peuvent différer : toutes les journées seront rechargées
+        room_occupancy.invalidate()
+        invalidate_timetables((g, None, None) for g in set(anciens_groupes_ids) | set(groupes_ids))
+        flash(f'La série a été mise à jour ({nombre} séances à venir).', 'success')
+        return redirect(url_for('main.list_series'))
+
+    matieres = Matiere.query.order_by(Matiere.nom_matiere).all()
+    enseignants = Utilisateur.query.filter_by(role='enseignant').order_by(Utilisateur.nom).all()
+    salles = Salle.query.order_by(Salle.nom_salle).all()
+    groupes = Groupe.query.join(Niveau).order_by(Niveau.id, Groupe.nom_groupe).all()
+    current_group_ids = [g.id for g in serie.groupes]
+    return render_template('admin/edit_series.html', serie=serie, matieres=matieres, enseignants=enseignants, salles=salles, groupes=groupes, current_group_ids=current_group_ids)
+
+@main_bp.route('/admin/series/delete/<int:serie_id>', methods=['POST'])
+@login_required
+@role_required('administrateur')
+def delete_series(serie_id):
+    """Supprime les séances à venir d'une série ; les séances passées sont conservées comme cours ponctuels."""
+    serie = SerieCours.query.get_or_404(serie_id)
+    aujourd_hui = datetime.utcnow().date()
+
+    futurs = db.session.query(Cours.id, Cours.date_cours).filter(in_series(serie.id), Cours.date_cours >= aujourd_hui).all()
+    dates_futures = [d for _, d in futurs]
+    groupes_ids = [g.id for g in serie.groupes]
+    delete_courses([i for i, _ in futurs])
+    # Les séances passées restent, détachées de la série
+    SerieOccurrence.query.filter(SerieOccurrence.serie_id == serie.id).delete(synchronize_session=False)
+    db.session.delete(serie)
+    db.session.commit()
+    room_occupancy.invalidate(dates_futures)
+    invalidate_timetables((g, None, None) for g in groupes_ids)
+    flash('La série a été supprimée.', 'success')
+    return redirect(url_for('main.list_series'))
+
+# ===================================================================
+# ==              GÉNÉRATION AUTOMATIQUE D'EMPLOI DU TEMPS          ==
+# ===================================================================
+def parse_solver_demands(texte, matieres_par_code):
+    """
+    Lit les demandes de séances, une par ligne : groupe_id;code_matiere;duree_minutes;nombre_de_seances.
+    Retourne (demandes, erreurs).
+    """
+    demandes, erreurs = [], []
+    for numero, ligne in enumerate((texte or '').splitlines(), start=1):
+        ligne = ligne.strip()
+        if not ligne or ligne.startswith('#'):
+            continue
+        morceaux = [m.strip() for m in ligne.split(';')]
+        try:
+            groupe_id, code, duree, nombre = morceaux
+            groupe_id, duree, nombre = int(groupe_id), int(duree), int(nombre)
+        except ValueError:
+            erreurs.append(f"Ligne {numero} : format attendu groupe_id;code_matiere;duree_minutes;nombre_de_seances.")
+            continue
+        if code not in matieres_par_code:
+            erreurs.append(f"Ligne {numero} : matière « {code} » introuvable.")
+        elif duree <= 0 or nombre <= 0:
+            erreurs.append(f"Ligne {numero} : la durée et le nombre de séances doivent être positifs.")
+        elif duree % solver.PAS_MINUTES:
+            erreurs.append(f"Ligne {numero} : la durée doit être un multiple de {solver.PAS_MINUTES} minutes (grille du solveur).")
+        else:
+            demandes.append((groupe_id, matieres_par_code[code], duree, nombre))
+    return demandes, erreurs
+
+@main_bp.route('/admin/solver', methods=['GET', 'POST'])
+@login_required
+@role_required('administrateur')
+def timetable_solver():
+    """Lance la génération automatique d'une semaine d'emploi du temps en arrière-plan."""
+    if request.method == 'POST':
+        try:
+            jour = datetime.strptime(request.form.get('semaine'), '%Y-%m-%d').date()
+            budget = min(max(int(request.form.get('budget', 10)), 1), current_app.config['SOLVER_BUDGET_MAX'])
+        except (TypeError, ValueError):
+            flash("Veuillez indiquer une semaine et une durée de recherche valides.", 'danger')
+            return redirect(url_for('main.timetable_solver'))
+        lundi = jour - timedelta(days=jour.weekday())
+
+        matieres_par_code = dict(db.session.query(Matiere.code_matiere, Matiere.id).all())
+        demandes, erreurs = parse_solver_demands(request.form.get('demandes'), matieres_par_code)
+        if not erreurs and demandes:
+            probleme, erreurs = solver.build_problem(lundi, demandes)
+        for erreur in erreurs[:10]:
+            flash(erreur, 'danger')
+        if erreurs or not demandes:
+            if not demandes:
+                flash("Aucune séance à planifier.", 'warning')
+            return redirect(url_for('main.timetable_solver'))
+
+        job_id = solver.submit(probleme, budget, essais=current_app.config['SOLVER_ESSAIS'])
+        db.session.commit()
+        flash(f"Génération lancée pour {len(probleme['besoins'])} séances (semaine du {lundi.strftime('%d/%m/%Y')}).", 'info')
+        return redirect(url_for('main.timetable_solver_job', job_id=job_id))
+
+    groupes = Groupe.query.join(Niveau).order_by(Groupe.filiere_id, Niveau.id, Groupe.nom_groupe).all()
+    matieres = Matiere.query.order_by(Matiere.code_matiere).all()
+    return render_template('admin/solver.html', groupes=groupes, matieres=matieres, statut=None)
+
+@main_bp.route('/admin/solver/<job_id>')
+@login_required
+@role_required('administrateur')
+def timetable_solver_job(job_id):
+    """Affiche l'avancement d'une génération puis la solution proposée."""
+    statut = solver.job_status(job_id)
+    if statut is None:
+        flash("Cette génération n'existe pas ou a déjà été appliquée.", 'warning')
+        return redirect(url_for('main.timetable_solver'))
+
+    seances = []
+    if statut['etat'] == 'termine':
+        probleme, resultat = statut['probleme'], statut['resultat']
+        besoins = {b.id: b for b in probleme['besoins']}
+        placements = resultat['placements']
+        # Noms chargés en une requête par table plutôt qu'une par séance
+        matieres = {m.id: m for m in Matiere.query.filter(Matiere.id.in_({b.matiere_id for b in besoins.values()}))}
+        groupes = {g.id: g for g in Groupe.query.filter(Groupe.id.in_({b.groupe_id for b in besoins.values()}))}
+        enseignants = {u.id: u for u in Utilisateur.query.filter(Utilisateur.id.in_({p.enseignant_id for p in placements.values()}))}
+        salles = {s.id: s for s in Salle.query.filter(Salle.id.in_({p.salle_id for p in placements.values()}))}
+        for bid, placement in placements.items():
+            besoin = besoins[bid]
+            date_cours, heure_debut, heure_fin = solver.placement_times(probleme['lundi'], besoin, placement)
+            seances.append({
+                'date_cours': date_cours, 'heure_debut': heure_debut, 'heure_fin': heure_fin,
+                'matiere': matieres[besoin.matiere_id], 'groupe': groupes[besoin.groupe_id],
+                'enseignant': enseignants[placement.enseignant_id], 'salle': salles[placement.salle_id],
+            })
+        seances.sort(key=lambda s: (s['date_cours'], s['heure_debut'], s['salle'].nom_salle))
+        statut['non_places'] = [
+            (matieres[besoins[bid].matiere_id], groupes[besoins[bid].groupe_id]) for bid in resultat['non_places']
+        ]
+
+    return render_template('admin/solver.html', statut=statut, job_id=job_id, seances=seances)
+
+@main_bp.route('/admin/solver/<job_id>/apply', methods=['POST'])
+@login_required
+@role_required('administrateur')
+def apply_timetable_solution(job_id):
+    """Publie la solution : les créneaux sont revérifiés, car la base a pu changer pendant la recherche."""
+    # Ligne verrouillée jusqu'au commit : une même solution ne peut pas être appliquée deux fois
+    statut = solver.job_status(job_id, verrouiller=True)
+    if statut is None or statut['etat'] != 'termine':
+        flash("Aucune solution à appliquer.", 'warning')
+        return redirect(url_for('main.timetable_solver'))
+
+    probleme, placements = statut['probleme'], statut['resultat']['placements']
+    besoins = {b.id: b for b in probleme['besoins']}
+    groupes = {a.groupe_id: a for a in resolve_groups({b.groupe_id for b in besoins.values()})}
+    lundi = probleme['lundi']
+    index = ConflictIndex.load(
+        lundi, lundi + timedelta(days=len(solver.JOURS) - 1),
+        enseignant_ids={p.enseignant_id for p in placements.values()},
+        salle_ids={p.salle_id for p in placements.values()},
+        affectations=groupes.values()
+    )
+
+    cours_rows, affectations, conflits = [], [], []
+    for bid, placement in placements.items():
+        besoin = besoins[bid]
+        date_cours, heure_debut, heure_fin = solver.placement_times(lundi, besoin, placement)
+        affectation = groupes[besoin.groupe_id]
+        trouves = index.find(date_cours, heure_debut, heure_fin, resource_keys(placement.enseignant_id, placement.salle_id, [affectation]))
+        if trouves:
+            conflits.extend(trouves)
+            continue
+        # Séance ajoutée à l'index (ID négatif, pas encore en base) : les suivantes sont vérifiées contre elle
+        index.add(-(bid + 1), date_cours, heure_debut, heure_fin, occupied_keys(placement.enseignant_id, placement.salle_id, [affectation]))
+        cours_rows.append({
+            'matiere_id': besoin.matiere_id, 'enseignant_id': placement.enseignant_id, 'salle_id': placement.salle_id,
+            'date_cours': date_cours, 'heure_debut': heure_debut, 'heure_fin': heure_fin, 'description': None,
+        })
+        affectations.append([affectation])
+
+    if conflits:
+        flash("Des cours ont été ajoutés depuis le lancement de la génération ; relancez-la.", 'danger')
+        flash_series_conflicts(conflits)
+        return redirect(url_for('main.timetable_solver_job', job_id=job_id))
+
+    nombre = len(bulk_insert_courses(cours_rows, affectations))
+    solver.forget_job(job_id)
+    db.session.commit()
+    room_occupancy.invalidate({r['date_cours'] for r in cours_rows})
+    invalidate_timetables(groupes.values(), enseignant_ids={r['enseignant_id'] for r in cours_rows}, salle_ids={r['salle_id'] for r in cours_rows})
+    flash(f"{nombre} cours ont été publiés.", 'success')
+    return redirect(url_for('main.admin_dashboard'))
+
+@main_bp.route('/admin/jobs')
+@login_required
+@role_required('administrateur')
+def admin_jobs():
+    """Inspection de la file de tâches : nombre de tâches par statut et dernières tâches, filtrables par statut."""
+    statut = request.args.get('statut')
+    compteurs = dict(db.session.query(Tache.statut, func.count(Tache.id)).group_by(Tache.statut).all())
+    query = Tache.query
+    if statut in ('en_attente', 'en_cours', 'terminee', 'echouee'):
+        query = query.filter(Tache.statut == statut)
+    taches = query.order_by(Tache.id.desc()).limit(100).all()
+    return render_template('admin/jobs.html', taches=taches, compteurs=compteurs, statut=statut)
+
+@main_bp.route('/admin/jobs/<int:tache_id>/retry', methods=['POST'])
+@login_required
+@role_required('administrateur')
+def retry_admin_job(tache_id):
+    """Relance une tâche échouée."""
+    tache = Tache.query.get_or_404(tache_id)
+    if tache.statut != 'echouee':
+        flash("Seule une tâche échouée peut être relancée.", 'warning')
+    else:
+        retry_job(tache)
+        db.session.commit()
+        flash(f"La tâche #{tache.id} a été remise en file.", 'success')
+    return redirect(url_for('main.admin_jobs', statut=request.args.get('statut')))
+
 @main_bp.route('/notifications')
 @login_required
 def notifications():
-    """Affiche l'historique complet des notifications de l'utilisateur."""
-    
-    # Récupérer toutes les notifications pertinentes pour l'utilisateur
-    user_notifications = Notification.query.filter(
-        or_(
-            Notification.destinataire_role == 'all',
-            Notification.destinataire_role == current_user.role,
-            Notification.destinataire_id == current_user.id
-        )
-    ).order_by(Notification.date_creation.desc()).all()
+    """Affiche l'historique des notifications de l'utilisateur, par pages (paramètre avant : curseur de la page)."""
+    avant = request.args.get('avant')
+    try:
+        position = decode_history_cursor(avant) if avant else None
+    except ValueError:
+        # Curseur illisible (lien modifié) : retour à la première page
+        return redirect(url_for('main.notifications'))
+
+    user_notifications, page_suivante = history_page(current_user, position)
+    # Celles qui étaient non lues restent mises en évidence pour cet affichage
+    non_lues = unread_ids(current_user, [n.id for n in user_notifications])
+
+    if not avant:
+        # Tout marquer comme lu : un UPDATE des notifications personnelles et le curseur des annonces avancé
+        mark_all_read(current_user)
+        db.session.commit()
+        # Les autres onglets ouverts mettent leur badge à jour
+        push_unread_counts(current_user.id, notifications=0)
 
-    # Marquer les notifications personnelles non lues de l'utilisateur comme lues
-    personal_unread = Notification.query.filter_by(destinataire_id=current_user.id, est_lue=False)
-    for notif in personal_unread:
-        notif.est_lue = True
-    db.session.commit()
+    return render_template('utilisateur/notifications.html', notifications=user_notifications, non_lues=non_lues, page_suivante=page_suivante)
 
-    return render_template('utilisateur/notifications.html', notifications=user_notifications)
+@main_bp.route('/notifications/<int:notification_id>/read', methods=['POST'])
+@login_required
+def read_notification(notification_id):
+    """Marque une seule notification comme lue (depuis la carte du tableau de bord)."""
+    notification = Notification.query.filter(Notification.id == notification_id, visible_to(current_user)).first_or_404()
+    mark_read(current_user, notification)
+    db.session.commit()
+    non_lues = unread_counters(current_user)[0]
+    push_unread_counts(current_user.id, notifications=non_lues)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'non_lues': non_lues})
+    return redirect(request.referrer or url_for('main.notifications'))
 
 @main_bp.route('/enseignant/dashboard', methods=['GET', 'POST'])
 @login_required
@@ -821,20 +1360,33 @@ def enseignant_dashboard():
             )
             try:
                 db.session.add(nouvelle_dispo)
+                refresh_teacher_mask(current_user.id)
                 db.session.commit()
                 flash('Disponibilité ajoutée avec succès.', 'success')
             except IntegrityError:
                 db.session.rollback()
-                flash('Cette disponibilité existe déjà.', 'danger')
+                # Soit la disponibilité existe déjà, soit le masque a été créé en même temps par une autre requête
+                doublon = DisponibiliteEnseignant.query.filter_by(
+                    enseignant_id=current_user.id, jour_semaine=jour, heure_debut=heure_debut
+                ).first()
+                if doublon:
+                    flash('Cette disponibilité existe déjà.', 'danger')
+                else:
+                    flash("Vos disponibilités ont été modifiées en même temps depuis une autre page. Veuillez réessayer.", 'warning')
             return redirect(url_for('main.enseignant_dashboard'))
 
     disponibilites = DisponibiliteEnseignant.query.filter_by(enseignant_id=current_user.id).order_by(DisponibiliteEnseignant.jour_semaine).all()
-    emploi_du_temps = Cours.query.filter_by(enseignant_id=current_user.id).order_by(Cours.date_cours, Cours.heure_debut).all()
+    # Première page de la fenêtre courante ; la suite est chargée à la demande via /api/timetable
+    today = datetime.now().date()
+    lundi = today - timedelta(days=today.weekday())
+    fin_fenetre = lundi + timedelta(weeks=SEMAINES_AFFICHEES, days=-1)
+    emploi_du_temps, curseur_suivant = timetable_page(Cours.enseignant_id == current_user.id, lundi, fin_fenetre)
     
     # CORRECTION : Ajout de la logique de notification pour les enseignants
-    notifications = Notification.query.filter(or_(Notification.destinataire_role == 'all', Notification.destinataire_role == 'enseignant', Notification.destinataire_id == current_user.id)).order_by(Notification.date_creation.desc()).limit(5).all()
+    notifications = Notification.query.filter(visible_to(current_user)).order_by(Notification.date_creation.desc()).limit(5).all()
 
-    return render_template('enseignant/dashboard.html', disponibilites=disponibilites, emploi_du_temps=emploi_du_temps, notifications=notifications)
+    return render_template('enseignant/dashboard.html', disponibilites=disponibilites, emploi_du_temps=emploi_du_temps, notifications=notifications, fenetre=(lundi, fin_fenetre), curseur_suivant=curseur_suivant,
+                           lien_calendrier=url_for('main.calendar_feed', jeton=feed_token('utilisateur', current_user.id), _external=True))
 
 @main_bp.route('/enseignant/disponibilite/delete/<int:dispo_id>', methods=['POST'])
 @login_required
@@ -849,6 +1401,7 @@ def delete_disponibilite(dispo_id):
         return redirect(url_for('main.enseignant_dashboard'))
 
     db.session.delete(dispo_to_delete)
+    refresh_teacher_mask(current_user.id)
     db.session.commit()
     flash('La disponibilité a été supprimée avec succès.', 'success')
     return redirect(url_for('main.enseignant_dashboard'))
@@ -859,8 +1412,9 @@ def delete_disponibilite(dispo_id):
 def update_teacher_profile():
     if request.method == 'POST':
         # --- 1. Mettre à jour les informations de base de l'utilisateur ---
-        current_user.prenom = request.form.get('firstname')
-        current_user.nom = request.form.get('lastname')
+        utilisateur = db.session.get(Utilisateur, current_user.id)
+        utilisateur.prenom = request.form.get('firstname')
+        utilisateur.nom = request.form.get('lastname')
 
         # --- 2. Synchroniser les matières enseignées ---
         
@@ -892,6 +1446,7 @@ def update_teacher_profile():
         
         try:
             db.session.commit()
+            invalidate_identity(current_user.id)
             flash('Votre profil a été mis à jour avec succès !', 'success')
         except Exception as e:
             db.session.rollback()
@@ -910,39 +1465,19 @@ def update_teacher_profile():
 
     return render_template('enseignant/teacher_profile.html', matieres=matieres, filieres=filieres, niveaux=niveaux, enseignements_actuels=enseignements_actuels)
 
-def send_course_notification(course, title, message_body):
+def send_course_notification(course, title, message_body, regroupement=None, immediat=False):
     """
-    Fonction d'aide pour envoyer des notifications à tous les utilisateurs concernés par un cours.
+    Fonction d'aide pour envoyer des notifications à tous les utilisateurs concernés par un cours
+    (l'enseignant et les étudiants de ses affectations). L'envoi est confié à la file de tâches,
+    enregistrée dans la transaction de l'appelant ; les affectations sont relevées dès maintenant.
+    Avec une clé de `regroupement`, l'envoi attend NOTIFICATIONS_REGROUPEMENT_SECONDES et les demandes
+    suivantes de même clé remplacent celle qui attend encore ; `immediat` la remplace et l'envoie sans attendre.
     """
-    users_to_notify = set()
-
-    # 1. Ajouter l'enseignant
-    if course.enseignant_obj:
-        users_to_notify.add(course.enseignant_obj)
-
-    # 2. Trouver et ajouter tous les étudiants concernés par les affectations
-    for aff in course.cours_affectations:
-        query = Utilisateur.query.filter_by(role='etudiant')
-        if aff.filiere_id:
-            query = query.filter_by(filiere_id=aff.filiere_id)
-        if aff.niveau_id:
-            query = query.filter_by(niveau_id=aff.niveau_id)
-        if aff.groupe_id:
-            query = query.filter_by(groupe_id=aff.groupe_id)
-        
-        students = query.all()
-        for student in students:
-            users_to_notify.add(student)
-
-    # 3. Créer et préparer les notifications pour la sauvegarde
-    for user in users_to_notify:
-        notification = Notification(
-            titre=title,
-            message=message_body,
-            destinataire_id=user.id,
-            destinataire_role=user.role
-        )
-        db.session.add(notification)
+    charge = dict(enseignant_id=int(course.enseignant_id), affectations=course_audience(course.id), titre=title, message=message_body)
+    if regroupement is None:
+        return enqueue('notification_cours', **charge)
+    delai = timedelta(0) if immediat else timedelta(seconds=current_app.config['NOTIFICATIONS_REGROUPEMENT_SECONDES'])
+    return enqueue_coalesced('notification_cours', regroupement, delai, fusion=merge_course_notification, **charge)
 
 @main_bp.route('/admin/delete_course/<int:course_id>', methods=['POST'])
 @login_required
@@ -953,10 +1488,13 @@ def delete_course(course_id):
     # Préparer la notification avant de supprimer le cours
     title = f"Cours annulé : {course_to_delete.matiere_obj.nom_matiere}"
     message = f"Le cours de {course_to_delete.matiere_obj.nom_matiere} qui était prévu le {course_to_delete.date_cours.strftime('%d/%m/%Y')} à {course_to_delete.heure_debut.strftime('%Hh%M')} a été annulé."
-    send_course_notification(course_to_delete, title, message)
+    # Remplace une éventuelle notification de modification encore en attente
+    send_course_notification(course_to_delete, title, message, regroupement=f"cours:{course_id}", immediat=True)
 
+    creneau = (course_to_delete.salle_id, course_to_delete.date_cours, course_to_delete.heure_debut, course_to_delete.heure_fin)
     db.session.delete(course_to_delete)
     db.session.commit()
+    room_occupancy.remove(*creneau)
     flash('Le cours a été supprimé avec succès.', 'success')
     return redirect(url_for('main.admin_dashboard'))
 
@@ -982,6 +1520,7 @@ def delete_user(user_id):
 
     db.session.delete(user_to_delete)
     db.session.commit()
+    invalidate_identity(user_id)
     flash(f"L'utilisateur {user_to_delete.prenom} {user_to_delete.nom} a été supprimé avec succès.", 'success')
     return redirect(url_for('main.admin_dashboard'))
 
@@ -1009,6 +1548,9 @@ def edit_user(user_id):
             flash("Vous ne pouvez pas changer votre propre rôle.", 'danger')
             return redirect(url_for('main.edit_user', user_id=user_id))
         
+        if user_to_edit.role != new_role:
+            # Les annonces visibles changent avec le rôle : compteur recalculé à la prochaine lecture
+            invalidate_counters(user_ids=[user_to_edit.id])
         user_to_edit.role = new_role
 
         # Logique d'assignation de groupe pour les étudiants
@@ -1037,6 +1579,7 @@ def edit_user(user_id):
             user_to_edit.niveau_id = None
 
         db.session.commit()
+        invalidate_identity(user_to_edit.id)
         flash(f"Le profil de {user_to_edit.prenom} {user_to_edit.nom} a été mis à jour.", 'success')
         return redirect(url_for('main.admin_dashboard'))
 
@@ -1219,10 +1762,12 @@ def edit_profile():
         filiere_id = request.form.get('filiere_id')
         niveau_id = request.form.get('niveau_id')
 
-        current_user.filiere_id = filiere_id
-        current_user.niveau_id = niveau_id if niveau_id else None
+        utilisateur = db.session.get(Utilisateur, current_user.id)
+        utilisateur.filiere_id = filiere_id
+        utilisateur.niveau_id = niveau_id if niveau_id else None
 
         db.session.commit()
+        invalidate_identity(current_user.id)
         flash('Votre profil a été mis à jour avec succès !', 'success')
         return redirect(url_for('main.dashboard'))
     
@@ -1250,7 +1795,8 @@ def manage_salles():
         return redirect(url_for('main.manage_salles'))
 
     salles = Salle.query.order_by(Salle.nom_salle).all()
-    return render_template('admin/manage_salles.html', salles=salles)
+    liens_calendrier = {salle.id: url_for('main.calendar_feed', jeton=feed_token('salle', salle.id), _external=True) for salle in salles}
+    return render_template('admin/manage_salles.html', salles=salles, liens_calendrier=liens_calendrier)
 
 @main_bp.route('/admin/salle/edit/<int:salle_id>', methods=['POST'])
 @login_required
@@ -1318,13 +1864,8 @@ def manage_matieres():
 @main_bp.route('/inbox/<int:conversation_id>')
 @login_required
 def inbox(conversation_id=None):
-    # Récupérer toutes les conversations de l'utilisateur, triées par le message le plus récent
-    conversations = Conversation.query.filter(
-        or_(Conversation.participant1_id == current_user.id, Conversation.participant2_id == current_user.id)
-    ).order_by(Conversation.last_message_time.desc()).all()
-
     active_conversation = None
-    messages = []
+    messages, messages_precedents = [], None
     if conversation_id:
         active_conversation = Conversation.query.get_or_404(conversation_id)
         # Sécurité : vérifier que l'utilisateur fait bien partie de la conversation
@@ -1332,7 +1873,8 @@ def inbox(conversation_id=None):
             flash("Accès non autorisé à cette conversation.", "danger")
             return redirect(url_for('main.inbox'))
         
-        messages = active_conversation.messages.order_by(Message.timestamp.asc()).all()
+        # Seule la page la plus récente est rendue ; les plus anciennes sont chargées au défilement
+        messages, messages_precedents = message_page(conversation_id)
 
         # Marquer les messages reçus comme lus
         unread_messages_query = Message.query.filter(
@@ -1345,12 +1887,35 @@ def inbox(conversation_id=None):
         message_ids_to_mark_as_read = [msg.id for msg in unread_messages_query.all()]
 
         if message_ids_to_mark_as_read:
-            unread_messages_query.update({Message.is_read: True})
+            # Décompte par les lignes réellement modifiées : une autre requête a pu marquer les mêmes messages
+            lus = unread_messages_query.filter(Message.id.in_(message_ids_to_mark_as_read)).update({Message.is_read: True}, synchronize_session=False)
+            add_messages(current_user.id, -lus)
             db.session.commit()
             # Émettre un événement pour informer l'autre utilisateur que les messages ont été lus
             socketio.emit('messages_read', {'message_ids': message_ids_to_mark_as_read}, room=str(conversation_id))
+            push_unread_counts(current_user.id, messages=unread_counters(current_user)[1])
 
-    return render_template('utilisateur/inbox.html', conversations=conversations, active_conversation=active_conversation, messages=messages)
+    # Conversations de l'utilisateur, triées par le message le plus récent : interlocuteur,
+    # aperçu du dernier message et nombre de non-lus en une seule requête
+    # (après le marquage : la conversation ouverte n'a plus de non-lus)
+    conversations = inbox_conversations(current_user.id)
+
+    return render_template('utilisateur/inbox.html', conversations=conversations, active_conversation=active_conversation, messages=messages, messages_precedents=messages_precedents)
+
+@main_bp.route('/api/conversations/<int:conversation_id>/messages')
+@login_required
+def conversation_messages_api(conversation_id):
+    """Page de messages plus anciens que le curseur `avant` (JSON), pour le chargement au défilement."""
+    conversation = Conversation.query.get_or_404(conversation_id)
+    if current_user.id not in [conversation.participant1_id, conversation.participant2_id]:
+        return jsonify({'error': "Accès non autorisé à cette conversation."}), 403
+    try:
+        avant = decode_message_cursor(request.args['avant']) if request.args.get('avant') else None
+    except ValueError:
+        return jsonify({'error': 'Paramètre avant invalide.'}), 400
+
+    messages, precedent = message_page(conversation_id, avant)
+    return jsonify({'messages': [message_json(m) for m in messages], 'avant': precedent})
 
 @main_bp.route('/message/start/<int:recipient_id>')
 @login_required
@@ -1411,29 +1976,14 @@ def send_reply(conversation_id):
         return redirect(url_for('main.inbox', conversation_id=conversation_id))
 
     # Créer le message en base de données
-    msg = Message(
-        author=current_user, 
-        conversation=conversation, 
-        body=body if body else None,
-        image_url=image_url
-    )
-    conversation.last_message_time = datetime.utcnow()
-    db.session.add(msg)
-    db.session.commit() # On commit pour obtenir l'ID, le timestamp, etc.
+    msg, _ = post_message(conversation, current_user, body=body if body else None, image_url=image_url)
+    db.session.commit()
 
-    room = str(conversation.id)
     # On émet un message structuré à la room via Socket.IO
-    socketio.emit('new_message', {
-        'id': msg.id,
-        'body': msg.body,
-        'image_url': msg.image_url, # On ajoute l'URL de l'image
-        'timestamp': msg.timestamp.isoformat() + 'Z', # Format ISO 8601 pour JS
-        'sender': {
-            'id': current_user.id,
-            'prenom': current_user.prenom
-        },
-        'conversation_id': conversation.id
-    }, room=room)
+    socketio.emit('new_message', new_message_event(msg, current_user), room=str(conversation.id))
+
+    # Badge de messages du destinataire, où qu'il se trouve dans l'application
+    push_message_count(other_participant_id(conversation, current_user.id))
 
     return redirect(url_for('main.inbox', conversation_id=conversation_id))
 
@@ -1441,7 +1991,7 @@ def send_reply(conversation_id):
 @login_required
 def unread_messages_count_api():
     """API endpoint to get the number of unread messages."""
-    count = current_user.new_messages_count()
+    count = unread_counters(current_user)[1]
     return jsonify({'unread_messages_count': count})
 @main_bp.route('/admin/matiere/edit/<int:matiere_id>', methods=['POST'])
 @login_required
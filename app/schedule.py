@@ -0,0 +1,420 @@
+# app/schedule.py
+# Requêtes d'emploi du temps (vue hebdomadaire admin, emploi du temps des étudiants)
+# et caches associés : listes de filtres, emplois du temps par cohorte, validateurs des flux iCalendar.
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from sqlalchemy import event, inspect, and_, or_, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Cours, CoursAffectation, Matiere, Salle, Utilisateur, Filiere, Niveau, SerieCours, VersionFlux
+from app.backplane import publish, subscribe
+
+# Durée de vie des listes de filtres en cache : filet de sécurité si plusieurs processus servent l'application
+DUREE_CACHE_FILTRES = 300 # secondes
+# Emploi du temps étudiant : semaine en cours et semaines suivantes
+SEMAINES_AFFICHEES = 4
+# Nombre maximal d'emplois du temps (cohorte, semaine) gardés en mémoire
+MAX_COHORTES = 512
+# Les caches ci-dessous sont propres à chaque processus : leurs invalidations sont diffusées aux autres
+# par le bus (app/backplane.py). Durées de vie des entrées, filet de sécurité si un message est perdu :
+DUREE_EMPLOI_DU_TEMPS = 600 # secondes
+
+_filtres = None
+_filtres_expire = 0
+_lock = Lock()
+
+
+def projected_courses():
+    """Requête de base : cours avec les noms de la matière, de l'enseignant et de la salle, en tuples légers."""
+    return db.session.query(
+        Cours.id, Cours.date_cours, Cours.heure_debut, Cours.heure_fin,
+        Matiere.nom_matiere,
+        Utilisateur.prenom.label('enseignant_prenom'), Utilisateur.nom.label('enseignant_nom'),
+        Salle.nom_salle
+    ).join(Matiere, Matiere.id == Cours.matiere_id)\
+    .join(Utilisateur, Utilisateur.id == Cours.enseignant_id)\
+    .join(Salle, Salle.id == Cours.salle_id)
+
+
+def week_courses(date_debut, date_fin, filiere_id=None, niveau_id=None, enseignant_id=None, salle_id=None):
+    """
+    Cours d'une semaine en une seule requête projetée : des tuples légers portant déjà
+    les noms de la matière, de l'enseignant et de la salle (pas de chargement paresseux).
+    Le filtre filière/niveau passe par un EXISTS : un cours affecté à plusieurs groupes
+    de la promotion n'apparaît qu'une fois.
+    """
+    query = projected_courses().filter(Cours.date_cours.between(date_debut, date_fin))
+
+    if enseignant_id:
+        query = query.filter(Cours.enseignant_id == enseignant_id)
+    if salle_id:
+        query = query.filter(Cours.salle_id == salle_id)
+    if filiere_id or niveau_id:
+        affectation = db.select(CoursAffectation.id).where(CoursAffectation.cours_id == Cours.id)
+        if filiere_id:
+            affectation = affectation.where(CoursAffectation.filiere_id == filiere_id)
+        if niveau_id:
+            affectation = affectation.where(CoursAffectation.niveau_id == niveau_id)
+        query = query.filter(affectation.exists())
+
+    return query.order_by(Cours.date_cours, Cours.heure_debut).all()
+
+
+def schedule_filters():
+    """
+    Listes des filtres (filières, niveaux, enseignants, salles) sous forme de tuples légers,
+    gardées en cache et invalidées dès qu'une de ces tables est modifiée.
+    """
+    global _filtres, _filtres_expire
+    with _lock:
+        if _filtres is None or time.monotonic() > _filtres_expire:
+            _filtres = {
+                'filieres': db.session.query(Filiere.id, Filiere.nom_filiere).order_by(Filiere.nom_filiere).all(),
+                'niveaux': db.session.query(Niveau.id, Niveau.nom_niveau).order_by(Niveau.id).all(),
+                'enseignants': db.session.query(Utilisateur.id, Utilisateur.prenom, Utilisateur.nom)
+                    .filter(Utilisateur.role == 'enseignant').order_by(Utilisateur.nom).all(),
+                'salles': db.session.query(Salle.id, Salle.nom_salle).order_by(Salle.nom_salle).all(),
+            }
+            _filtres_expire = time.monotonic() + DUREE_CACHE_FILTRES
+        return _filtres
+
+
+def invalidate_schedule_filters():
+    global _filtres
+    with _lock:
+        _filtres = None
+
+
+def _touches_filters(objet):
+    """Vrai si l'objet modifié peut changer une des listes de filtres."""
+    if isinstance(objet, (Filiere, Niveau, Salle)):
+        return True
+    if isinstance(objet, Utilisateur):
+        # La mise à jour de last_seen ne doit pas vider le cache
+        return any(inspect(objet).attrs[champ].history.has_changes() for champ in ('nom', 'prenom', 'role'))
+    return False
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_on_flush(session, contexte):
+    if any(_touches_filters(o) for o in session.new) or any(_touches_filters(o) for o in session.dirty) \
+            or any(isinstance(o, (Filiere, Niveau, Salle, Utilisateur)) for o in session.deleted):
+        invalidate_schedule_filters()
+
+
+# ===================================================================
+# ==             EMPLOIS DU TEMPS ÉTUDIANTS PAR COHORTE            ==
+# ===================================================================
+def cohort_filter(filiere_id, niveau_id, groupe_id):
+    """Condition « le cours concerne la cohorte » : cours communs de la promotion ou cours de son groupe."""
+    cible = and_(CoursAffectation.filiere_id == filiere_id, CoursAffectation.niveau_id == niveau_id, CoursAffectation.groupe_id == None)
+    if groupe_id:
+        cible = or_(cible, CoursAffectation.groupe_id == groupe_id)
+    return db.select(CoursAffectation.id).where(CoursAffectation.cours_id == Cours.id, cible).exists()
+
+
+def cohort_courses(filiere_id, niveau_id, groupe_id, date_debut, date_fin):
+    """Cours d'une cohorte (filière, niveau, groupe) entre deux dates, en une requête."""
+    return projected_courses().filter(Cours.date_cours.between(date_debut, date_fin), cohort_filter(filiere_id, niveau_id, groupe_id))\
+        .order_by(Cours.date_cours, Cours.heure_debut, Cours.id).all()
+
+
+def encode_cursor(cours):
+    """Curseur de pagination : position (date, heure de début, id) du dernier cours renvoyé."""
+    return f"{cours.date_cours.isoformat()}_{cours.heure_debut.strftime('%H:%M:%S')}_{cours.id}"
+
+
+def decode_cursor(curseur):
+    """Inverse de encode_cursor ; lève ValueError si le curseur est invalide."""
+    date_texte, heure_texte, cours_id = curseur.split('_')
+    return datetime.strptime(date_texte, '%Y-%m-%d').date(), datetime.strptime(heure_texte, '%H:%M:%S').time(), int(cours_id)
+
+
+def timetable_page(filtre, date_debut, date_fin, apres=None, limite=50):
+    """
+    Une page de cours dans une fenêtre de dates, paginée par curseur sur (date_cours, heure_debut, id) :
+    pas d'OFFSET, chaque page reprend l'index là où la précédente s'est arrêtée.
+    Retourne (cours, curseur de la page suivante ou None).
+    """
+    query = projected_courses().filter(filtre, Cours.date_cours.between(date_debut, date_fin))
+    if apres:
+        date_cours, heure_debut, cours_id = apres
+        # Forme développée de (date, heure, id) > curseur, dont le premier terme borne le parcours d'index
+        query = query.filter(
+            Cours.date_cours >= date_cours,
+            or_(
+                Cours.date_cours > date_cours,
+                Cours.heure_debut > heure_debut,
+                and_(Cours.heure_debut == heure_debut, Cours.id > cours_id)
+            )
+        )
+    lignes = query.order_by(Cours.date_cours, Cours.heure_debut, Cours.id).limit(limite + 1).all()
+    suivant = encode_cursor(lignes[limite - 1]) if len(lignes) > limite else None
+    return lignes[:limite], suivant
+
+
+def timetable_row_json(cours):
+    """Sérialise un cours projeté pour l'API d'emploi du temps (libellés formatés comme dans les gabarits)."""
+    return {
+        'id': cours.id,
+        'date': cours.date_cours.isoformat(),
+        'jour': cours.date_cours.strftime('%A %d/%m/%Y'),
+        'horaire': f"{cours.heure_debut.strftime('%Hh%M')} - {cours.heure_fin.strftime('%Hh%M')}",
+        'matiere': cours.nom_matiere,
+        'salle': cours.nom_salle,
+        'enseignant': f"{cours.enseignant_prenom} {cours.enseignant_nom}",
+    }
+
+
+class CohortTimetableCache:
+    """
+    Cache LRU borné des emplois du temps, indexé par (filiere_id, niveau_id, groupe_id, lundi).
+    Tous les étudiants d'une même cohorte partagent la même entrée.
+    Invalidation ciblée : par cours (index inverse cours -> entrées) ou par public
+    (un groupe, ou toute une promotion pour un cours commun). Une entrée expire après DUREE_EMPLOI_DU_TEMPS.
+    """
+
+    def __init__(self, max_entrees=MAX_COHORTES, duree=DUREE_EMPLOI_DU_TEMPS):
+        self.max_entrees = max_entrees
+        self.duree = duree
+        self._entrees = OrderedDict() # clé -> (cours, expiration)
+        self._par_cours = {} # cours_id -> clés des entrées qui le contiennent
+        # Incrémenté à chaque invalidation : une lecture faite hors verrou pendant une invalidation
+        # (qui ne peut pas savoir quelles entrées sont en cours de calcul) n'est pas mise en cache
+        self._generation = 0
+        self._lock = Lock()
+
+    def get(self, filiere_id, niveau_id, groupe_id, lundi):
+        cle = (filiere_id, niveau_id, groupe_id, lundi)
+        with self._lock:
+            entree = self._entrees.get(cle)
+            if entree is not None and time.monotonic() < entree[1]:
+                self._entrees.move_to_end(cle)
+                return entree[0]
+            generation = self._generation
+        cours = tuple(cohort_courses(filiere_id, niveau_id, groupe_id, lundi, lundi + timedelta(weeks=SEMAINES_AFFICHEES, days=-1)))
+        with self._lock:
+            if generation != self._generation:
+                return cours
+            self._drop(cle)
+            self._entrees[cle] = (cours, time.monotonic() + self.duree)
+            for c in cours:
+                self._par_cours.setdefault(c.id, set()).add(cle)
+            while len(self._entrees) > self.max_entrees:
+                self._drop(next(iter(self._entrees)))
+        return cours
+
+    def _drop(self, cle):
+        """Retire une entrée et ses références dans l'index inverse. Appelé verrou tenu."""
+        for c in self._entrees.pop(cle, ((), 0))[0]:
+            cles = self._par_cours.get(c.id)
+            if cles is not None:
+                cles.discard(cle)
+                if not cles:
+                    del self._par_cours[c.id]
+
+    def invalidate_courses(self, cours_ids):
+        """Oublie les emplois du temps qui contiennent l'un de ces cours (modifié ou supprimé)."""
+        with self._lock:
+            self._generation += 1
+            for cours_id in cours_ids:
+                for cle in list(self._par_cours.get(cours_id, ())):
+                    self._drop(cle)
+
+    def invalidate_audiences(self, affectations):
+        """
+        Oublie les emplois du temps des publics donnés, sous forme de tuples (groupe_id, filiere_id, niveau_id) :
+        un groupe touche sa seule cohorte, un cours commun (groupe_id None) toutes les cohortes de la promotion.
+        """
+        groupes = {int(g) for g, _, _ in affectations if g}
+        promotions = {(int(f), int(n)) for g, f, n in affectations if not g and f and n}
+        if not groupes and not promotions:
+            return
+        with self._lock:
+            self._generation += 1
+            for cle in [c for c in self._entrees if c[2] in groupes or (c[0], c[1]) in promotions]:
+                self._drop(cle)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entrees.clear()
+            self._par_cours.clear()
+
+
+timetable_cache = CohortTimetableCache()
+
+
+class FeedValidators:
+    """
+    Validateurs HTTP (ETag, Last-Modified) des flux iCalendar, tirés de la table versions_flux :
+    tous les processus donnent le même ETag à un flux tant qu'aucun cours de son périmètre n'a changé.
+    Périmètres : ('cohorte', filiere_id, niveau_id, groupe_id), ('enseignant', id), ('salle', id).
+    Chacun dépend de la version globale ('tout') et de ses propres versions, lues par clé primaire.
+    """
+
+    @staticmethod
+    def _keys(perimetre):
+        if perimetre[0] == 'cohorte':
+            _, filiere_id, niveau_id, groupe_id = perimetre
+            cles = ['tout', f'promotion:{filiere_id}:{niveau_id}']
+            if groupe_id:
+                cles.append(f'groupe:{groupe_id}')
+            return cles
+        return ['tout', f'{perimetre[0]}:{perimetre[1]}']
+
+    def get(self, perimetre):
+        cles = self._keys(perimetre)
+        versions = {
+            perimetre: (version, date_modification) for perimetre, version, date_modification in
+            db.session.query(VersionFlux.perimetre, VersionFlux.version, VersionFlux.date_modification).filter(VersionFlux.perimetre.in_(cles))
+        }
+        if 'tout' not in versions:
+            # Première consultation depuis la création de la table : la version globale sert de date de départ
+            versions['tout'] = self._bump({'tout'}, creer_seulement=True)['tout']
+        etag = '-'.join(str(versions[c][0]) if c in versions else '0' for c in cles)
+        return etag, max(date_modification for _, date_modification in versions.values())
+
+    @staticmethod
+    def _bump(cles, creer_seulement=False):
+        """
+        Incrémente les versions données (ou les crée seulement) dans une transaction courte, validée à part :
+        appelée après le commit des cours, un client qui lirait entre les deux recharge le flux une fois de plus.
+        Retourne {clé: (version, date_modification)} tel que vu par cette transaction.
+        """
+        table = VersionFlux.__table__
+        maintenant = datetime.utcnow().replace(microsecond=0)
+        incrementer = update(table).values(version=table.c.version + 1, date_modification=maintenant)
+        with db.engine.begin() as connexion:
+            for cle in sorted(cles): # Ordre fixe : pas d'interblocage entre deux écritures concurrentes
+                if not creer_seulement and connexion.execute(incrementer.where(table.c.perimetre == cle)).rowcount:
+                    continue
+                try:
+                    with connexion.begin_nested():
+                        connexion.execute(insert(table).values(perimetre=cle, version=1, date_modification=maintenant))
+                except IntegrityError:
+                    # Ligne créée entre-temps par un autre processus
+                    if not creer_seulement:
+                        connexion.execute(incrementer.where(table.c.perimetre == cle))
+            lignes = connexion.execute(db.select(table.c.perimetre, table.c.version, table.c.date_modification).where(table.c.perimetre.in_(cles)))
+            return {perimetre: (version, date_modification) for perimetre, version, date_modification in lignes}
+
+    def invalidate(self, publics=(), enseignant_ids=(), salle_ids=()):
+        """Change l'ETag des périmètres touchés : publics (groupe_id, filiere_id, niveau_id) comme pour le cache par cohorte."""
+        cles = {f'groupe:{int(g)}' for g, _, _ in publics if g}
+        cles |= {f'promotion:{int(f)}:{int(n)}' for g, f, n in publics if not g and f and n}
+        cles |= {f'enseignant:{int(e)}' for e in enseignant_ids if e} | {f'salle:{int(s)}' for s in salle_ids if s}
+        if cles:
+            self._bump(cles)
+
+    def clear(self):
+        self._bump({'tout'})
+
+
+feed_validators = FeedValidators()
+
+
+def _invalidate_caches(changements):
+    """
+    Applique des changements aux caches de ce processus : dictionnaire avec 'tout' (booléen) ou les listes
+    'cours' (IDs), 'publics' (groupe_id, filiere_id, niveau_id), 'enseignants' et 'salles' (IDs).
+    """
+    if changements.get('tout'):
+        timetable_cache.clear()
+        return
+    timetable_cache.invalidate_courses(changements.get('cours', ()))
+    timetable_cache.invalidate_audiences(changements.get('publics', ()))
+
+
+def _invalidate_everywhere(changements):
+    """
+    Invalide les caches de ce processus, puis ceux des autres processus par le bus ;
+    les versions des flux iCalendar, communes à tous, sont incrémentées une seule fois, ici.
+    """
+    if not any(changements.values()):
+        return
+    _invalidate_caches(changements)
+    if changements.get('tout'):
+        feed_validators.clear()
+    else:
+        feed_validators.invalidate(changements.get('publics', ()), changements.get('enseignants', ()), changements.get('salles', ()))
+    publish('emplois_du_temps', {
+        'tout': bool(changements.get('tout')),
+        'cours': sorted(int(c) for c in changements.get('cours', ())),
+        'publics': sorted({tuple(p) for p in changements.get('publics', ())}, key=repr),
+        'enseignants': sorted({int(e) for e in changements.get('enseignants', ()) if e}),
+        'salles': sorted({int(s) for s in changements.get('salles', ()) if s}),
+    })
+
+
+@subscribe('emplois_du_temps')
+def _timetables_changed(changements):
+    """Des cours ont changé dans un autre processus."""
+    changements['publics'] = [tuple(p) for p in changements.get('publics', ())]
+    _invalidate_caches(changements)
+
+
+def invalidate_timetables(publics=(), enseignant_ids=(), salle_ids=()):
+    """
+    Invalidation après une écriture en masse (INSERT/UPDATE/DELETE hors ORM, invisibles des écouteurs ci-dessous),
+    à appeler après le commit. `publics` : tuples (groupe_id, filiere_id, niveau_id).
+    """
+    _invalidate_everywhere({
+        'publics': [tuple(p) for p in publics],
+        'enseignants': [int(e) for e in enseignant_ids if e],
+        'salles': [int(s) for s in salle_ids if s],
+    })
+
+
+def _old_and_new(objet, champ):
+    """Valeur actuelle et anciennes valeurs d'un attribut modifié."""
+    historique = inspect(objet).attrs[champ].history
+    return set(historique.unchanged) | set(historique.added) | set(historique.deleted) | {getattr(objet, champ)}
+
+
+# Les modifications faites par l'ORM sont relevées au flush et appliquées au commit :
+# invalider avant le commit laisserait une autre requête recharger l'ancien état.
+@event.listens_for(Session, 'after_flush')
+def _collect_timetable_changes(session, contexte):
+    en_attente = session.info.setdefault('emplois_du_temps', {'cours': set(), 'publics': set(), 'enseignants': set(), 'salles': set(), 'tout': False})
+    cours_modifies = []
+    for objet in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(objet, CoursAffectation):
+            en_attente['publics'].add((objet.groupe_id, objet.filiere_id, objet.niveau_id))
+        elif isinstance(objet, (Cours, SerieCours)):
+            en_attente['enseignants'] |= _old_and_new(objet, 'enseignant_id')
+            en_attente['salles'] |= _old_and_new(objet, 'salle_id')
+            if isinstance(objet, Cours) and objet not in session.new:
+                en_attente['cours'].add(objet.id)
+                if objet not in session.deleted:
+                    cours_modifies.append(objet.id)
+        elif isinstance(objet, (Matiere, Salle)) and objet not in session.new:
+            en_attente['tout'] = True
+        elif isinstance(objet, Utilisateur) and objet.role == 'enseignant' and objet not in session.new:
+            if objet in session.deleted or any(inspect(objet).attrs[champ].history.has_changes() for champ in ('nom', 'prenom')):
+                en_attente['tout'] = True
+    if cours_modifies:
+        # Un cours déplacé sans toucher à ses affectations : ses publics sont relus pour les flux iCalendar
+        en_attente['publics'].update(session.execute(
+            db.select(CoursAffectation.groupe_id, CoursAffectation.filiere_id, CoursAffectation.niveau_id)
+            .where(CoursAffectation.cours_id.in_(cours_modifies))
+        ).all())
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_timetable_changes(session):
+    if session.in_nested_transaction():
+        return # Savepoint (begin_nested) : les changements attendent le commit de la transaction
+    en_attente = session.info.pop('emplois_du_temps', None)
+    if not en_attente:
+        return
+    _invalidate_everywhere({'tout': True} if en_attente['tout'] else en_attente)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_timetable_changes(session):
+    if not session.in_nested_transaction():
+        session.info.pop('emplois_du_temps', None)
@@ -0,0 +1,500 @@
+# app/solver.py
+# Génération automatique d'une semaine d'emploi du temps sans conflit.
+#
+# Le cœur du solveur (`solve`) ne dépend ni de Flask ni de la base de données : il travaille sur
+# un « problème » fait de types simples pour pouvoir être exécuté dans un processus séparé.
+# La grille hebdomadaire est découpée en créneaux de PAS_MINUTES ; l'occupation d'une ressource
+# pour un jour est un entier dont chaque bit représente un créneau.
+import json
+import random
+import time
+import uuid
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+
+JOURS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi']
+PAS_MINUTES = 30
+DEBUT_JOURNEE = 7 * 60 # 07h00
+FIN_JOURNEE = 20 * 60 # 20h00
+NB_CRENEAUX = (FIN_JOURNEE - DEBUT_JOURNEE) // PAS_MINUTES
+
+# Une séance à placer. `duree` est en créneaux, `enseignants` la liste des enseignants possibles.
+Besoin = namedtuple('Besoin', ['id', 'groupe_id', 'matiere_id', 'duree', 'effectif', 'enseignants'])
+# Une séance placée : jour (0 = lundi), créneau de début, enseignant et salle retenus.
+Placement = namedtuple('Placement', ['jour', 'debut', 'enseignant_id', 'salle_id'])
+
+
+def slot_mask(debut, duree):
+    """Masque binaire des créneaux [debut, debut + duree[."""
+    return ((1 << duree) - 1) << debut
+
+
+JOURNEE_COMPLETE = slot_mask(0, NB_CRENEAUX)
+
+
+def availability(disponibilites, enseignant_id, jour):
+    """
+    Masque des créneaux où l'enseignant est disponible ce jour-là. Un enseignant sans aucune disponibilité
+    déclarée n'est pas contraint (même règle que app/availability.py) : toute la journée lui est ouverte.
+    """
+    if enseignant_id not in disponibilites:
+        return JOURNEE_COMPLETE
+    return disponibilites[enseignant_id].get(jour, 0)
+
+
+def interval_to_mask(minutes_debut, minutes_fin, complet=True):
+    """
+    Convertit un intervalle horaire (en minutes depuis minuit) en masque de créneaux.
+    complet=True ne garde que les créneaux entièrement inclus (disponibilités) ;
+    complet=False garde tous les créneaux touchés (occupations).
+    """
+    if complet:
+        premier = -(-(minutes_debut - DEBUT_JOURNEE) // PAS_MINUTES)
+        dernier = (minutes_fin - DEBUT_JOURNEE) // PAS_MINUTES
+    else:
+        premier = (minutes_debut - DEBUT_JOURNEE) // PAS_MINUTES
+        dernier = -(-(minutes_fin - DEBUT_JOURNEE) // PAS_MINUTES)
+    premier, dernier = max(premier, 0), min(dernier, NB_CRENEAUX)
+    if dernier <= premier:
+        return 0
+    return slot_mask(premier, dernier - premier)
+
+
+class _State:
+    """Occupation courante des enseignants, salles et groupes, avec les séances responsables."""
+
+    def __init__(self, occupes):
+        # (type, id, jour) -> masque des créneaux bloqués par des cours existants (non déplaçables)
+        self.fixes = defaultdict(int, occupes)
+        # (type, id, jour) -> {besoin_id: masque}
+        self.places = defaultdict(dict)
+        self.placements = {}
+
+    def mask(self, cle):
+        masque = self.fixes[cle]
+        for m in self.places[cle].values():
+            masque |= m
+        return masque
+
+    def keys(self, besoin, placement):
+        return [
+            ('enseignant', placement.enseignant_id, placement.jour),
+            ('salle', placement.salle_id, placement.jour),
+            ('groupe', besoin.groupe_id, placement.jour),
+        ]
+
+    def place(self, besoin, placement):
+        masque = slot_mask(placement.debut, besoin.duree)
+        for cle in self.keys(besoin, placement):
+            self.places[cle][besoin.id] = masque
+        self.placements[besoin.id] = placement
+
+    def unplace(self, besoin):
+        placement = self.placements.pop(besoin.id)
+        for cle in self.keys(besoin, placement):
+            del self.places[cle][besoin.id]
+
+    def blockers(self, cle, masque):
+        """Séances placées qui chevauchent `masque` sur la ressource ; None si un cours fixe bloque."""
+        if self.fixes[cle] & masque:
+            return None
+        return {bid for bid, m in self.places[cle].items() if m & masque}
+
+
+def _domains(probleme):
+    """
+    Propagation initiale : pour chaque séance, liste des (jour, début, enseignant) compatibles
+    avec les disponibilités, les cours déjà planifiés et l'existence d'une salle assez grande.
+    """
+    occupes = probleme['occupes']
+    disponibilites = probleme['disponibilites']
+    capacite_max = max((c for _, c in probleme['salles']), default=0)
+    domaines = {}
+    for besoin in probleme['besoins']:
+        valeurs = []
+        if besoin.effectif <= capacite_max:
+            for jour in range(len(JOURS)):
+                bloque_groupe = occupes.get(('groupe', besoin.groupe_id, jour), 0)
+                for enseignant_id in besoin.enseignants:
+                    dispo = availability(disponibilites, enseignant_id, jour)
+                    libre = dispo & ~occupes.get(('enseignant', enseignant_id, jour), 0) & ~bloque_groupe
+                    if not libre:
+                        continue
+                    for debut in range(NB_CRENEAUX - besoin.duree + 1):
+                        masque = slot_mask(debut, besoin.duree)
+                        if libre & masque == masque:
+                            valeurs.append((jour, debut, enseignant_id))
+        domaines[besoin.id] = valeurs
+    return domaines
+
+
+def _rooms_for(probleme, effectif):
+    """Salles assez grandes, de la plus petite à la plus grande (meilleur ajustement)."""
+    return [salle_id for salle_id, capacite in probleme['salles'] if capacite >= effectif]
+
+
+def _try_place(state, besoin, valeur, salles):
+    """Place la séance sur la valeur donnée si une salle est libre ; retourne le placement ou None."""
+    jour, debut, enseignant_id = valeur
+    masque = slot_mask(debut, besoin.duree)
+    if state.mask(('enseignant', enseignant_id, jour)) & masque or state.mask(('groupe', besoin.groupe_id, jour)) & masque:
+        return None
+    for salle_id in salles:
+        if not state.mask(('salle', salle_id, jour)) & masque:
+            placement = Placement(jour, debut, enseignant_id, salle_id)
+            state.place(besoin, placement)
+            return placement
+    return None
+
+
+def _cheapest_move(state, besoin, valeurs, salles, tabou, iteration, rng):
+    """
+    Choisit la valeur qui oblige à retirer le moins de séances déjà placées (min-conflicts).
+    Les séances taboues ou bloquées par un cours fixe ne peuvent pas être retirées.
+    """
+    meilleur, meilleur_cout = None, None
+    for valeur in rng.sample(valeurs, min(len(valeurs), 200)):
+        jour, debut, enseignant_id = valeur
+        masque = slot_mask(debut, besoin.duree)
+        a_retirer = set()
+        valide = True
+        for cle in (('enseignant', enseignant_id, jour), ('groupe', besoin.groupe_id, jour)):
+            bloquants = state.blockers(cle, masque)
+            if bloquants is None or any(tabou.get(b, -1) > iteration for b in bloquants):
+                valide = False
+                break
+            a_retirer |= bloquants
+        if not valide:
+            continue
+        salle_retenue, retrait_salle = None, None
+        for salle_id in salles:
+            bloquants = state.blockers(('salle', salle_id, jour), masque)
+            if bloquants is None or any(tabou.get(b, -1) > iteration for b in bloquants):
+                continue
+            supplement = bloquants - a_retirer
+            if retrait_salle is None or len(supplement) < len(retrait_salle):
+                salle_retenue, retrait_salle = salle_id, supplement
+                if not supplement:
+                    break
+        if salle_retenue is None:
+            continue
+        cout = len(a_retirer) + len(retrait_salle)
+        if meilleur_cout is None or cout < meilleur_cout:
+            meilleur, meilleur_cout = (Placement(jour, debut, enseignant_id, salle_retenue), a_retirer | retrait_salle), cout
+            if cout == 0:
+                break
+    return meilleur
+
+
+def solve(probleme, budget_secondes=10.0, seed=None):
+    """
+    Résout un problème de planification hebdomadaire.
+
+    1. Propagation : réduction des domaines (disponibilités, cours existants, capacité des salles).
+    2. Construction gloutonne, séances les plus contraintes d'abord, avec vérification en avant.
+    3. Recherche locale min-conflicts avec liste tabou pour placer les séances restantes,
+       dans la limite du budget de temps.
+
+    Retourne un dictionnaire : placements {besoin_id: Placement}, non_places, statistiques.
+    """
+    debut_chrono = time.monotonic()
+    echeance = debut_chrono + budget_secondes
+    rng = random.Random(seed)
+    besoins = {b.id: b for b in probleme['besoins']}
+    domaines = _domains(probleme)
+    salles_par_effectif = {}
+
+    def salles(besoin):
+        if besoin.effectif not in salles_par_effectif:
+            salles_par_effectif[besoin.effectif] = _rooms_for(probleme, besoin.effectif)
+        return salles_par_effectif[besoin.effectif]
+
+    impossibles = [bid for bid, valeurs in domaines.items() if not valeurs]
+    candidats = [bid for bid, valeurs in domaines.items() if valeurs]
+    # Les séances aux domaines les plus petits (puis les plus longues et les plus grandes) d'abord
+    candidats.sort(key=lambda bid: (len(domaines[bid]), -besoins[bid].duree, -besoins[bid].effectif, rng.random()))
+
+    state = _State(probleme['occupes'])
+    en_attente = []
+    for bid in candidats:
+        besoin = besoins[bid]
+        valeurs = domaines[bid][:]
+        rng.shuffle(valeurs)
+        if not any(_try_place(state, besoin, valeur, salles(besoin)) for valeur in valeurs):
+            en_attente.append(bid)
+
+    meilleurs_placements = dict(state.placements)
+    iterations = 0
+    echecs_consecutifs = 0
+    tabou = {}
+    while en_attente and time.monotonic() < echeance:
+        iterations += 1
+        bid = en_attente.pop(rng.randrange(len(en_attente)))
+        besoin = besoins[bid]
+        mouvement = _cheapest_move(state, besoin, domaines[bid], salles(besoin), tabou, iterations, rng)
+        if mouvement is None:
+            en_attente.append(bid)
+            # Plus aucun mouvement possible, même après expiration des tabous : inutile d'insister
+            echecs_consecutifs += 1
+            if echecs_consecutifs > 20 * len(en_attente) + 20:
+                break
+            continue
+        echecs_consecutifs = 0
+        placement, a_retirer = mouvement
+        for autre in a_retirer:
+            state.unplace(besoins[autre])
+            en_attente.append(autre)
+        state.place(besoin, placement)
+        tabou[bid] = iterations + 7 + rng.randrange(5)
+        if len(state.placements) > len(meilleurs_placements):
+            meilleurs_placements = dict(state.placements)
+
+    return {
+        'placements': meilleurs_placements,
+        'non_places': sorted(set(besoins) - set(meilleurs_placements)),
+        'impossibles': sorted(impossibles),
+        'iterations': iterations,
+        'duree': round(time.monotonic() - debut_chrono, 3),
+        'seed': seed,
+    }
+
+
+def verify(probleme, placements):
+    """Vérifie une solution ; retourne la liste des violations (vide si la solution est valide)."""
+    besoins = {b.id: b for b in probleme['besoins']}
+    capacites = dict(probleme['salles'])
+    occupation = defaultdict(int, probleme['occupes'])
+    violations = []
+    for bid, p in placements.items():
+        besoin = besoins[bid]
+        masque = slot_mask(p.debut, besoin.duree)
+        if p.enseignant_id not in besoin.enseignants:
+            violations.append((bid, "enseignant non habilité"))
+        if availability(probleme['disponibilites'], p.enseignant_id, p.jour) & masque != masque:
+            violations.append((bid, "hors disponibilité"))
+        if capacites.get(p.salle_id, 0) < besoin.effectif:
+            violations.append((bid, "salle trop petite"))
+        for cle in (('enseignant', p.enseignant_id, p.jour), ('salle', p.salle_id, p.jour), ('groupe', besoin.groupe_id, p.jour)):
+            if occupation[cle] & masque:
+                violations.append((bid, f"conflit {cle[0]}"))
+            occupation[cle] |= masque
+    return violations
+
+
+# ===================================================================
+# ==             EXÉCUTION EN ARRIÈRE-PLAN (POOL DE PROCESSUS)     ==
+# ===================================================================
+# Une génération jamais appliquée (abandonnée, en échec) est supprimée au-delà de ce délai
+DUREE_CONSERVATION = timedelta(days=1)
+
+_executor = None
+
+
+def _get_executor(max_workers=None):
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max_workers)
+    return _executor
+
+
+def solve_best(probleme, budget_secondes=10.0, essais=2, max_workers=None):
+    """
+    Lance `essais` résolutions indépendantes (graines différentes) dans le pool de processus
+    et retourne la meilleure. Lève l'erreur de la première résolution si toutes échouent.
+    """
+    executor = _get_executor(max_workers)
+    futures = [executor.submit(solve, probleme, budget_secondes, seed) for seed in range(essais)]
+    wait(futures)
+    resultats = [f.result() for f in futures if f.exception() is None]
+    if not resultats:
+        raise futures[0].exception()
+    return max(resultats, key=lambda r: len(r['placements']))
+
+
+def dump_problem(probleme):
+    """Sérialise un problème en JSON (les clés entières ou tuples deviennent des listes)."""
+    return json.dumps({
+        'lundi': probleme['lundi'].isoformat(),
+        'besoins': [list(b[:5]) + [list(b.enseignants)] for b in probleme['besoins']],
+        'salles': [list(s) for s in probleme['salles']],
+        'disponibilites': [[e, jour, m] for e, jours in probleme['disponibilites'].items() for jour, m in jours.items()],
+        'occupes': [list(cle) + [m] for cle, m in probleme['occupes'].items()],
+    })
+
+
+def load_problem(texte):
+    donnees = json.loads(texte)
+    disponibilites = defaultdict(dict)
+    for enseignant_id, jour, masque in donnees['disponibilites']:
+        disponibilites[enseignant_id][jour] = masque
+    return {
+        'lundi': date.fromisoformat(donnees['lundi']),
+        'besoins': [Besoin(*b[:5], tuple(b[5])) for b in donnees['besoins']],
+        'salles': [tuple(s) for s in donnees['salles']],
+        'disponibilites': dict(disponibilites),
+        'occupes': {(t, id_, jour): masque for t, id_, jour, masque in donnees['occupes']},
+    }
+
+
+def dump_result(resultat):
+    return json.dumps(dict(resultat, placements=[[bid] + list(p) for bid, p in resultat['placements'].items()]))
+
+
+def load_result(texte):
+    resultat = json.loads(texte)
+    resultat['placements'] = {p[0]: Placement(*p[1:]) for p in resultat['placements']}
+    return resultat
+
+
+def submit(probleme, budget_secondes=10.0, essais=2):
+    """
+    Enregistre une génération (table generations_edt) et met sa résolution en file pour le worker
+    des tâches de fond (tâche 'generation_edt'). La transaction n'est pas validée ici.
+    Retourne l'identifiant de la génération.
+    """
+    from app import db
+    from app.models import GenerationEdt
+    from app.jobs import enqueue
+    generation = GenerationEdt(id=uuid.uuid4().hex, probleme=dump_problem(probleme))
+    db.session.add(generation)
+    enqueue('generation_edt', generation_id=generation.id, budget_secondes=budget_secondes, essais=essais)
+    return generation.id
+
+
+def run_generation(generation_id, budget_secondes, essais):
+    """Résout une génération enregistrée (exécuté par le worker) ; sans effet si elle a été supprimée entre-temps."""
+    from app import db
+    from app.models import GenerationEdt
+    generation = db.session.get(GenerationEdt, generation_id)
+    if generation is None or generation.statut != 'en_cours':
+        return
+    try:
+        resultat = solve_best(load_problem(generation.probleme), budget_secondes, essais)
+    except Exception as e:
+        generation.statut, generation.erreur = 'echec', str(e)
+        return
+    generation.resultat = dump_result(resultat)
+    generation.statut = 'termine'
+
+
+def job_status(job_id, verrouiller=False):
+    """
+    Retourne None si la génération est inconnue, sinon son état et, une fois terminée, la meilleure solution.
+    `verrouiller` verrouille la ligne jusqu'à la fin de la transaction (application de la solution).
+    """
+    from app import db
+    from app.models import GenerationEdt
+    generation = db.session.get(GenerationEdt, job_id, with_for_update=verrouiller)
+    if generation is None:
+        return None
+    statut = {'etat': generation.statut, 'probleme': load_problem(generation.probleme)}
+    if generation.statut == 'termine':
+        statut['resultat'] = load_result(generation.resultat)
+    elif generation.statut == 'echec':
+        statut['erreur'] = generation.erreur
+    return statut
+
+
+def forget_job(job_id):
+    """Supprime une génération (solution appliquée). La transaction n'est pas validée ici."""
+    from app import db
+    from app.models import GenerationEdt
+    db.session.query(GenerationEdt).filter(GenerationEdt.id == job_id).delete(synchronize_session=False)
+
+
+def purge_generations():
+    """Supprime les générations plus anciennes que DUREE_CONSERVATION ; retourne leur nombre."""
+    from app import db
+    from app.models import GenerationEdt
+    limite = datetime.utcnow() - DUREE_CONSERVATION
+    return db.session.query(GenerationEdt).filter(GenerationEdt.date_creation < limite).delete(synchronize_session=False)
+
+
+# ===================================================================
+# ==            CONSTRUCTION DU PROBLÈME DEPUIS LA BASE            ==
+# ===================================================================
+def build_problem(lundi, demandes):
+    """
+    Construit un problème à partir de la base pour la semaine commençant le `lundi`.
+    `demandes` est une liste de tuples (groupe_id, matiere_id, duree_minutes, nombre_de_seances).
+    Retourne (probleme, erreurs) ; les erreurs décrivent les demandes ignorées.
+    """
+    from sqlalchemy import func
+    from app import db
+    from app.models import Groupe, Utilisateur, Enseigne, DisponibiliteEnseignant, Salle
+    from app.conflicts import load_occupied_slots, to_minutes
+
+    erreurs = []
+    groupes_ids = {g for g, _, _, _ in demandes}
+    groupes = {g.id: g for g in Groupe.query.filter(Groupe.id.in_(groupes_ids))}
+    effectifs = dict(db.session.query(Utilisateur.groupe_id, func.count(Utilisateur.id)).filter(
+        Utilisateur.role == 'etudiant', Utilisateur.groupe_id.in_(groupes_ids)
+    ).group_by(Utilisateur.groupe_id).all())
+
+    # Enseignants habilités par (matière, filière, niveau)
+    habilitations = defaultdict(list)
+    for e in db.session.query(Enseigne.enseignant_id, Enseigne.matiere_id, Enseigne.filiere_id, Enseigne.niveau_id):
+        habilitations[(e.matiere_id, e.filiere_id, e.niveau_id)].append(e.enseignant_id)
+
+    besoins = []
+    for groupe_id, matiere_id, duree_minutes, nombre in demandes:
+        groupe = groupes.get(groupe_id)
+        if groupe is None:
+            erreurs.append(f"Groupe {groupe_id} introuvable.")
+            continue
+        enseignants = tuple(sorted(habilitations.get((matiere_id, groupe.filiere_id, groupe.niveau_id), ())))
+        if not enseignants:
+            erreurs.append(f"Aucun enseignant n'est déclaré pour la matière {matiere_id} en {groupe.filiere_obj.nom_filiere} / {groupe.niveau_obj.nom_niveau}.")
+            continue
+        if duree_minutes % PAS_MINUTES:
+            # Une séance arrondie à la grille serait publiée plus longue que demandé
+            erreurs.append(f"Durée de {duree_minutes} minutes : elle doit être un multiple de {PAS_MINUTES} minutes.")
+            continue
+        duree = duree_minutes // PAS_MINUTES
+        for _ in range(nombre):
+            besoins.append(Besoin(len(besoins), groupe_id, matiere_id, duree, effectifs.get(groupe_id, 0), enseignants))
+
+    enseignants_ids = {e for b in besoins for e in b.enseignants}
+    disponibilites = defaultdict(lambda: defaultdict(int))
+    for d in DisponibiliteEnseignant.query.filter(DisponibiliteEnseignant.enseignant_id.in_(enseignants_ids)):
+        disponibilites[d.enseignant_id][JOURS.index(d.jour_semaine)] |= interval_to_mask(to_minutes(d.heure_debut), to_minutes(d.heure_fin))
+
+    # Une salle sans capacité renseignée est considérée comme non contraignante
+    salles = sorted(((s.id, s.capacite if s.capacite is not None else 10 ** 6) for s in Salle.query), key=lambda s: s[1])
+
+    # Cours déjà planifiés cette semaine : créneaux bloqués pour les ressources concernées
+    occupes = defaultdict(int)
+    samedi = lundi + timedelta(days=len(JOURS) - 1)
+    groupes_par_promo = defaultdict(list)
+    for g in groupes.values():
+        groupes_par_promo[(g.filiere_id, g.niveau_id)].append(g.id)
+    lignes = load_occupied_slots(lundi, samedi, enseignant_ids=enseignants_ids, salle_ids=[s for s, _ in salles], promotions=set(groupes_par_promo))
+    for row in lignes:
+        jour = (row.date_cours - lundi).days
+        masque = interval_to_mask(to_minutes(row.heure_debut), to_minutes(row.heure_fin), complet=False)
+        occupes[('enseignant', row.enseignant_id, jour)] |= masque
+        occupes[('salle', row.salle_id, jour)] |= masque
+        # Un cours commun à la promotion (sans groupe) bloque chacun de ses groupes
+        for groupe_id in ([row.groupe_id] if row.groupe_id else groupes_par_promo.get((row.filiere_id, row.niveau_id), ())):
+            occupes[('groupe', groupe_id, jour)] |= masque
+
+    probleme = {
+        'lundi': lundi,
+        'besoins': besoins,
+        'salles': salles,
+        'disponibilites': {e: dict(jours) for e, jours in disponibilites.items()},
+        'occupes': dict(occupes),
+    }
+    return probleme, erreurs
+
+
+def placement_times(lundi, besoin, placement):
+    """Convertit un placement en (date, heure de début, heure de fin)."""
+    from app.timetable_import import from_minutes
+    debut = DEBUT_JOURNEE + placement.debut * PAS_MINUTES
+    return (
+        lundi + timedelta(days=placement.jour),
+        from_minutes(debut),
+        from_minutes(debut + besoin.duree * PAS_MINUTES),
+    )
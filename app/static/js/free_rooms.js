@@ -0,0 +1,56 @@
+// Suggestions de salles libres dans les formulaires de création/modification de cours.
+// Le formulaire doit contenir #salle_id, #date_cours, #heure_debut, #heure_fin, #capacite_min et #salles-libres.
+document.addEventListener('DOMContentLoaded', function () {
+    const suggestions = document.getElementById('salles-libres');
+    if (!suggestions) return;
+
+    const salleSelect = document.getElementById('salle_id');
+    const champs = ['date_cours', 'heure_debut', 'heure_fin', 'capacite_min'].map(id => document.getElementById(id));
+    const [dateInput, debutInput, finInput, capaciteInput] = champs;
+    const excludeCoursId = suggestions.dataset.excludeCoursId;
+    let minuterie = null;
+
+    function afficher(salles) {
+        const libres = new Set(salles.map(s => String(s.id)));
+        // Les salles occupées restent sélectionnables mais sont signalées dans la liste
+        Array.from(salleSelect.options).forEach(option => {
+            option.textContent = option.dataset.nom + (libres.has(option.value) ? '' : ' (occupée)');
+        });
+
+        suggestions.innerHTML = '';
+        if (salles.length === 0) {
+            suggestions.innerHTML = '<small class="text-danger">Aucune salle libre sur ce créneau.</small>';
+            return;
+        }
+        salles.slice(0, 8).forEach(salle => {
+            const bouton = document.createElement('button');
+            bouton.type = 'button';
+            bouton.className = 'btn btn-sm btn-outline-success me-1 mb-1';
+            bouton.textContent = salle.nom_salle + (salle.capacite ? ' (' + salle.capacite + ' places)' : '');
+            bouton.addEventListener('click', () => { salleSelect.value = salle.id; });
+            suggestions.appendChild(bouton);
+        });
+    }
+
+    function rafraichir() {
+        if (!dateInput.value || !debutInput.value || !finInput.value) return;
+        const params = new URLSearchParams({
+            date: dateInput.value,
+            heure_debut: debutInput.value,
+            heure_fin: finInput.value,
+            capacite: capaciteInput.value || 0
+        });
+        if (excludeCoursId) params.append('exclude_cours_id', excludeCoursId);
+        fetch(suggestions.dataset.url + '?' + params.toString())
+            .then(response => response.ok ? response.json() : { salles: null })
+            .then(data => { if (data.salles) afficher(data.salles); })
+            .catch(() => {});
+    }
+
+    Array.from(salleSelect.options).forEach(option => { option.dataset.nom = option.textContent; });
+    champs.forEach(champ => champ.addEventListener('input', () => {
+        clearTimeout(minuterie);
+        minuterie = setTimeout(rafraichir, 250);
+    }));
+    rafraichir();
+});
@@ -0,0 +1,191 @@
+// Messagerie d'une conversation ouverte :
+// - seule la page la plus récente est rendue par le serveur ; les messages plus anciens sont demandés
+//   à l'API de l'historique quand on remonte en haut de la zone ;
+// - l'envoi passe par l'événement Socket.IO 'send_message' : le message s'affiche aussitôt (en attente),
+//   puis l'accusé de réception du serveur le confirme. Chaque envoi porte une clé générée ici, réutilisée
+//   pour les nouvelles tentatives, qui évite les doublons. Sans connexion Socket.IO, le formulaire est posté.
+// Le conteneur porte data-historique (URL de l'API), data-avant (curseur, vide s'il n'y a rien de plus ancien),
+// data-utilisateur (id de l'utilisateur connecté) et data-conversation.
+document.addEventListener('DOMContentLoaded', function () {
+    const conteneur = document.getElementById('messages-container');
+    if (!conteneur || !conteneur.dataset.historique) return;
+    const utilisateurId = parseInt(conteneur.dataset.utilisateur, 10);
+    const conversationId = parseInt(conteneur.dataset.conversation, 10);
+    const DELAI_ACCUSE = 5000; // ms avant de renvoyer un message sans accusé de réception
+    const TENTATIVES = 3;
+    let chargement = false;
+
+    const ICONES = {
+        attente: '<i class="bi bi-clock" title="Envoi…"></i>',
+        envoye: '<i class="bi bi-check2" title="Envoyé"></i>',
+        vu: '<i class="bi bi-check2-all" title="Vu"></i>',
+        echec: '<i class="bi bi-exclamation-circle text-danger" title="Échec de l\'envoi, cliquer pour réessayer"></i>',
+    };
+
+    function elementMessage(message) {
+        const envoye = message.sender_id === utilisateurId;
+        const element = document.createElement('div');
+        element.className = 'message ' + (envoye ? 'sent' : 'received');
+        if (message.id) element.dataset.messageId = message.id;
+
+        const corps = document.createElement('div');
+        corps.className = 'message-body';
+        if (message.image_url) {
+            const image = document.createElement('img');
+            image.src = message.image_url;
+            image.className = 'img-fluid rounded';
+            image.alt = 'Image';
+            corps.appendChild(image);
+        }
+        if (message.body) corps.appendChild(document.createTextNode(message.body));
+
+        const meta = document.createElement('div');
+        meta.className = 'message-meta';
+        const heure = document.createElement('span');
+        heure.className = 'timestamp';
+        heure.textContent = new Date(message.timestamp).toLocaleTimeString([], {hour: '2-digit', minute: '2-digit'});
+        meta.appendChild(heure);
+        if (envoye) {
+            const statut = document.createElement('span');
+            statut.className = 'message-status';
+            if (message.id) statut.id = 'status-' + message.id;
+            statut.innerHTML = message.is_read ? ICONES.vu : ICONES.envoye;
+            meta.appendChild(statut);
+        }
+        element.append(corps, meta);
+        return element;
+    }
+
+    function defilerEnBas() {
+        conteneur.scrollTop = conteneur.scrollHeight;
+    }
+
+    // ---------------------------------------------------------------
+    // Historique : chargement des pages plus anciennes au défilement
+    // ---------------------------------------------------------------
+    function chargerPlusAnciens() {
+        const avant = conteneur.dataset.avant;
+        if (chargement || !avant) return;
+        chargement = true;
+        fetch(conteneur.dataset.historique + '?avant=' + encodeURIComponent(avant))
+            .then(reponse => reponse.ok ? reponse.json() : Promise.reject(reponse.status))
+            .then(page => {
+                // Insertion au début sans faire sauter l'affichage : on conserve la distance au bas de la zone
+                const distanceAuBas = conteneur.scrollHeight - conteneur.scrollTop;
+                const fragment = document.createDocumentFragment();
+                page.messages.forEach(message => fragment.appendChild(elementMessage(message)));
+                conteneur.insertBefore(fragment, conteneur.firstChild);
+                conteneur.scrollTop = conteneur.scrollHeight - distanceAuBas;
+                conteneur.dataset.avant = page.avant || '';
+            })
+            .catch(() => { conteneur.dataset.avant = ''; })
+            .finally(() => {
+                chargement = false;
+                remplir();
+            });
+    }
+
+    // Tant que la zone n'a pas de barre de défilement, le défilement ne peut pas déclencher le chargement
+    function remplir() {
+        if (conteneur.scrollHeight <= conteneur.clientHeight) chargerPlusAnciens();
+    }
+
+    conteneur.addEventListener('scroll', function () {
+        if (conteneur.scrollTop < 50) chargerPlusAnciens();
+    });
+    remplir();
+
+    // ---------------------------------------------------------------
+    // Temps réel : réception, accusés de lecture et envoi
+    // ---------------------------------------------------------------
+    if (typeof io === 'undefined') return;
+    // WebSocket d'emblée : sans phase de long-polling, la connexion reste sur le même worker
+    // même sans affinité de session côté répartiteur de charge (déploiement sur plusieurs workers)
+    const socket = io({ transports: ['websocket'] });
+    const enAttente = new Map(); // clé d'envoi -> élément affiché avant confirmation
+
+    // À chaque (re)connexion, éventuellement sur un autre worker : rejoindre la room de la conversation
+    socket.on('connect', () => socket.emit('join', { 'conversation_id': conversationId }));
+    window.addEventListener('beforeunload', () => {
+        socket.emit('leave', { 'conversation_id': conversationId });
+    });
+
+    function nouvelleCle() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+    }
+
+    function confirmer(cle, message) {
+        const element = enAttente.get(cle);
+        if (!element) return;
+        enAttente.delete(cle);
+        element.dataset.messageId = message.id;
+        const statut = element.querySelector('.message-status');
+        statut.id = 'status-' + message.id;
+        statut.innerHTML = message.is_read ? ICONES.vu : ICONES.envoye;
+        statut.onclick = null;
+    }
+
+    function envoyer(cle, body, tentative) {
+        socket.timeout(DELAI_ACCUSE).emit('send_message', { conversation_id: conversationId, body: body, cle: cle }, (erreur, accuse) => {
+            const element = enAttente.get(cle);
+            if (!element) return; // déjà confirmé par la diffusion 'new_message'
+            if (!erreur && accuse && accuse.ok) {
+                confirmer(cle, accuse.message);
+            } else if (erreur && tentative < TENTATIVES) {
+                // Pas d'accusé : même clé, le serveur ne créera pas de doublon
+                envoyer(cle, body, tentative + 1);
+            } else {
+                const statut = element.querySelector('.message-status');
+                statut.innerHTML = ICONES.echec;
+                if (accuse && accuse.error) statut.title = accuse.error;
+                statut.onclick = () => {
+                    statut.innerHTML = ICONES.attente;
+                    statut.onclick = null;
+                    envoyer(cle, body, 1);
+                };
+            }
+        });
+    }
+
+    const formulaire = document.getElementById('formulaire-message');
+    const champ = document.getElementById('message-input');
+    if (formulaire && champ) {
+        formulaire.addEventListener('submit', function (event) {
+            if (!socket.connected) return; // envoi classique du formulaire
+            event.preventDefault();
+            const body = champ.value.trim();
+            if (!body) return;
+            const cle = nouvelleCle();
+            const element = elementMessage({ sender_id: utilisateurId, body: body, timestamp: new Date().toISOString() });
+            element.querySelector('.message-status').innerHTML = ICONES.attente;
+            enAttente.set(cle, element);
+            conteneur.appendChild(element);
+            defilerEnBas();
+            champ.value = '';
+            envoyer(cle, body, 1);
+        });
+    }
+
+    socket.on('new_message', function (data) {
+        if (data.conversation_id !== conversationId) return;
+        // Message envoyé depuis cet onglet : déjà affiché, il suffit de le confirmer
+        if (data.cle && enAttente.has(data.cle)) {
+            confirmer(data.cle, { id: data.id, is_read: false });
+            return;
+        }
+        if (conteneur.querySelector('[data-message-id="' + data.id + '"]')) return;
+        conteneur.appendChild(elementMessage({
+            id: data.id, body: data.body, image_url: data.image_url, timestamp: data.timestamp, sender_id: data.sender.id, is_read: false,
+        }));
+        defilerEnBas();
+    });
+
+    socket.on('messages_read', function (data) {
+        // data.message_ids : messages qui viennent d'être lus par l'autre participant
+        data.message_ids.forEach(messageId => {
+            const statut = document.getElementById('status-' + messageId);
+            if (statut) statut.innerHTML = ICONES.vu;
+        });
+    });
+});
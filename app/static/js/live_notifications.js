@@ -0,0 +1,69 @@
+// Notifications en temps réel : le serveur pousse les nouvelles notifications et les compteurs de non-lus
+// dans la room Socket.IO personnelle de l'utilisateur (et celles de son rôle).
+// Les badges portent data-compteur="notifications" ou data-compteur="messages" et un enfant .valeur.
+document.addEventListener('DOMContentLoaded', function () {
+    if (typeof io === 'undefined') return;
+    // WebSocket d'emblée : sans phase de long-polling, la connexion reste sur le même worker
+    // même sans affinité de session côté répartiteur de charge (déploiement sur plusieurs workers)
+    const socket = io({ transports: ['websocket'] });
+
+    function badge(nom) {
+        return document.querySelector('[data-compteur="' + nom + '"]');
+    }
+
+    function afficherCompteur(nom, valeur) {
+        const element = badge(nom);
+        if (!element) return;
+        element.querySelector('.valeur').textContent = valeur;
+        element.classList.toggle('d-none', !valeur);
+    }
+
+    function afficherNotification(notification) {
+        let conteneur = document.getElementById('notifications-direct');
+        if (!conteneur) {
+            conteneur = document.createElement('div');
+            conteneur.id = 'notifications-direct';
+            conteneur.className = 'toast-container position-fixed bottom-0 end-0 p-3';
+            document.body.appendChild(conteneur);
+        }
+        const toast = document.createElement('div');
+        toast.className = 'toast';
+        toast.setAttribute('role', 'alert');
+        const entete = document.createElement('div');
+        entete.className = 'toast-header';
+        const titre = document.createElement('strong');
+        titre.className = 'me-auto';
+        titre.textContent = notification.titre;
+        const fermer = document.createElement('button');
+        fermer.type = 'button';
+        fermer.className = 'btn-close';
+        fermer.setAttribute('data-bs-dismiss', 'toast');
+        entete.append(titre, fermer);
+        const corps = document.createElement('div');
+        corps.className = 'toast-body';
+        corps.textContent = notification.message;
+        toast.append(entete, corps);
+        conteneur.appendChild(toast);
+        toast.addEventListener('hidden.bs.toast', () => toast.remove());
+        if (typeof bootstrap !== 'undefined') {
+            new bootstrap.Toast(toast).show();
+        }
+    }
+
+    socket.on('notification', function (notification) {
+        afficherNotification(notification);
+        // Les notifications personnelles portent le nouveau nombre de non-lues ;
+        // une annonce envoyée à toute une room est une non-lue de plus pour chacun
+        if (notification.non_lues !== undefined) {
+            afficherCompteur('notifications', notification.non_lues);
+        } else {
+            const element = badge('notifications');
+            if (element) afficherCompteur('notifications', (parseInt(element.querySelector('.valeur').textContent, 10) || 0) + 1);
+        }
+    });
+
+    socket.on('compteurs_non_lus', function (compteurs) {
+        if (compteurs.notifications !== undefined) afficherCompteur('notifications', compteurs.notifications);
+        if (compteurs.messages !== undefined) afficherCompteur('messages', compteurs.messages);
+    });
+});
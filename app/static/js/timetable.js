@@ -0,0 +1,61 @@
+// Chargement à la demande de l'emploi du temps (tableaux de bord étudiant et enseignant).
+// Le <tbody id="emploi-du-temps"> porte data-url (API), data-debut et data-fin (fenêtre affichée),
+// data-suivant (curseur de la page suivante dans cette fenêtre, vide sinon) et data-colonnes.
+// Le bouton #charger-emploi-du-temps charge la page suivante, puis la fenêtre suivante.
+document.addEventListener('DOMContentLoaded', function () {
+    const corps = document.getElementById('emploi-du-temps');
+    const bouton = document.getElementById('charger-emploi-du-temps');
+    if (!corps || !bouton) return;
+
+    const colonnes = corps.dataset.colonnes.split(',');
+    const dureeFenetre = 28; // jours, comme la fenêtre initiale
+    let fin = corps.dataset.fin;
+    let debut = corps.dataset.debut;
+    let suivant = corps.dataset.suivant || null;
+
+    function decaler(dateIso, jours) {
+        const d = new Date(dateIso + 'T00:00:00Z');
+        d.setUTCDate(d.getUTCDate() + jours);
+        return d.toISOString().slice(0, 10);
+    }
+
+    function libelle() {
+        bouton.textContent = suivant ? 'Afficher plus de cours' : 'Semaines suivantes';
+    }
+
+    function ajouter(cours) {
+        const vide = corps.querySelector('tr.emploi-du-temps-vide');
+        if (vide && cours.length) vide.remove();
+        cours.forEach(c => {
+            const ligne = document.createElement('tr');
+            colonnes.forEach(colonne => {
+                const cellule = document.createElement('td');
+                cellule.textContent = c[colonne];
+                ligne.appendChild(cellule);
+            });
+            corps.appendChild(ligne);
+        });
+    }
+
+    bouton.addEventListener('click', function () {
+        // Page suivante de la fenêtre courante, ou première page de la fenêtre d'après
+        const params = suivant
+            ? new URLSearchParams({ debut: debut, fin: fin, apres: suivant })
+            : new URLSearchParams({ debut: decaler(fin, 1), fin: decaler(fin, dureeFenetre) });
+
+        bouton.disabled = true;
+        fetch(corps.dataset.url + '?' + params.toString())
+            .then(r => r.ok ? r.json() : Promise.reject(r))
+            .then(data => {
+                ajouter(data.cours);
+                debut = data.debut;
+                fin = data.fin;
+                suivant = data.suivant;
+                libelle();
+            })
+            .catch(() => { bouton.textContent = 'Erreur de chargement, réessayer'; })
+            .finally(() => { bouton.disabled = false; });
+    });
+
+    libelle();
+});
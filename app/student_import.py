@@ -0,0 +1,131 @@
+# app/student_import.py
+# Import en masse de comptes étudiants (CSV ou Excel) : validation vectorisée du fichier dans la requête,
+# puis création des comptes par lots dans le worker des tâches de fond (voir les tâches 'import_etudiants'
+# et 'emails_comptes' de app/jobs.py) : hachage des mots de passe dans un pool de processus, INSERT multi-lignes.
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from sqlalchemy import insert, func
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import Utilisateur, Groupe, Filiere, Niveau
+from app.timetable_import import read_table_file
+
+# Colonnes attendues dans le fichier importé ; le groupe peut rester vide
+COLONNES_ETUDIANTS = ['prenom', 'nom', 'email', 'filiere', 'niveau']
+COLONNES_ETUDIANTS_OPTIONNELLES = ['groupe']
+# En dessous de ce nombre de mots de passe, le démarrage d'un pool coûte plus qu'il ne rapporte
+SEUIL_POOL = 8
+# Nombre d'adresses par requête IN lors de la recherche des comptes existants
+LOT_RECHERCHE = 1000
+
+_EMAIL_VALIDE = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+
+def read_students_file(file_storage):
+    """Lit le fichier d'étudiants envoyé par formulaire ; lève ValueError si le format ou les colonnes ne sont pas valides."""
+    return read_table_file(file_storage, COLONNES_ETUDIANTS, COLONNES_ETUDIANTS_OPTIONNELLES)
+
+
+def _reference_maps():
+    """Précharge filières, niveaux et groupes sous forme de dictionnaires nom -> id (une requête par table)."""
+    return {
+        'filieres': {nom.lower(): id_ for id_, nom in db.session.query(Filiere.id, Filiere.nom_filiere)},
+        'niveaux': {nom.lower(): id_ for id_, nom in db.session.query(Niveau.id, Niveau.nom_niveau)},
+        'groupes': {(nom.lower(), f, n): id_ for id_, nom, f, n in db.session.query(Groupe.id, Groupe.nom_groupe, Groupe.filiere_id, Groupe.niveau_id)},
+    }
+
+
+def existing_emails(emails):
+    """Adresses (en minuscules) parmi `emails` qui ont déjà un compte, recherchées par lots de LOT_RECHERCHE."""
+    emails = sorted({e.lower() for e in emails})
+    existants = set()
+    for i in range(0, len(emails), LOT_RECHERCHE):
+        lot = emails[i:i + LOT_RECHERCHE]
+        existants.update(e.lower() for e, in db.session.query(Utilisateur.email).filter(func.lower(Utilisateur.email).in_(lot)))
+    return existants
+
+
+def _add_error(erreurs, lignes, message):
+    for ligne in lignes:
+        erreurs.setdefault(int(ligne), []).append(message)
+
+
+def validate_students(df):
+    """
+    Valide toutes les lignes du fichier en une passe et résout les noms en identifiants.
+    Retourne (df enrichi des colonnes filiere_id, niveau_id et groupe_id, erreurs) où erreurs est un dict ligne -> [messages].
+    """
+    erreurs = {}
+    refs = _reference_maps()
+
+    for colonne, libelle in [('prenom', 'Prénom manquant.'), ('nom', 'Nom manquant.')]:
+        _add_error(erreurs, df.index[df[colonne] == ''], libelle)
+
+    df['email'] = df['email'].str.lower()
+    _add_error(erreurs, df.index[~df['email'].str.match(_EMAIL_VALIDE)], "Adresse e-mail invalide.")
+    _add_error(erreurs, df.index[df['email'].duplicated(keep='first') & (df['email'] != '')], "Adresse e-mail en double dans le fichier.")
+    deja = existing_emails(df['email'])
+    _add_error(erreurs, df.index[df['email'].isin(deja)], "Un compte existe déjà avec cette adresse e-mail.")
+
+    for colonne, table, libelle in [('filiere', 'filieres', 'Filière inconnue'), ('niveau', 'niveaux', 'Niveau inconnu')]:
+        ids = df[colonne].str.lower().map(refs[table])
+        df[f'{colonne}_id'] = ids
+        for ligne, valeur in df.loc[ids.isna(), colonne].items():
+            _add_error(erreurs, [ligne], f"{libelle} : « {valeur} ».")
+
+    df['groupe_id'] = [
+        refs['groupes'].get((nom.lower(), f, n)) if nom else None
+        for nom, f, n in zip(df['groupe'], df['filiere_id'], df['niveau_id'])
+    ]
+    inconnus = (df['groupe'] != '') & df['groupe_id'].isna() & df['filiere_id'].notna() & df['niveau_id'].notna()
+    for ligne, nom in df.loc[inconnus, 'groupe'].items():
+        _add_error(erreurs, [ligne], f"Groupe inconnu pour cette filière et ce niveau : « {nom} ».")
+    return df, erreurs
+
+
+def student_rows(df, lignes):
+    """Lignes valides du fichier sous forme de dictionnaires sérialisables en JSON (charge des tâches d'import)."""
+    return [
+        {
+            'prenom': row.prenom, 'nom': row.nom, 'email': row.email,
+            'filiere_id': int(row.filiere_id), 'niveau_id': int(row.niveau_id),
+            'groupe_id': int(row.groupe_id) if pd.notna(row.groupe_id) else None,
+        }
+        for row in df.loc[sorted(lignes)].itertuples()
+    ]
+
+
+def hash_passwords(mots_de_passe, processus=None):
+    """
+    Hache les mots de passe (même fonction que Utilisateur.set_password) dans un pool de `processus` processus
+    (un par cœur par défaut) : le hachage est volontairement lent et limité par le CPU. Retourne les hachés dans l'ordre.
+    """
+    if len(mots_de_passe) < SEUIL_POOL or processus == 1:
+        return [generate_password_hash(m) for m in mots_de_passe]
+    processus = processus or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=processus) as pool:
+        return list(pool.map(generate_password_hash, mots_de_passe, chunksize=max(1, len(mots_de_passe) // (processus * 4))))
+
+
+def create_students(lignes, processus=None):
+    """
+    Crée les comptes étudiants d'un lot avec un INSERT multi-lignes. Chaque compte reçoit un mot de passe aléatoire,
+    jamais communiqué : l'étudiant choisit le sien par le lien de réinitialisation.
+    Les adresses qui ont obtenu un compte depuis la validation sont ignorées.
+    La transaction n'est pas validée ici. Retourne les IDs créés.
+    """
+    deja = existing_emails(l['email'] for l in lignes)
+    lignes = [l for l in lignes if l['email'].lower() not in deja]
+    if not lignes:
+        return []
+    hashes = hash_passwords([secrets.token_urlsafe(16) for _ in lignes], processus)
+    # render_nulls : les valeurs None sont écrites telles quelles au lieu de laisser jouer les valeurs par défaut
+    db.session.execute(insert(Utilisateur).execution_options(render_nulls=True), [
+        # last_seen vide : un compte importé n'a jamais été utilisé (et n'apparaît pas en ligne)
+        dict(ligne, mot_de_passe_hash=h, role='etudiant', picture='default.jpg', last_seen=None)
+        for ligne, h in zip(lignes, hashes)
+    ])
+    emails = [l['email'] for l in lignes]
+    return [id_ for id_, in db.session.query(Utilisateur.id).filter(Utilisateur.email.in_(emails)).order_by(Utilisateur.id)]
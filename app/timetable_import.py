@@ -0,0 +1,275 @@
+# app/timetable_import.py
+# Import en masse d'un emploi du temps (CSV ou Excel) avec vérification vectorisée des conflits.
+from datetime import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+from app import db
+from app.models import Cours, CoursAffectation, Matiere, Utilisateur, Salle, Groupe, Filiere, Niveau
+from app.conflicts import load_occupied_slots, to_minutes
+
+# Colonnes attendues dans le fichier importé
+COLONNES_REQUISES = ['date', 'heure_debut', 'heure_fin', 'code_matiere', 'enseignant_email', 'salle', 'filiere', 'niveau', 'groupes']
+COLONNES_OPTIONNELLES = ['description']
+
+# Sentinelles pour les fins/débuts « absents » dans les calculs cumulés
+_AUCUNE_FIN = -1
+_AUCUN_DEBUT = 24 * 60 + 1
+
+
+def read_timetable_file(file_storage):
+    """
+    Lit un fichier CSV ou Excel envoyé par formulaire et retourne un DataFrame de chaînes.
+    Lève ValueError si le format ou les colonnes ne sont pas valides.
+    """
+    return read_table_file(file_storage, COLONNES_REQUISES, COLONNES_OPTIONNELLES)
+
+
+def read_table_file(file_storage, requises, optionnelles=()):
+    """
+    Lecture commune aux imports : DataFrame de chaînes limité aux colonnes `requises` et `optionnelles`
+    (vides si absentes), indexé par le numéro de ligne du tableur. Lève ValueError si le fichier n'est pas valide.
+    """
+    nom = (file_storage.filename or '').lower()
+    if nom.endswith('.csv'):
+        df = pd.read_csv(file_storage, dtype=str, keep_default_na=False, sep=None, engine='python')
+    elif nom.endswith(('.xlsx', '.xls')):
+        try:
+            df = pd.read_excel(file_storage, dtype=str, keep_default_na=False)
+        except ImportError:
+            raise ValueError("La lecture des fichiers Excel nécessite le paquet 'openpyxl' sur le serveur.")
+    else:
+        raise ValueError("Format de fichier non pris en charge. Utilisez un fichier .csv ou .xlsx.")
+
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    manquantes = [c for c in requises if c not in df.columns]
+    if manquantes:
+        raise ValueError(f"Colonnes manquantes dans le fichier : {', '.join(manquantes)}.")
+    for colonne in optionnelles:
+        if colonne not in df.columns:
+            df[colonne] = ''
+    df = df[list(requises) + list(optionnelles)].apply(lambda s: s.astype(str).str.strip())
+    # Numéro de ligne tel que vu dans le tableur (en-tête = ligne 1)
+    df.index = pd.RangeIndex(2, len(df) + 2, name='ligne')
+    return df
+
+
+def from_minutes(minutes):
+    """Convertit un nombre de minutes depuis minuit en objet time."""
+    minutes = int(minutes)
+    return time(minutes // 60, minutes % 60)
+
+
+def _reference_maps():
+    """Précharge les tables de référence sous forme de dictionnaires nom -> id (une requête par table)."""
+    return {
+        'matieres': {code.lower(): id_ for id_, code in db.session.query(Matiere.id, Matiere.code_matiere)},
+        'enseignants': {email.lower(): id_ for id_, email in db.session.query(Utilisateur.id, Utilisateur.email).filter(Utilisateur.role == 'enseignant')},
+        'salles': {nom.lower(): id_ for id_, nom in db.session.query(Salle.id, Salle.nom_salle)},
+        'filieres': {nom.lower(): id_ for id_, nom in db.session.query(Filiere.id, Filiere.nom_filiere)},
+        'niveaux': {nom.lower(): id_ for id_, nom in db.session.query(Niveau.id, Niveau.nom_niveau)},
+        'groupes': {(nom.lower(), f, n): id_ for id_, nom, f, n in db.session.query(Groupe.id, Groupe.nom_groupe, Groupe.filiere_id, Groupe.niveau_id)},
+    }
+
+
+def _add_error(erreurs, lignes, message):
+    for ligne in lignes:
+        erreurs.setdefault(int(ligne), []).append(message)
+
+
+def _resolve(df, erreurs):
+    """Convertit les colonnes texte en identifiants et en minutes ; enregistre les erreurs de format."""
+    refs = _reference_maps()
+
+    df['jour'] = pd.to_datetime(df['date'], format='%Y-%m-%d', errors='coerce')
+    debut = pd.to_datetime(df['heure_debut'], format='%H:%M', errors='coerce')
+    fin = pd.to_datetime(df['heure_fin'], format='%H:%M', errors='coerce')
+    df['debut'] = debut.dt.hour * 60 + debut.dt.minute
+    df['fin'] = fin.dt.hour * 60 + fin.dt.minute
+
+    _add_error(erreurs, df.index[df['jour'].isna()], "Date invalide (format attendu AAAA-MM-JJ).")
+    _add_error(erreurs, df.index[df['debut'].isna() | df['fin'].isna()], "Heure invalide (format attendu HH:MM).")
+    _add_error(erreurs, df.index[df['debut'].notna() & df['fin'].notna() & (df['fin'] <= df['debut'])], "L'heure de fin doit être postérieure à l'heure de début.")
+
+    for colonne, table, libelle in [
+        ('code_matiere', 'matieres', 'Matière inconnue'),
+        ('enseignant_email', 'enseignants', 'Enseignant inconnu'),
+        ('salle', 'salles', 'Salle inconnue'),
+        ('filiere', 'filieres', 'Filière inconnue'),
+        ('niveau', 'niveaux', 'Niveau inconnu'),
+    ]:
+        ids = df[colonne].str.lower().map(refs[table])
+        df[f'{table}_id'] = ids
+        for ligne, valeur in df.loc[ids.isna(), colonne].items():
+            _add_error(erreurs, [ligne], f"{libelle} : « {valeur} ».")
+
+    # Une ligne par (ligne du fichier, groupe) : les groupes sont séparés par ';'
+    groupes = df['groupes'].str.split(';').explode().str.strip()
+    groupes = groupes[groupes != '']
+    cles = pd.DataFrame({
+        'nom': groupes.str.lower(),
+        'filiere_id': df.loc[groupes.index, 'filieres_id'],
+        'niveau_id': df.loc[groupes.index, 'niveaux_id'],
+    }, index=groupes.index)
+    groupe_ids = pd.Series(
+        [refs['groupes'].get((n, f, v)) for n, f, v in cles.itertuples(index=False)],
+        index=cles.index, dtype='float64'
+    )
+    inconnus = groupe_ids.isna() & cles['filiere_id'].notna() & cles['niveau_id'].notna()
+    for ligne, nom in groupes[inconnus].items():
+        _add_error(erreurs, [ligne], f"Groupe inconnu pour cette filière et ce niveau : « {nom} ».")
+    _add_error(erreurs, df.index.difference(groupes.index.unique()), "Au moins un groupe doit être indiqué.")
+
+    affectations = pd.DataFrame({'groupe_id': groupe_ids}).dropna()
+    affectations['groupe_id'] = affectations['groupe_id'].astype('int64')
+    return affectations.reset_index().drop_duplicates()
+
+
+def _overlap_flags(slots, cle):
+    """
+    Pour chaque créneau issu du fichier, indique s'il chevauche un autre créneau du fichier
+    et/ou un cours existant sur la même ressource `cle`, le même jour.
+    Tri + maximum/minimum cumulés par groupe : aucun test paire à paire.
+    """
+    slots = slots.sort_values([cle, 'jour', 'debut', 'fin'], kind='mergesort').reset_index(drop=True)
+    groupes = [slots[cle], slots['jour']]
+    inverses = [slots[cle][::-1], slots['jour'][::-1]]
+    resultats = {}
+    for source in ('fichier', 'existant'):
+        autres = (slots['source'] == source).to_numpy()
+        fins = pd.Series(np.where(autres, slots['fin'], _AUCUNE_FIN), index=slots.index)
+        debuts = pd.Series(np.where(autres, slots['debut'], _AUCUN_DEBUT), index=slots.index)
+        # Plus grande fin parmi les créneaux précédents, plus petit début parmi les suivants
+        fin_max_avant = fins.groupby(groupes).cummax().groupby(groupes).shift(1).fillna(_AUCUNE_FIN)
+        debut_min_apres = debuts[::-1].groupby(inverses).cummin().groupby(inverses).shift(1).fillna(_AUCUN_DEBUT)[::-1]
+        resultats[source] = (slots['debut'] < fin_max_avant) | (slots['fin'] > debut_min_apres)
+    dans_fichier = slots['source'] == 'fichier'
+    return pd.DataFrame({
+        'ligne': slots.loc[dans_fichier, 'ligne'],
+        'fichier': resultats['fichier'][dans_fichier],
+        'existant': resultats['existant'][dans_fichier],
+    })
+
+
+def _promotion_key(filieres, niveaux):
+    """Clé texte « filiere-niveau » d'une promotion, pour les comparaisons vectorisées."""
+    return filieres.astype('Int64').astype(str) + '-' + niveaux.astype('Int64').astype(str)
+
+
+def _check_conflicts(df, affectations, erreurs):
+    """Vérifie les chevauchements enseignant/salle/groupe, dans le fichier et avec la base."""
+    valides = df[df['jour'].notna() & df['debut'].notna() & df['fin'].notna()]
+    if valides.empty:
+        return
+
+    jour_min, jour_max = valides['jour'].min().date(), valides['jour'].max().date()
+    promotions = valides[['filieres_id', 'niveaux_id']].dropna().astype(int).drop_duplicates()
+    existants = load_occupied_slots(
+        jour_min, jour_max,
+        enseignant_ids=valides['enseignants_id'].dropna().astype(int).tolist(),
+        salle_ids=valides['salles_id'].dropna().astype(int).tolist(),
+        promotions=set(promotions.itertuples(index=False, name=None)),
+    )
+    existants = pd.DataFrame(existants, columns=['cours_id', 'enseignants_id', 'salles_id', 'jour', 'debut', 'fin', 'groupe_id', 'filieres_id', 'niveaux_id'])
+    existants['jour'] = pd.to_datetime(existants['jour'])
+    for colonne in ('debut', 'fin'):
+        existants[colonne] = [to_minutes(h) for h in existants[colonne]]
+    existants['source'] = 'existant'
+    existants['ligne'] = -1
+    existants['promo'] = _promotion_key(existants['filieres_id'], existants['niveaux_id'])
+
+    fichier = valides.reset_index()[['ligne', 'jour', 'debut', 'fin', 'enseignants_id', 'salles_id', 'filieres_id', 'niveaux_id']].assign(source='fichier')
+    fichier['promo'] = _promotion_key(fichier['filieres_id'], fichier['niveaux_id'])
+    fichier_groupes = fichier.merge(affectations, on='ligne')
+    # Cours communs existants (sans groupe) : ils bloquent tous les groupes de leur promotion
+    cours_communs = existants[existants['groupe_id'].isna() & existants['filieres_id'].notna() & existants['niveaux_id'].notna()]
+
+    # (clé, créneaux du fichier, créneaux existants, sujet du message, vérifier aussi les doublons internes au fichier)
+    verifications = [
+        ('enseignants_id', fichier, existants.drop_duplicates('cours_id'), "L'enseignant", True),
+        ('salles_id', fichier, existants.drop_duplicates('cours_id'), "La salle", True),
+        ('groupe_id', fichier_groupes, existants.dropna(subset=['groupe_id']), "Un des groupes", True),
+        ('promo', fichier, cours_communs, "La promotion (cours commun)", False),
+    ]
+    colonnes = ['ligne', 'jour', 'debut', 'fin', 'source']
+    for cle, cote_fichier, cote_base, sujet, interne in verifications:
+        slots = pd.concat([cote_fichier[colonnes + [cle]], cote_base[colonnes + [cle]]], ignore_index=True).dropna(subset=[cle])
+        if slots.empty:
+            continue
+        flags = _overlap_flags(slots, cle).groupby('ligne').any()
+        if interne:
+            _add_error(erreurs, flags.index[flags['fichier']], f"{sujet} est planifié(e) deux fois sur ce créneau dans le fichier.")
+        _add_error(erreurs, flags.index[flags['existant']], f"{sujet} est déjà occupé(e) par un cours existant à ce créneau.")
+
+
+def validate_timetable(df):
+    """
+    Valide toutes les lignes du fichier en une passe.
+    Retourne (df enrichi, affectations, erreurs) où erreurs est un dict ligne -> [messages].
+    """
+    erreurs = {}
+    affectations = _resolve(df, erreurs)
+    _check_conflicts(df, affectations, erreurs)
+    return df, affectations, erreurs
+
+
+def insert_returning_ids(modele, lignes):
+    """
+    Insère des lignes d'un modèle et retourne leurs IDs dans l'ordre de `lignes`, lus directement sur les INSERT :
+    RETURNING groupé quand la base le permet (MariaDB, PostgreSQL, SQLite), sinon un INSERT par ligne et son
+    lastrowid (MySQL). Aucune recherche a posteriori : une insertion concurrente ne peut pas s'y mêler.
+    """
+    if not lignes:
+        return []
+    dialecte = db.session.get_bind().dialect
+    if dialecte.insert_executemany_returning_sort_by_parameter_order:
+        return list(db.session.scalars(insert(modele).returning(modele.id, sort_by_parameter_order=True), lignes))
+    return [db.session.execute(insert(modele).values(**ligne)).inserted_primary_key[0] for ligne in lignes]
+
+
+def bulk_insert_courses(cours_rows, affectations_par_cours):
+    """
+    Insère des cours, puis leurs affectations avec un INSERT multi-lignes.
+    `cours_rows` est une liste de dictionnaires de colonnes de Cours ; `affectations_par_cours`
+    donne, pour chaque cours (même ordre), une liste de tuples (groupe_id, filiere_id, niveau_id).
+    La transaction n'est pas validée ici. Retourne la liste des IDs créés.
+    """
+    ids = insert_returning_ids(Cours, cours_rows)
+
+    affectation_rows = [
+        {'cours_id': cours_id, 'groupe_id': groupe_id, 'filiere_id': filiere_id, 'niveau_id': niveau_id}
+        for cours_id, affectations in zip(ids, affectations_par_cours)
+        for groupe_id, filiere_id, niveau_id in affectations
+    ]
+    if affectation_rows:
+        db.session.execute(insert(CoursAffectation), affectation_rows)
+    return ids
+
+
+def insert_timetable(df, affectations, lignes):
+    """
+    Insère les cours des lignes données et leurs affectations avec des INSERT multi-lignes.
+    La transaction n'est pas validée ici : l'appelant décide du commit.
+    Retourne le nombre de cours créés.
+    """
+    df = df.loc[sorted(lignes)]
+    if df.empty:
+        return 0
+
+    cours_rows = [
+        {
+            'matiere_id': int(row.matieres_id), 'enseignant_id': int(row.enseignants_id), 'salle_id': int(row.salles_id),
+            'date_cours': row.jour.date(),
+            'heure_debut': from_minutes(row.debut),
+            'heure_fin': from_minutes(row.fin),
+            'description': row.description or None,
+        }
+        for row in df.itertuples()
+    ]
+    # La filière et le niveau de chaque groupe sont ceux de la ligne qui l'a résolu
+    groupes_par_ligne = affectations.groupby('ligne')['groupe_id'].apply(list)
+    affectations_par_cours = [
+        [(int(g), int(df.at[ligne, 'filieres_id']), int(df.at[ligne, 'niveaux_id'])) for g in groupes_par_ligne.get(ligne, [])]
+        for ligne in df.index
+    ]
+    return len(bulk_insert_courses(cours_rows, affectations_par_cours))
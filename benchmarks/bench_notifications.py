@@ -0,0 +1,118 @@
+# benchmarks/bench_notifications.py
+# Compare l'envoi des notifications d'un cours commun à toute une promotion avant et après
+# l'INSERT ... SELECT : latence, pic mémoire Python (tracemalloc) et nombre de requêtes SQL.
+#
+# Utilisation (depuis la racine du projet ; base SQLite en mémoire par défaut) :
+#   python -m benchmarks.bench_notifications --etudiants 10000
+#   BENCH_DATABASE_URL=mysql+pymysql://... python -m benchmarks.bench_notifications
+import argparse
+import os
+import statistics
+import time
+import tracemalloc
+from datetime import date, time as heure
+
+from sqlalchemy import event, insert
+
+from app.config import Config
+
+Config.SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Utilisateur, Groupe, Salle, Matiere, Cours, CoursAffectation, Notification, Filiere, Niveau
+from app.notifications import notify_course, course_audience
+
+
+def seed(nb_etudiants, nb_groupes):
+    """Une promotion de `nb_etudiants` étudiants répartis en groupes, et un cours affecté à tous ses groupes."""
+    filiere, niveau = Filiere.query.first(), Niveau.query.first()
+    enseignant = Utilisateur(nom='Ens', prenom='P', email='ens@bench', role='enseignant', mot_de_passe_hash='x')
+    salle = Salle(nom_salle='Amphi', capacite=nb_etudiants)
+    matiere = Matiere(nom_matiere='Algorithmique', code_matiere='ALGO')
+    groupes = [Groupe(nom_groupe=f'G{k}', filiere_id=filiere.id, niveau_id=niveau.id) for k in range(nb_groupes)]
+    db.session.add_all([enseignant, salle, matiere] + groupes)
+    db.session.flush()
+    db.session.execute(insert(Utilisateur), [
+        {'nom': f'Etu{i}', 'prenom': 'E', 'email': f'etu{i}@bench', 'role': 'etudiant', 'mot_de_passe_hash': 'x',
+         'filiere_id': filiere.id, 'niveau_id': niveau.id, 'groupe_id': groupes[i % nb_groupes].id}
+        for i in range(nb_etudiants)
+    ])
+    cours = Cours(matiere_id=matiere.id, enseignant_id=enseignant.id, salle_id=salle.id,
+                  date_cours=date.today(), heure_debut=heure(8), heure_fin=heure(10))
+    db.session.add(cours)
+    db.session.flush()
+    db.session.add_all(CoursAffectation(cours_id=cours.id, groupe_id=g.id, filiere_id=g.filiere_id, niveau_id=g.niveau_id) for g in groupes)
+    db.session.commit()
+    return cours.id
+
+
+def legacy_send(course, title, message_body):
+    """Ancienne version : une requête par affectation, un objet par étudiant, un objet Notification par destinataire."""
+    users_to_notify = set()
+    if course.enseignant_obj:
+        users_to_notify.add(course.enseignant_obj)
+    for aff in course.cours_affectations:
+        query = Utilisateur.query.filter_by(role='etudiant')
+        if aff.filiere_id:
+            query = query.filter_by(filiere_id=aff.filiere_id)
+        if aff.niveau_id:
+            query = query.filter_by(niveau_id=aff.niveau_id)
+        if aff.groupe_id:
+            query = query.filter_by(groupe_id=aff.groupe_id)
+        for student in query.all():
+            users_to_notify.add(student)
+    for user in users_to_notify:
+        db.session.add(Notification(titre=title, message=message_body, destinataire_id=user.id, destinataire_role=user.role))
+
+
+def set_based_send(course, title, message_body):
+    notify_course(course.enseignant_id, course_audience(course.id), title, message_body)
+
+
+def measure(fonction, cours_id, repetitions):
+    compteur = [0]
+
+    def compter(*_):
+        compteur[0] += 1
+
+    durees, pics, requetes, crees = [], [], [], 0
+    event.listen(db.engine, 'before_cursor_execute', compter)
+    try:
+        for _ in range(repetitions):
+            db.session.expunge_all()
+            cours = db.session.get(Cours, cours_id)
+            compteur[0] = 0
+            tracemalloc.start()
+            debut = time.perf_counter()
+            fonction(cours, 'Cours modifié : Algorithmique', 'Le cours a été déplacé.')
+            db.session.commit()
+            durees.append((time.perf_counter() - debut) * 1000)
+            pics.append(tracemalloc.get_traced_memory()[1] / 1024 / 1024)
+            tracemalloc.stop()
+            requetes.append(compteur[0])
+            crees = Notification.query.count()
+            Notification.query.delete()
+            db.session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', compter)
+    return crees, requetes[-1], statistics.median(durees), max(pics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--etudiants', type=int, default=10000)
+    parser.add_argument('--groupes', type=int, default=8, help="groupes de la promotion (une affectation par groupe)")
+    parser.add_argument('--repetitions', type=int, default=5)
+    args = parser.parse_args()
+
+    app, _ = create_app()
+    with app.app_context():
+        cours_id = seed(args.etudiants, args.groupes)
+        print(f"{'version':>10} {'notifications':>14} {'requêtes':>9} {'médiane (ms)':>13} {'pic mémoire (Mo)':>17}")
+        for nom, fonction in (('avant', legacy_send), ('après', set_based_send)):
+            crees, requetes, mediane, pic = measure(fonction, cours_id, args.repetitions)
+            print(f"{nom:>10} {crees:>14} {requetes:>9} {mediane:>13.1f} {pic:>17.1f}")
+
+
+if __name__ == '__main__':
+    main()
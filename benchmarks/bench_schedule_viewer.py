@@ -0,0 +1,125 @@
+# benchmarks/bench_schedule_viewer.py
+# Compare l'accès aux données de la vue hebdomadaire (schedule_viewer) avant et après la requête projetée :
+# nombre de requêtes SQL, lignes renvoyées et latence.
+#
+# Utilisation (depuis la racine du projet ; base SQLite en mémoire par défaut) :
+#   python -m benchmarks.bench_schedule_viewer --cours 600
+#   BENCH_DATABASE_URL=mysql+pymysql://... python -m benchmarks.bench_schedule_viewer
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import date, time as heure, timedelta
+
+from sqlalchemy import event
+
+from app.config import Config
+
+Config.SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from app.models import Utilisateur, Filiere, Niveau, Groupe, Salle, Matiere, Cours, CoursAffectation
+from app.schedule import week_courses, schedule_filters
+
+
+def seed(nb_cours, groupes_par_cours, seed=0):
+    """Une semaine de `nb_cours` cours, chacun affecté à plusieurs groupes d'une même promotion."""
+    rng = random.Random(seed)
+    enseignants = [Utilisateur(nom=f'Ens{i}', prenom='P', email=f'ens{i}@bench', role='enseignant', mot_de_passe_hash='x') for i in range(40)]
+    salles = [Salle(nom_salle=f'S{i}', capacite=rng.choice([30, 60, 120])) for i in range(40)]
+    matieres = [Matiere(nom_matiere=f'Matière {i}', code_matiere=f'M{i}') for i in range(60)]
+    db.session.add_all(enseignants + salles + matieres)
+    db.session.flush()
+    filieres = Filiere.query.all()
+    niveaux = Niveau.query.all()
+    groupes = []
+    for f in filieres:
+        for n in niveaux:
+            groupes.extend(Groupe(nom_groupe=f'G{k}', filiere_id=f.id, niveau_id=n.id) for k in range(groupes_par_cours))
+    db.session.add_all(groupes)
+    db.session.flush()
+    par_promo = {}
+    for g in groupes:
+        par_promo.setdefault((g.filiere_id, g.niveau_id), []).append(g)
+
+    lundi = date.today() - timedelta(days=date.today().weekday())
+    for i in range(nb_cours):
+        debut = rng.randrange(7, 18)
+        cours = Cours(
+            matiere_id=rng.choice(matieres).id, enseignant_id=rng.choice(enseignants).id, salle_id=rng.choice(salles).id,
+            date_cours=lundi + timedelta(days=rng.randrange(6)), heure_debut=heure(debut), heure_fin=heure(debut + 2)
+        )
+        db.session.add(cours)
+        db.session.flush()
+        promo = (filieres[i % len(filieres)].id, niveaux[0].id)
+        for g in par_promo[promo]:
+            db.session.add(CoursAffectation(cours_id=cours.id, groupe_id=g.id, filiere_id=g.filiere_id, niveau_id=g.niveau_id))
+    db.session.commit()
+    return lundi, filieres[0].id, niveaux[0].id
+
+
+def legacy_week_view(lundi, filiere_id, niveau_id):
+    """Accès aux données de l'ancienne version : objets ORM, jointure sans DISTINCT, relations paresseuses."""
+    query = Cours.query.filter(Cours.date_cours.between(lundi, lundi + timedelta(days=6)))
+    query = query.join(Cours.cours_affectations)
+    query = query.filter(CoursAffectation.filiere_id == filiere_id, CoursAffectation.niveau_id == niveau_id)
+    courses = query.order_by(Cours.heure_debut).all()
+    # Ce que le gabarit lisait pour chaque cours
+    rendu = [(c.heure_debut, c.matiere_obj.nom_matiere, c.enseignant_obj.prenom, c.enseignant_obj.nom, c.salle_obj.nom_salle) for c in courses]
+    filtres = (
+        Filiere.query.order_by(Filiere.nom_filiere).all(),
+        Niveau.query.order_by(Niveau.id).all(),
+        Utilisateur.query.filter_by(role='enseignant').order_by(Utilisateur.nom).all(),
+        Salle.query.order_by(Salle.nom_salle).all(),
+    )
+    return rendu, filtres
+
+
+def projected_week_view(lundi, filiere_id, niveau_id):
+    """Accès aux données de la nouvelle version."""
+    courses = week_courses(lundi, lundi + timedelta(days=6), filiere_id, niveau_id)
+    rendu = [(c.heure_debut, c.nom_matiere, c.enseignant_prenom, c.enseignant_nom, c.nom_salle) for c in courses]
+    return rendu, schedule_filters()
+
+
+def measure(fonction, repetitions, *args):
+    requetes = []
+    compteur = [0]
+
+    def compter(*_):
+        compteur[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', compter)
+    durees = []
+    try:
+        for _ in range(repetitions):
+            db.session.expunge_all() # Pas de carte d'identité chaude d'une répétition à l'autre
+            compteur[0] = 0
+            debut = time.perf_counter()
+            rendu, _ = fonction(*args)
+            durees.append((time.perf_counter() - debut) * 1000)
+            requetes.append(compteur[0])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', compter)
+    return len(rendu), requetes, durees
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cours', type=int, default=600)
+    parser.add_argument('--groupes', type=int, default=3, help="groupes affectés à chaque cours")
+    parser.add_argument('--repetitions', type=int, default=20)
+    args = parser.parse_args()
+
+    app, _ = create_app()
+    with app.app_context():
+        lundi, filiere_id, niveau_id = seed(args.cours, args.groupes)
+        print(f"{'version':>10} {'lignes':>7} {'requêtes (1re)':>15} {'requêtes (suiv.)':>17} {'médiane (ms)':>13}")
+        for nom, fonction in (('avant', legacy_week_view), ('après', projected_week_view)):
+            lignes, requetes, durees = measure(fonction, args.repetitions, lundi, filiere_id, niveau_id)
+            print(f"{nom:>10} {lignes:>7} {requetes[0]:>15} {requetes[-1]:>17} {statistics.median(durees):>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
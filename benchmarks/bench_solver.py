@@ -0,0 +1,88 @@
+# benchmarks/bench_solver.py
+# Benchmark du solveur d'emploi du temps sur des facultés synthétiques.
+#
+# Utilisation (depuis la racine du projet) :
+#   python -m benchmarks.bench_solver --groupes 60 --budget 10
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import date
+
+from app.solver import Besoin, JOURS, PAS_MINUTES, interval_to_mask, solve, solve_best, verify
+
+
+def synthetic_problem(nb_groupes=60, seances_par_groupe=8, nb_enseignants=None, nb_salles=None, seed=0):
+    """
+    Génère une faculté synthétique :
+    - des groupes de 20 à 60 étudiants répartis par filière/niveau (6 groupes par promotion) ;
+    - des enseignants habilités sur quelques matières, disponibles 4 jours sur 6 ;
+    - des salles de 25 à 200 places ;
+    - pour chaque groupe, `seances_par_groupe` séances de 1h30 à 3h.
+    """
+    rng = random.Random(seed)
+    nb_enseignants = nb_enseignants or max(10, nb_groupes)
+    nb_salles = nb_salles or max(8, nb_groupes // 2)
+    nb_matieres = max(12, nb_groupes // 2)
+
+    salles = sorted(((i, rng.choice([25, 30, 40, 40, 60, 60, 80, 120, 200])) for i in range(nb_salles)), key=lambda s: s[1])
+
+    habilitations = defaultdict(list)
+    for enseignant_id in range(nb_enseignants):
+        for matiere_id in rng.sample(range(nb_matieres), 3):
+            habilitations[matiere_id].append(enseignant_id)
+    for matiere_id in range(nb_matieres):
+        if not habilitations[matiere_id]:
+            habilitations[matiere_id].append(rng.randrange(nb_enseignants))
+
+    disponibilites = {}
+    for enseignant_id in range(nb_enseignants):
+        jours = {}
+        for jour in rng.sample(range(len(JOURS)), 4):
+            debut = rng.choice([7, 8, 8, 9]) * 60
+            fin = rng.choice([16, 17, 18, 19]) * 60
+            jours[jour] = interval_to_mask(debut, fin)
+        disponibilites[enseignant_id] = jours
+
+    besoins = []
+    for groupe_id in range(nb_groupes):
+        effectif = rng.randint(20, 60)
+        for matiere_id in rng.sample(range(nb_matieres), seances_par_groupe):
+            duree = rng.choice([90, 120, 120, 180]) // PAS_MINUTES
+            besoins.append(Besoin(len(besoins), groupe_id, matiere_id, duree, effectif, tuple(habilitations[matiere_id])))
+
+    return {
+        'lundi': date(2025, 1, 6),
+        'besoins': besoins,
+        'salles': salles,
+        'disponibilites': disponibilites,
+        'occupes': {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--groupes', type=int, nargs='+', default=[50, 80, 120])
+    parser.add_argument('--seances', type=int, default=8)
+    parser.add_argument('--budget', type=float, default=10.0)
+    parser.add_argument('--essais', type=int, default=2, help="résolutions parallèles dans le pool de processus")
+    args = parser.parse_args()
+
+    print(f"{'groupes':>8} {'séances':>8} {'placées':>8} {'impossibles':>11} {'itérations':>10} {'solveur (s)':>11} {'total (s)':>9} {'violations':>10}")
+    for nb_groupes in args.groupes:
+        probleme = synthetic_problem(nb_groupes, args.seances)
+        debut = time.perf_counter()
+        resultat = solve_best(probleme, args.budget, essais=args.essais)
+        total = time.perf_counter() - debut
+        violations = verify(probleme, resultat['placements'])
+        print(f"{nb_groupes:>8} {len(probleme['besoins']):>8} {len(resultat['placements']):>8} {len(resultat['impossibles']):>11} "
+              f"{resultat['iterations']:>10} {resultat['duree']:>11} {total:>9.2f} {len(violations):>10}")
+
+    # Référence : une résolution mono-processus sans parallélisme
+    probleme = synthetic_problem(args.groupes[0], args.seances)
+    resultat = solve(probleme, args.budget, seed=0)
+    print(f"\nmono-processus, {args.groupes[0]} groupes : {len(resultat['placements'])}/{len(probleme['besoins'])} séances en {resultat['duree']} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -127,4 +127,40 @@ CREATE TABLE notifications (
     CONSTRAINT fk_notification_utilisateur
         FOREIGN KEY (destinataire_id) REFERENCES utilisateurs(id)
         ON DELETE CASCADE -- Si l'utilisateur spécifique est supprimé, ses notifications sont supprimées
-);
\ No newline at end of file
+);
+
+-- =====================================================================
+-- INDEX AJOUTÉS PAR L'APPLICATION
+-- db.create_all() crée les index d'une table en même temps qu'elle, mais n'en ajoute jamais
+-- à une table qui existe déjà : sur une base créée par ce script ou par une version antérieure
+-- de l'application, ces instructions sont à exécuter une fois.
+-- MySQL n'a pas de CREATE INDEX IF NOT EXISTS : une instruction déjà appliquée échoue avec
+-- « Duplicate key name » et peut être ignorée.
+-- =====================================================================
+
+-- Vérification des conflits de cours par enseignant et par salle
+CREATE INDEX ix_cours_enseignant_date_debut ON cours (enseignant_id, date_cours, heure_debut);
+CREATE INDEX ix_cours_salle_date_debut ON cours (salle_id, date_cours, heure_debut);
+
+-- Occupation des salles par jour (recherche de salles libres)
+CREATE INDEX ix_cours_date_salle ON cours (date_cours, salle_id);
+
+-- Conflits de groupes : toutes les affectations d'une promotion
+CREATE INDEX ix_affectation_promo_groupe ON cours_affectations (filiere_id, niveau_id, groupe_id, cours_id);
+
+-- Emplois du temps paginés par curseur (ORDER BY date_cours, heure_debut, id) et public d'un cours
+CREATE INDEX ix_cours_date_debut_id ON cours (date_cours, heure_debut, id);
+CREATE INDEX ix_affectation_cours_groupe ON cours_affectations (cours_id, groupe_id, filiere_id, niveau_id);
+
+-- Notifications non lues et historique personnel ; historique des annonces par rôle
+CREATE INDEX ix_notifications_destinataire_lue_date ON notifications (destinataire_id, est_lue, date_creation);
+CREATE INDEX ix_notifications_role_date ON notifications (destinataire_role, date_creation);
+
+-- Historique paginé des conversations. La table messages n'est pas créée par ce script mais par l'application :
+-- sur une base où elle existe déjà sans cet index, exécuter une fois :
+-- CREATE INDEX ix_messages_conversation_timestamp_id ON messages (conversation_id, timestamp, id);
+
+-- Séries de cours : l'appartenance d'un cours à une série est dans la table series_occurrences (créée par
+-- l'application). Une base où cours a déjà reçu une colonne serie_id (version intermédiaire) peut y
+-- reporter ses séries une fois, la colonne restant ensuite inutilisée :
+-- INSERT INTO series_occurrences (cours_id, serie_id) SELECT id, serie_id FROM cours WHERE serie_id IS NOT NULL;
@@ -0,0 +1,13 @@
+# worker.py
+# Worker de la file de tâches de fond (app/jobs.py) : notifications des cours, e-mails, images,
+# génération automatique des emplois du temps.
+# À lancer à côté du serveur web (voir Procfile.txt) :
+#   python worker.py
+# Ses événements Socket.IO passent par le bus SOCKETIO_MESSAGE_QUEUE (le worker n'a pas de clients).
+from app import create_app
+from app.jobs import work
+
+app, _ = create_app(socketio_write_only=True)
+
+if __name__ == '__main__':
+    work(app)